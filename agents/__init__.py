@@ -0,0 +1,36 @@
+"""
+Lazy agent registry.
+
+Each agent module builds its clients (LLM, Serper, MCP) when it is imported,
+so the orchestrator never imports them up front: a branch's module loads the
+first time that branch runs, or earlier via `warm()` once the server is up.
+"""
+import importlib, sys, time
+
+MODULES = {
+    "budget_insights": "agents.budget_recommender_agent",
+    "web_search":      "agents.web_search_agent",
+    "generic":         "agents.generic_bot",
+}
+
+
+def get(branch: str):
+    """The agent module for `branch`, imported on first use."""
+    return importlib.import_module(MODULES[branch])
+
+
+def loaded(branch: str):
+    """The agent module if it has been imported already, else None."""
+    return sys.modules.get(MODULES[branch])
+
+
+def warm(branches=None) -> dict:
+    """Import agents and build their clients ahead of traffic → seconds per branch."""
+    took = {}
+    for branch in branches or MODULES:
+        t0 = time.perf_counter()
+        mod = get(branch)
+        if callable(getattr(mod, "warm", None)):
+            mod.warm()
+        took[branch] = round(time.perf_counter() - t0, 3)
+    return took
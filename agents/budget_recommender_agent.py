@@ -4,65 +4,79 @@ Snowflake and (2) write the proposed split back when the user is happy and says
 'apply' / 'commit'.
 """
 
-from langchain_core.prompts import PromptTemplate
-from utils import init_llm, extract_day
-from langchain_community.utilities.sql_database import SQLDatabase
+import asyncio, contextvars, json, os, re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils import init_llm, extract_day, extract_range
+import day_parser
+import telemetry
 from dotenv import load_dotenv
 
-from langchain.tools import tool
-from langchain_openai import ChatOpenAI
+from langchain_core.tools import StructuredTool
 from langchain.agents import create_openai_functions_agent, AgentExecutor
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from memory import history 
+from langchain_core.messages import AIMessage, FunctionMessage
+from memory import sessions, after_turn, aafter_turn, DEFAULT_SESSION
 
-import httpx
+import mcp_client
+from cache import TTLCache
+from tools.metrics import render_compact, render_trend
+from tools.schemas import ProposalRow
+from pydantic import BaseModel, Field
 
-# new
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain.memory import ConversationBufferMemory
 
 #from langchain_openai.agents import create_openai_mcp_agent
 
 load_dotenv()
 
-# 0️⃣  Reuse the shared message history object
-shared_chat_history = ChatMessageHistory(messages=history)
-
 # ───────────────────────────────────────────────────────────
-#  A)  ONE memory object seen by every agent  (shared)
-shared_memory = ConversationBufferMemory(
-    chat_memory=shared_chat_history,          # <— same underlying list
-    memory_key="chat_history",
-    return_messages=True,
-    input_key="input",        # 👈  ignore `date_hint`
-    output_key="output",      # default in AgentExecutor
-)
+#  A)  One memory object per session, backed by that session's
+#      token-bounded history in memory.sessions
+def session_memory(session_id: str) -> ConversationBufferMemory:
+    return ConversationBufferMemory(
+        chat_memory=sessions.get(session_id),
+        memory_key="chat_history",
+        return_messages=True,
+        input_key="input",        # 👈  ignore `date_hint`
+        output_key="output",      # default in AgentExecutor
+    )
 # ───────────────────────────────────────────────────────────
 
 
 # ── LLM & prompt ────────────────────────────────────────────────────
-MEMORY = shared_memory
-
 SYSTEM_PROMPT = """
 You are a paid-media analyst.
 
-You have access to two tools:
-• `get_budget(day: str)`: pull channel metrics for the given date.
-• `save_proposal(table_markdown: str)`: save a proposed budget split.
+You have access to five tools:
+• `get_budget(day: str)`: pull channel metrics for the given date, as a
+  pipe-separated table (channel|spend|clicks|sales|roas|cpc plus a TOTAL row).
+• `get_metrics_range(start: str, end: str, channels: list = [])`: the same
+  table summed over a date range (trailing 7 / 30 days, last week, …).
+• `get_metric_trend(start: str, end: str, metric: str = "roas", grain: str = "day")`:
+  spend / clicks / sales / roas / cpc per channel per day or week, with the
+  change of the last period vs the one before (week-over-week deltas).
+• `propose_budget(day: str, total_shift: float = 0)`: compute the re-allocated
+  split for the given date. Returns the finished Markdown table with an empty
+  brief_rationale column. `total_shift` is the requested change of the total
+  (e.g. 0.03 for +3 %), capped at ± 5 %.
+• `save_proposal(budget_date: str, rows: list)`: save a proposed budget split.
 
 Your instructions: are:
 • Use `get_budget` to pull metrics for the requested day
   (default to the date_hint if provided).
-• Re-allocate the given date's spend so total budget stays within ± 5 % of the current total. Analyse the data and reply with **only** a Markdown table:
+• For a new split call `propose_budget` – **never** do the arithmetic yourself.
+  Keep every number exactly as returned, only fill in `brief_rationale`
+  (a few words, based on the metrics) and reply with **only** that table:
   | channel | current_spend | proposed_spend | Δ% | brief_rationale |
 • Ask the user if they're happy with the new proposed budget, and wait for the user to say “apply” / “commit” or any other form of agreement.
-  Then call `save_proposal` with the same table.
+  Then call `save_proposal` with the rows of that same table.
 • After saving, respond: “✅ New budget split stored." **Do not call any tool again in the same turn.**
 
 • When you call `save_proposal`, pass both:
     • `budget_date` – the date you fetched
-    • `table_markdown` – the Markdown table you proposed
+    • `rows` – one object per channel of the table you proposed:
+      {channel, current_spend, proposed_spend, rationale} (numbers, not strings)
 """
 
 prompt = ChatPromptTemplate.from_messages(
@@ -70,59 +84,305 @@ prompt = ChatPromptTemplate.from_messages(
         ("system", SYSTEM_PROMPT.strip()),
         # Pass the hint as an extra system message
         ("system", "Date hint: {date_hint}"),
-        MessagesPlaceholder("chat_history"),      # ← will be filled from MEMORY
+        MessagesPlaceholder("chat_history"),      # ← filled from the session memory
         ("user", "{input}"),
+        # get_budget call + result, when the speculative prefetch beat the model
+        MessagesPlaceholder("prefetched", optional=True),
         # <assistant scratchpad> for function calls & responses
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ]
 )
 
-MCP_BASE = "http://localhost:9000/mcp"
-
-
-@tool
-def get_budget(day: str) -> str:
-    """Return channel metrics for the given ISO date (YYYY-MM-DD)."""
-    r = httpx.post(f"{MCP_BASE}/get_budget/invoke",
-                   json={"arguments": {"day": day}},
-                   timeout=15)
-    r.raise_for_status()
-    return r.json()["result"]
-
-@tool
-def save_proposal(budget_date: str, table_markdown: str) -> str:
-    """Persist a proposed budget split."""
-    r = httpx.post(
-        f"{MCP_BASE}/save_proposal/invoke",
-        json={"arguments": {
-            "budget_date": budget_date,
-            "table_markdown": table_markdown,
-        }},
-        timeout=15,
-    )
-    r.raise_for_status()
-    return r.json()["result"]
+# pooled, retrying client shared by every tool call in this process
+mcp = mcp_client.client
+
+
+# the hub returns a columnar payload; the model only sees the compact
+# rendering, kept for BUDGET_TABLE_TTL seconds so a repeat day needs no hop
+_tables = TTLCache(max_entries=256, max_bytes=4 * 1024 * 1024,
+                   default_ttl=float(os.getenv("BUDGET_TABLE_TTL", 60)))
+
+def _fetch_budget(day: str) -> str:
+    table = _tables.get(day)
+    if table is None:
+        table = render_compact(mcp.invoke("get_budget", {"day": day}))
+        _tables.set(day, table)
+    return table
+
+async def _afetch_budget(day: str) -> str:
+    table = _tables.get(day)
+    if table is None:
+        table = render_compact(await mcp.ainvoke("get_budget", {"day": day}))
+        _tables.set(day, table)
+    return table
+
+
+# ── Speculative prefetch ─────────────────────────────────────────────
+# The day is known before the agent starts.  A table still in `_tables` goes
+# straight into the prompt; otherwise the fetch starts right away and gets
+# PREFETCH_WAIT to finish.  Either way the get_budget call + result are in the
+# prompt and the model skips that round trip.  A slower fetch carries on in
+# parallel with the first model step, and a get_budget(day) tool call awaits it.
+PREFETCH = os.getenv("BUDGET_PREFETCH", "1") == "1"
+PREFETCH_WAIT = float(os.getenv("BUDGET_PREFETCH_WAIT", "0.05"))   # seconds
+# confirmation turns go straight to save_proposal
+_CONFIRM = re.compile(r"\b(?:apply|commit|save|go ahead|looks good|approve)\b", re.I)
+
+PREFETCHES = telemetry.registry.counter(
+    "budget_prefetch_total", "Speculative get_budget fetches by outcome "
+    "(injected / awaited / unused / failed)", ("outcome",))
+
+# this turn's prefetch: [day, Future | Task, used]
+_prefetch: contextvars.ContextVar = contextvars.ContextVar("budget_prefetch", default=None)
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="budget-prefetch")
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
+def _prefetch_day(question: str) -> str | None:
+    if not PREFETCH or _CONFIRM.search(question):
+        return None
+    return extract_day(question)
 
-functions_agent = create_openai_functions_agent(
-    llm=llm,
-    tools=[get_budget, save_proposal],
-    prompt=prompt,
+def _injected(day: str, table: str) -> list:
+    """What the scratchpad would hold after the model called get_budget(day)."""
+    return [
+        AIMessage(content="", additional_kwargs={"function_call": {
+            "name": "get_budget", "arguments": json.dumps({"day": day})}}),
+        FunctionMessage(name="get_budget", content=table),
+    ]
+
+def _get_budget(day: str) -> str:
+    pending = _prefetch.get()
+    if pending and pending[0] == day:
+        try:
+            table = pending[1].result()
+            pending[2] = True
+            PREFETCHES.inc(outcome="awaited")
+            return table
+        except Exception:
+            pass                    # counted as failed at the end of the turn; refetch
+    return _fetch_budget(day)
+
+async def _aget_budget(day: str) -> str:
+    pending = _prefetch.get()
+    if pending and pending[0] == day:
+        try:
+            table = await asyncio.shield(pending[1])
+            pending[2] = True
+            PREFETCHES.inc(outcome="awaited")
+            return table
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+    return await _afetch_budget(day)
+
+def _settle_prefetch(pending: list) -> None:
+    _day, fut, used = pending
+    if not fut.done():
+        fut.cancel()
+        PREFETCHES.inc(outcome="unused")
+    elif not fut.cancelled() and fut.exception() is not None:
+        PREFETCHES.inc(outcome="failed")
+    elif not used:
+        PREFETCHES.inc(outcome="unused")
+
+class SaveProposalArgs(BaseModel):
+    budget_date: str = Field(description="ISO date (YYYY-MM-DD) the proposal is for")
+    rows: List[ProposalRow]
+
+def _row_dicts(rows: list) -> list[dict]:
+    # depending on the langchain version rows arrive as models or plain dicts
+    return [r.dict() if isinstance(r, BaseModel) else dict(r) for r in rows]
+
+def _save_proposal(budget_date: str, rows: List[ProposalRow]) -> str:
+    return mcp.invoke("save_proposal", {
+        "budget_date": budget_date,
+        "rows": _row_dicts(rows),
+    })
+
+async def _asave_proposal(budget_date: str, rows: List[ProposalRow]) -> str:
+    return await mcp.ainvoke("save_proposal", {
+        "budget_date": budget_date,
+        "rows": _row_dicts(rows),
+    })
+
+# sync `func` serves executor.invoke, `coroutine` serves executor.ainvoke
+get_budget = StructuredTool.from_function(
+    func=_get_budget,
+    coroutine=_aget_budget,
+    name="get_budget",
+    description="Return channel metrics for the given ISO date (YYYY-MM-DD).",
 )
 
-executor = AgentExecutor(
-    agent=functions_agent,
-    tools=[get_budget, save_proposal],
-    memory=MEMORY,            # ← plug the chosen memory here
-    verbose=True,
+def _propose_budget(day: str, total_shift: float = 0.0) -> str:
+    return mcp.invoke("propose_budget", {"day": day, "total_shift": total_shift})["table_markdown"]
+
+async def _apropose_budget(day: str, total_shift: float = 0.0) -> str:
+    result = await mcp.ainvoke("propose_budget", {"day": day, "total_shift": total_shift})
+    return result["table_markdown"]
+
+propose_budget = StructuredTool.from_function(
+    func=_propose_budget,
+    coroutine=_apropose_budget,
+    name="propose_budget",
+    description="Compute a re-allocated budget split for the given ISO date "
+                "(total kept within ±5 %). Returns a Markdown table.",
 )
 
+save_proposal = StructuredTool.from_function(
+    func=_save_proposal,
+    coroutine=_asave_proposal,
+    name="save_proposal",
+    description="Persist a proposed budget split (one row per channel).",
+    args_schema=SaveProposalArgs,
+)
 
-# ── Public entry point used by the orchestrator ────────────────────
-def run(question: str) -> str:
+def _metrics_range(start: str, end: str, channels: Optional[List[str]] = None) -> str:
+    return render_compact(mcp.invoke("metrics_range",
+                                     {"start": start, "end": end, "channels": channels or []}))
+
+async def _ametrics_range(start: str, end: str, channels: Optional[List[str]] = None) -> str:
+    return render_compact(await mcp.ainvoke(
+        "metrics_range", {"start": start, "end": end, "channels": channels or []}))
+
+get_metrics_range = StructuredTool.from_function(
+    func=_metrics_range,
+    coroutine=_ametrics_range,
+    name="get_metrics_range",
+    description="Channel metrics summed over an inclusive ISO date range "
+                "(optionally only some channels).",
+)
+
+def _trend_args(start, end, metric, grain, channels) -> dict:
+    return {"start": start, "end": end, "metric": metric, "grain": grain,
+            "channels": channels or []}
+
+def _metric_trend(start: str, end: str, metric: str = "roas", grain: str = "day",
+                  channels: Optional[List[str]] = None) -> str:
+    return render_trend(mcp.invoke("metrics_trend", _trend_args(start, end, metric, grain, channels)))
+
+async def _ametric_trend(start: str, end: str, metric: str = "roas", grain: str = "day",
+                         channels: Optional[List[str]] = None) -> str:
+    return render_trend(await mcp.ainvoke("metrics_trend",
+                                          _trend_args(start, end, metric, grain, channels)))
+
+get_metric_trend = StructuredTool.from_function(
+    func=_metric_trend,
+    coroutine=_ametric_trend,
+    name="get_metric_trend",
+    description="Per-channel series of spend/clicks/sales/roas/cpc by day or week "
+                "over an ISO date range, with the last period's % change.",
+)
+
+TOOLS = [get_budget, propose_budget, save_proposal, get_metrics_range, get_metric_trend]
+
+# pinned independently of OPENAI_MODEL_NAME: the tool-calling loop was tuned on gpt-4o
+BUDGET_MODEL = os.getenv("BUDGET_MODEL_NAME", "gpt-4o")
+_functions_agent = None
+
+def functions_agent():
+    """The function-calling agent runnable, built on first use."""
+    global _functions_agent
+    if _functions_agent is None:
+        _functions_agent = create_openai_functions_agent(
+            llm=init_llm(temperature=0, streaming=False, agent="budget", model=BUDGET_MODEL),
+            tools=TOOLS,
+            prompt=prompt,
+        )
+    return _functions_agent
+
+def warm() -> None:
+    functions_agent()
+    day_parser.preload()        # dateparser + its language data, for the fallback path
+
+def executor_for(session_id: str) -> AgentExecutor:
+    # cheap wrapper: the agent runnable is shared, only the memory differs
+    return AgentExecutor(
+        agent=functions_agent(),
+        tools=TOOLS,
+        memory=session_memory(session_id),   # ← this session's memory
+        verbose=True,
+    )
+
+
+def date_hint(question: str, span: tuple[str, str] | None = None) -> str:
+    """`span`: extract_range(question) when the caller already has it."""
+    span = span or extract_range(question)
+    if span and span[0] != span[1]:
+        return f"{span[1]} (the question covers {span[0]} to {span[1]})"
+    return extract_day(question)
+
+
+def _inputs(question: str, day: str | None, table: str | None) -> dict:
     # Provide a hint so the model doesn’t have to parse the date itself
-    day = extract_day(question)
-    resp: Dict = executor.invoke({"input": question, "date_hint": day})
+    with telemetry.span("extract_day"):
+        span = extract_range(question)
+        inputs = {"input": question, "date_hint": date_hint(question, span)}
+    if table is not None and (span is None or span[0] == span[1]):
+        inputs["prefetched"] = _injected(day, table)
+        PREFETCHES.inc(outcome="injected")
+    return inputs
+
+def _ready(fut) -> str | None:
+    if fut.done() and not fut.cancelled() and fut.exception() is None:
+        return fut.result()
+    return None
+
+def _prepare(question: str) -> tuple[dict, list | None]:
+    """Prompt inputs, plus the turn's pending prefetch [day, Future, used] (or None)."""
+    day = _prefetch_day(question)
+    table = _tables.get(day) if day else None
+    if table is not None or not day:
+        return _inputs(question, day, table), None
+    ctx = contextvars.copy_context()              # trace id + deadline for the hub call
+    fut = _prefetch_pool.submit(ctx.run, _fetch_budget, day)
+    if not fut.done():
+        try:
+            fut.exception(timeout=PREFETCH_WAIT)
+        except FutureTimeout:
+            pass
+    inputs = _inputs(question, day, _ready(fut))
+    return inputs, [day, fut, "prefetched" in inputs]
+
+async def _aprepare(question: str) -> tuple[dict, list | None]:
+    """`_prepare` for arun: the fetch is a task on the running loop."""
+    day = _prefetch_day(question)
+    table = _tables.get(day) if day else None
+    if table is not None or not day:
+        return _inputs(question, day, table), None
+    task = asyncio.ensure_future(_afetch_budget(day))
+    try:
+        if not task.done():
+            await asyncio.wait([task], timeout=PREFETCH_WAIT)
+        inputs = _inputs(question, day, _ready(task))
+    except BaseException:
+        task.cancel()
+        raise
+    return inputs, [day, task, "prefetched" in inputs]
+
+
+# ── Public entry point used by the orchestrator ────────────────────
+def run(question: str, session_id: str = DEFAULT_SESSION) -> str:
+    inputs, pending = _prepare(question)
+    token = _prefetch.set(pending)
+    try:
+        with telemetry.span("agent_executor"):
+            resp: Dict = executor_for(session_id).invoke(inputs)
+    finally:
+        _prefetch.reset(token)
+        if pending:
+            _settle_prefetch(pending)
+    after_turn(session_id)
     return resp["output"]
 
+async def arun(question: str, session_id: str = DEFAULT_SESSION) -> str:
+    inputs, pending = await _aprepare(question)
+    token = _prefetch.set(pending)
+    try:
+        with telemetry.span("agent_executor"):
+            resp: Dict = await executor_for(session_id).ainvoke(inputs)
+    finally:
+        _prefetch.reset(token)
+        if pending:
+            _settle_prefetch(pending)
+    await aafter_turn(session_id)
+    return resp["output"]
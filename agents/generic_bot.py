@@ -1,9 +1,9 @@
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from utils import init_llm
-from memory import history, HumanMessage, AIMessage
+from memory import sessions, after_turn, aafter_turn, DEFAULT_SESSION, HumanMessage, AIMessage
 
-llm = init_llm()
+llm = init_llm(agent="generic")
 
 CAPABILITIES = """
 I can also hand off your request to specialist agents if you ask for:
@@ -23,14 +23,27 @@ SYSTEM_PROMPT = (
 
 prompt_tmpl  = PromptTemplate.from_template(SYSTEM_PROMPT)
 
-def run(question: str) -> str:
-    # ① build the history text shown to the model
-    hist_txt = "\n".join(m.content for m in history)
-
-    ai_msg = (prompt_tmpl  | llm).invoke({"q": question, "history": hist_txt})
-    
-    # ➜ push the new turn into history
-    history.append(HumanMessage(content=question))
-    history.append(AIMessage(content=ai_msg.content))
-
-    return ai_msg.content
\ No newline at end of file
+def _history_text(session_id: str) -> str:
+    # ① build the history text shown to the model (this session only)
+    return "\n".join(
+        f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+        for m in sessions.get(session_id).messages
+    )
+
+def _remember(session_id: str, question: str, answer: str) -> None:
+    # ➜ push the new turn into this session's history
+    hist = sessions.get(session_id)
+    hist.add_message(HumanMessage(content=question))
+    hist.add_message(AIMessage(content=answer))
+
+def run(question: str, session_id: str = DEFAULT_SESSION) -> str:
+    ai_msg = (prompt_tmpl  | llm).invoke({"q": question, "history": _history_text(session_id)})
+    _remember(session_id, question, ai_msg.content)
+    after_turn(session_id)
+    return ai_msg.content
+
+async def arun(question: str, session_id: str = DEFAULT_SESSION) -> str:
+    ai_msg = await (prompt_tmpl | llm).ainvoke({"q": question, "history": _history_text(session_id)})
+    _remember(session_id, question, ai_msg.content)
+    await aafter_turn(session_id)
+    return ai_msg.content
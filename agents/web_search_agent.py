@@ -1,25 +1,165 @@
 from dotenv import load_dotenv
 load_dotenv()  # make sure SERPER_API_KEY is in your env
 
-# 1. Import the new API wrapper and tool
-from langchain_community.utilities.google_serper import GoogleSerperAPIWrapper
-from langchain_community.tools.google_serper.tool import GoogleSerperRun
+import asyncio, hashlib, os, re, threading
 
 from langchain_core.prompts import PromptTemplate
 from utils import init_llm
+from cache import PersistentCache
+import bulkhead
+import telemetry
 
-# 2. Instantiate Serper with the working pattern
-api_wrapper = GoogleSerperAPIWrapper()           # reads SERPER_API_KEY
-search = GoogleSerperRun(api_wrapper=api_wrapper)
+# 1.–2. Serper tool, built on first use (bench/ swaps in a stand-in)
+search = None
+
+def _search_tool():
+    global search
+    if search is None:
+        from langchain_community.utilities.google_serper import GoogleSerperAPIWrapper
+        from langchain_community.tools.google_serper.tool import GoogleSerperRun
+        search = GoogleSerperRun(api_wrapper=GoogleSerperAPIWrapper())   # reads SERPER_API_KEY
+    return search
+
+def warm() -> None:
+    _search_tool()
 
 # 3. LLM and prompt setup
-llm = init_llm()
+llm = init_llm(agent="web_search")
 
 SUMMARY_PROMPT = PromptTemplate.from_template(
     "Summarise these search snippets in 3–4 bullet points, marketing-focused:\n\n{snips}"
 )
 
+# 4. Two-level cache, shared by every session (and every worker via SQLite)
+#    L1: normalised query → raw Serper snippets
+#    L2: hash(snippets)   → summary   (a refreshed search with the same
+#                                      snippets reuses the old summary)
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/web_search.sqlite")
+
+snippet_cache = PersistentCache(
+    CACHE_PATH, "snippets",
+    ttl=float(os.getenv("SEARCH_SNIPPET_TTL", 6 * 3600)),
+    stale_ttl=float(os.getenv("SEARCH_SNIPPET_STALE_TTL", 48 * 3600)),
+    max_rows=int(os.getenv("SEARCH_CACHE_MAX_ROWS", 20_000)),
+)
+summary_cache = PersistentCache(
+    CACHE_PATH, "summaries",
+    ttl=float(os.getenv("SEARCH_SUMMARY_TTL", 7 * 24 * 3600)),
+    max_rows=int(os.getenv("SEARCH_CACHE_MAX_ROWS", 20_000)),
+)
+
+_refreshing: set = set()       # keys with a background refresh in flight
+_refresh_lock = threading.Lock()
+_bg_tasks: set = set()         # strong refs so pending refresh tasks aren't GC'd
+
+
+def _query_key(question: str) -> str:
+    q = re.sub(r"\s+", " ", question.lower()).strip()
+    return q.rstrip("?!. ")
+
+def _snippet_key(snippets: str) -> str:
+    return hashlib.sha256(snippets.encode()).hexdigest()
+
+def _claim_refresh(key: str) -> bool:
+    with _refresh_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+def _release_refresh(key: str) -> None:
+    with _refresh_lock:
+        _refreshing.discard(key)
+
+
+# ── sync path (main.py REPL) ────────────────────────────────────────
+def _search(question: str) -> str:
+    with bulkhead.get("serper").sync_slot():
+        snippets = _search_tool().run(question)[:1500]   # keep under token limit
+    snippet_cache.set(_query_key(question), snippets)
+    return snippets
+
+def _refresh(key: str, question: str) -> None:
+    try:
+        _search(question)
+    except Exception as e:
+        print(f"[web_search] background refresh failed: {e}")
+    finally:
+        _release_refresh(key)
+
+def _snippets(question: str) -> str:
+    snippets = _cached_snippets(question)
+    telemetry.record_event("search", query=question, snippets=snippets)
+    return snippets
+
+def _cached_snippets(question: str) -> str:
+    key = _query_key(question)
+    hit = snippet_cache.get(key)
+    if hit is None:
+        return _search(question)
+    snippets, fresh = hit
+    if not fresh and _claim_refresh(key):
+        # serve stale now, refresh off the caller's path
+        threading.Thread(target=_refresh, args=(key, question), daemon=True).start()
+    return snippets
+
+def _summarise(snippets: str) -> str:
+    key = _snippet_key(snippets)
+    hit = summary_cache.get(key)
+    if hit is not None:
+        return hit[0]
+    summary = (SUMMARY_PROMPT | llm).invoke({"snips": snippets}).content
+    summary_cache.set(key, summary)
+    return summary
+
 def run(question: str) -> str:
-    # 4. Do your lookup, truncate, then summarise
-    snippets = search.run(question)[:1500]   # keep under token limit
-    return (SUMMARY_PROMPT | llm).invoke({"snips": snippets}).content
+    return _summarise(_snippets(question))
+
+
+# ── async path (server.py) ──────────────────────────────────────────
+async def _asearch(question: str) -> str:
+    async with bulkhead.get("serper").slot():
+        snippets = (await _search_tool().arun(question))[:1500]
+    await snippet_cache.aset(_query_key(question), snippets)
+    return snippets
+
+async def _arefresh(key: str, question: str) -> None:
+    try:
+        await _asearch(question)
+    except Exception as e:
+        print(f"[web_search] background refresh failed: {e}")
+    finally:
+        _release_refresh(key)
+
+async def _asnippets(question: str) -> str:
+    snippets = await _acached_snippets(question)
+    telemetry.record_event("search", query=question, snippets=snippets)
+    return snippets
+
+async def _acached_snippets(question: str) -> str:
+    key = _query_key(question)
+    hit = await snippet_cache.aget(key)
+    if hit is None:
+        return await _asearch(question)
+    snippets, fresh = hit
+    if not fresh and _claim_refresh(key):
+        task = asyncio.get_running_loop().create_task(_arefresh(key, question))
+        _bg_tasks.add(task)
+        task.add_done_callback(_bg_tasks.discard)
+    return snippets
+
+async def _asummarise(snippets: str) -> str:
+    key = _snippet_key(snippets)
+    hit = await summary_cache.aget(key)
+    if hit is not None:
+        return hit[0]
+    summary = (await (SUMMARY_PROMPT | llm).ainvoke({"snips": snippets})).content
+    await summary_cache.aset(key, summary)
+    return summary
+
+async def arun(question: str) -> str:
+    return await _asummarise(await _asnippets(question))
+
+
+def stats() -> dict:
+    return {"snippets": snippet_cache.stats(), "summaries": summary_cache.stats()}
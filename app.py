@@ -1,31 +1,71 @@
 # app.py
-import streamlit as st, requests, uuid
+import streamlit as st, requests, uuid, json
 
 BACKEND = "http://localhost:8000/chat"
+STREAM  = BACKEND + "/stream"
 if "sid" not in st.session_state:
     st.session_state.sid = str(uuid.uuid4())
 
 st.title("📊 Campaign-Budget Assistant")
 
+
+def sse_events(resp):
+    """Yield (event, data) pairs from a text/event-stream response."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":                      # blank line terminates an event
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+
 user_in = st.chat_input("Ask me anything about spend, ROAS, …")
 if user_in:
     st.chat_message("user").write(user_in)
 
-    print("POSTing to", BACKEND)
-    resp = requests.post(
-        BACKEND,
-        json={"session_id": st.session_state.sid, "message": user_in},
-        timeout=60,
-    )
-    print(resp.status_code, resp.text)   # keep for debugging
-
-    try:
-        data = resp.json()               # <-- keep this
-    except ValueError:
-        st.error("Backend did not return JSON")
-        st.stop()
-
-    if "reply" not in data:
-        st.error(f"Backend error: {data}")
-    else:
-        st.chat_message("assistant").write(data["reply"])
+    print("POSTing to", STREAM)
+    with st.chat_message("assistant"):
+        status = st.empty()                 # routing / tool progress
+        body   = st.empty()                 # answer, token by token
+        text   = ""
+        try:
+            with requests.post(
+                STREAM,
+                json={"session_id": st.session_state.sid, "message": user_in},
+                stream=True,
+                timeout=(5, 120),           # connect, per-read
+            ) as resp:
+                if resp.status_code != 200:
+                    st.error(f"Backend error: {resp.status_code} {resp.text}")
+                    st.stop()
+
+                for event, data in sse_events(resp):
+                    if event == "route":
+                        status.caption(f"↪ {data['branch']}")
+                    elif event == "tool_start":
+                        status.caption(f"🔧 {data['tool']} …")
+                    elif event == "tool_end":
+                        status.caption(f"✔ {data['tool']}")
+                    elif event == "token":
+                        text += data["text"]
+                        body.markdown(text + "▌")
+                    elif event == "error":
+                        st.error(f"Backend error: {data['detail']}")
+                        st.stop()
+                    elif event == "done":
+                        text = data.get("reply") or text
+                        status.caption(
+                            f"↪ {data['branch']} · first token {data['ttft_ms']} ms"
+                            f" · total {data['total_ms']} ms"
+                        )
+        except requests.RequestException as e:
+            st.error(f"Backend unreachable: {e}")
+            st.stop()
+
+        body.markdown(text)
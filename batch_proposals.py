@@ -0,0 +1,192 @@
+# batch_proposals.py
+"""
+Nightly / backfill batch: budget proposals for every day of a date range,
+written straight to PROPOSED_BUDGETS without going through the chat agent.
+
+    reader thread   METRICS in range-sized queries (--chunk-days per query)
+    worker pool     tools.budget_optimizer.propose per day (--workers,
+                    --executor thread|process)
+    writer          the proposal table → parse_proposal_table → batched
+                    insert_proposal_rows (--batch-rows per executemany)
+
+Finished days are appended to a checkpoint file after each insert, so an
+interrupted run picks up where it stopped.  Each line carries the run's
+parameters (--total-shift): a rerun with other parameters redoes every day.
+Delivery is at-least-once per insert batch: a crash between the insert and
+the checkpoint line re-writes that batch on resume.  --dry-run neither reads
+nor writes the checkpoint.
+
+    python batch_proposals.py --start 2025-01-01 --end 2025-06-30 --workers 8
+    python batch_proposals.py --range "last month" --executor process
+"""
+import argparse, os, queue, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import repeat
+
+from tools.budget_optimizer import propose
+
+CHECKPOINT_PATH = os.getenv("BATCH_CHECKPOINT", ".cache/batch_proposals.done")
+RATIONALE = "batch: ROAS-weighted reallocation"
+
+
+def run_key(total_shift: float) -> str:
+    return f"total_shift={total_shift:g}"
+
+
+# ── checkpoint: "<ISO day>\t<run key>" per finished day ───────────────
+class Checkpoint:
+    def __init__(self, path: str, key: str = run_key(0.0)):
+        self.path, self.key = path, key
+        self.done: set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    day, _, line_key = line.strip().partition("\t")
+                    # lines without a key predate it: default parameters
+                    if day and (line_key or run_key(0.0)) == key:
+                        self.done.add(day)
+
+    def mark(self, days) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.writelines(f"{d}\t{self.key}\n" for d in days)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.done.update(days)
+
+
+# ── pipeline stages ──────────────────────────────────────────────────
+def _chunks(start: date, end: date, chunk_days: int):
+    while start <= end:
+        stop = min(end, start + timedelta(days=chunk_days - 1))
+        yield start, stop
+        start = stop + timedelta(days=1)
+
+def _read(start: date, end: date, chunk_days: int, out: queue.Queue, stats: dict) -> None:
+    """Reader thread: METRICS chunk by chunk, at most two chunks ahead."""
+    from tools.budget_db import fetch_budget_range
+    try:
+        for lo, hi in _chunks(start, end, chunk_days):
+            t0 = time.perf_counter()
+            payloads = fetch_budget_range(lo.isoformat(), hi.isoformat())
+            stats["fetch_s"] += time.perf_counter() - t0
+            stats["queries"] += 1
+            out.put(payloads)
+    except BaseException as e:
+        out.put(e)
+        return
+    out.put(None)
+
+def propose_day(payload: dict, total_shift: float) -> tuple[str, str]:
+    """Worker: (day, proposal table) – top level so process pools can pickle it."""
+    return payload["day"], propose(payload, total_shift=total_shift)["table_markdown"]
+
+
+def run(start: date, end: date, *, workers: int = 4, executor: str = "thread",
+        chunk_days: int = 31, batch_rows: int = 5000, total_shift: float = 0.0,
+        checkpoint: str = CHECKPOINT_PATH, dry_run: bool = False) -> dict:
+    from tools.budget_db import parse_proposal_table, insert_proposal_rows, _with_date
+
+    # a dry run writes nothing, so it must neither skip nor mark days
+    ckpt = Checkpoint(os.devnull if dry_run else checkpoint, run_key(total_shift))
+    stats = {"days": 0, "skipped": 0, "rows": 0, "queries": 0, "inserts": 0,
+             "fetch_s": 0.0, "compute_s": 0.0, "write_s": 0.0}
+    chunks: queue.Queue = queue.Queue(maxsize=2)
+    reader = threading.Thread(target=_read, args=(start, end, chunk_days, chunks, stats),
+                              name="batch-reader", daemon=True)
+    pending_rows: list[dict] = []
+    pending_days: list[str] = []
+
+    def flush() -> None:
+        if not pending_days:
+            return
+        t0 = time.perf_counter()
+        if not dry_run:
+            insert_proposal_rows(pending_rows)      # one executemany, one commit
+            stats["inserts"] += 1
+            ckpt.mark(pending_days)
+        stats["write_s"] += time.perf_counter() - t0
+        stats["rows"] += len(pending_rows)
+        pending_rows.clear()
+        pending_days.clear()
+
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    t_start = time.perf_counter()
+    reader.start()
+    with pool_cls(max_workers=workers) as pool:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                flush()                         # keep what is done before failing
+                raise item
+            todo = [p for d, p in sorted(item.items()) if d not in ckpt.done]
+            stats["skipped"] += len(item) - len(todo)
+
+            t0 = time.perf_counter()
+            chunksize = max(1, len(todo) // (workers * 4)) if executor == "process" else 1
+            for day, table in pool.map(propose_day, todo, repeat(total_shift), chunksize=chunksize):
+                rows = parse_proposal_table(table)
+                for r in rows:
+                    r["rationale"] = RATIONALE
+                pending_rows.extend(_with_date(day, rows))
+                pending_days.append(day)
+                stats["days"] += 1
+                if len(pending_rows) >= batch_rows:
+                    stats["compute_s"] += time.perf_counter() - t0
+                    flush()
+                    t0 = time.perf_counter()
+            stats["compute_s"] += time.perf_counter() - t0
+        flush()
+    reader.join()
+
+    wall = time.perf_counter() - t_start
+    stats["wall_s"] = wall
+    stats["days_per_s"] = stats["days"] / wall if wall else 0.0
+    stats["rows_per_s"] = stats["rows"] / wall if wall else 0.0
+    return stats
+
+
+def _date_span(opts) -> tuple[date, date]:
+    if opts.range:
+        import day_parser
+        span = day_parser.parse_range(opts.range)
+        if span is None:
+            raise SystemExit(f"can't read a date range from {opts.range!r}")
+        return span.start, span.end
+    if not (opts.start and opts.end):
+        raise SystemExit("give --start and --end, or --range")
+    return date.fromisoformat(opts.start), date.fromisoformat(opts.end)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Generate budget proposals for a date range")
+    ap.add_argument("--start", help="first day, YYYY-MM-DD")
+    ap.add_argument("--end", help="last day, YYYY-MM-DD (inclusive)")
+    ap.add_argument("--range", help='instead of --start/--end, e.g. "last month"')
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--executor", choices=("thread", "process"), default="thread")
+    ap.add_argument("--chunk-days", type=int, default=31, help="days per METRICS query")
+    ap.add_argument("--batch-rows", type=int, default=5000, help="rows per insert")
+    ap.add_argument("--total-shift", type=float, default=0.0)
+    ap.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    ap.add_argument("--fresh", action="store_true", help="ignore and reset the checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="compute but don't insert")
+    opts = ap.parse_args()
+
+    start, end = _date_span(opts)
+    if opts.fresh and os.path.exists(opts.checkpoint):
+        os.remove(opts.checkpoint)
+    print(f"📅 proposals for {start} … {end} "
+          f"({opts.workers} {opts.executor} workers, {opts.chunk_days}-day queries)")
+    s = run(start, end, workers=opts.workers, executor=opts.executor,
+            chunk_days=opts.chunk_days, batch_rows=opts.batch_rows,
+            total_shift=opts.total_shift, checkpoint=opts.checkpoint, dry_run=opts.dry_run)
+    print(f"✅ {s['days']} days, {s['rows']} rows in {s['wall_s']:.2f} s "
+          f"({s['days_per_s']:,.1f} days/s, {s['rows_per_s']:,.0f} rows/s)")
+    print(f"   skipped (checkpoint): {s['skipped']}   queries: {s['queries']}   "
+          f"inserts: {s['inserts']}")
+    print(f"   fetch {s['fetch_s']:.2f} s · compute {s['compute_s']:.2f} s · "
+          f"write {s['write_s']:.2f} s")
@@ -0,0 +1,67 @@
+# bench/bench_day_parser.py
+"""
+Micro-benchmark for day_parser: compiled fast path (memo cold / warm) against
+dateparser.search.search_dates on the correctness corpus.
+
+    python -m bench.bench_day_parser
+"""
+import time
+from datetime import date, datetime, time as dtime
+
+import day_parser
+
+
+def _corpus() -> tuple[date, list[str]]:
+    today, texts = date.today(), []
+    with open(day_parser.CORPUS_PATH, encoding="utf-8") as fh:
+        for line in fh:
+            if line.startswith("# today:"):
+                today = date.fromisoformat(line.split(":", 1)[1].strip())
+            elif line.strip() and not line.startswith("#"):
+                texts.append(line.split("\t", 1)[0])
+    return today, texts
+
+
+def _per_call(fn, texts: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for t in texts:
+            fn(t)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(texts)
+
+
+def main(repeat: int = 20) -> None:
+    today, texts = _corpus()
+    assert not day_parser.check(), "corpus failures – run `python day_parser.py --check`"
+
+    def cold(t):
+        day_parser._parse.cache_clear()
+        day_parser.parse_range(t, today)
+
+    rows = [
+        ("fast path, memo cold", _per_call(cold, texts, repeat)),
+        ("fast path, memo warm", _per_call(lambda t: day_parser.parse_range(t, today), texts, repeat)),
+    ]
+    try:
+        from dateparser.search import search_dates
+        base = datetime.combine(today, dtime())
+        settings = {"PREFER_DATES_FROM": "past", "RELATIVE_BASE": base}
+        search_dates("warm up", settings=settings)
+        rows.append(("dateparser (all languages)", _per_call(
+            lambda t: search_dates(t, settings=settings), texts, max(1, repeat // 10))))
+        rows.append((f"dateparser ({','.join(day_parser.LANGUAGES)})", _per_call(
+            lambda t: search_dates(t, languages=day_parser.LANGUAGES, settings=settings),
+            texts, max(1, repeat // 10))))
+    except ImportError:
+        print("dateparser not installed – fast path only")
+
+    print(f"{len(texts)} corpus questions")
+    print(f"{'':<30}{'µs / question':>15}")
+    for name, seconds in rows:
+        print(f"{name:<30}{seconds * 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/bench_db_pool.py
+"""
+Concurrency check for tools/db_pool.DBPool against a seeded SQLite METRICS
+table (the Snowflake stand-in), bypassing the metric cache:
+
+    • N worker threads query random days through a pool of --max-size
+      connections → queries/s, pool wait p50/p95, connections opened
+    • one runaway statement → cancelled at --statement-timeout
+
+    python -m bench.bench_db_pool --threads 32 --max-size 8
+"""
+import argparse, os, random, statistics, tempfile, threading, time
+
+SLOW_SQL = """
+  WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+  SELECT count(*) FROM (SELECT x FROM c LIMIT 1000000000)
+"""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--queries", type=int, default=200, help="per thread")
+    ap.add_argument("--min-size", type=int, default=2)
+    ap.add_argument("--max-size", type=int, default=8)
+    ap.add_argument("--statement-timeout", type=float, default=0.5)
+    args = ap.parse_args()
+
+    from sqlalchemy import text
+    from bench import fakes
+    from tools.budget_db import METRICS_SQL
+    from tools.db_pool import DBPool, StatementTimeout
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "metrics.sqlite")
+        days = fakes.seed_metrics_db(db_path, days=90)
+        pool = DBPool(f"sqlite:///{db_path}", name="bench", min_size=args.min_size,
+                      max_size=args.max_size, wait_timeout=30,
+                      statement_timeout=args.statement_timeout)
+
+        t0 = time.perf_counter()
+        pool.prewarm()
+        print(f"prewarm {args.min_size} connections: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+        waits: list[float] = []
+        lock = threading.Lock()
+
+        def worker(seed: int):
+            rng = random.Random(seed)
+            mine = []
+            for _ in range(args.queries):
+                t1 = time.perf_counter()
+                with pool.connect() as conn:
+                    mine.append(time.perf_counter() - t1)
+                    conn.execute(METRICS_SQL, {"day": rng.choice(days)}).fetchall()
+            with lock:
+                waits.extend(mine)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        waits.sort()
+        total = args.threads * args.queries
+        print(f"{total} queries on {args.threads} threads, max {args.max_size} connections")
+        print(f"  {total / wall:,.0f} queries/s")
+        print(f"  checkout wait p50 {statistics.median(waits) * 1e3:.2f} ms, "
+              f"p95 {waits[int(len(waits) * 0.95) - 1] * 1e3:.2f} ms")
+        print(f"  {pool.stats()}")
+
+        t0 = time.perf_counter()
+        try:
+            with pool.connect() as conn:
+                conn.execute(text(SLOW_SQL)).fetchall()
+            print("runaway statement finished before the timeout")
+        except StatementTimeout as e:
+            print(f"runaway statement: {e} (after {time.perf_counter() - t0:.2f} s)")
+        print(f"  {pool.stats()}")
+        pool.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# bench/bench_optimizer.py
+"""
+Micro-benchmark for tools/budget_optimizer.reallocate.
+
+    python -m bench.bench_optimizer
+"""
+import time
+import numpy as np
+
+from tools.budget_optimizer import reallocate, MAX_TOTAL_SHIFT, CHANNEL_FLOOR, CHANNEL_CAP
+
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+def _check(spend, proposed, shift):
+    total, new_total = spend.sum(), proposed.sum()
+    assert abs(new_total / total - 1) <= MAX_TOTAL_SHIFT + 1e-9, "total out of band"
+    assert abs(new_total / total - 1 - shift) < 1e-6, "target total missed"
+    assert np.all(proposed >= spend * CHANNEL_FLOOR - 1e-9), "floor violated"
+    assert np.all(proposed <= spend * CHANNEL_CAP + 1e-9), "cap violated"
+
+
+def main(repeat: int = 20) -> None:
+    rng = np.random.default_rng(7)
+    print(f"{'channels':>10} {'best µs':>10} {'mean µs':>10}")
+    for n in SIZES:
+        spend = rng.gamma(2.0, 500.0, n)
+        sales = spend * rng.lognormal(1.0, 0.6, n)
+        shift = 0.03
+        _check(spend, reallocate(spend, sales, total_shift=shift), shift)
+
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            reallocate(spend, sales, total_shift=shift)
+            times.append(time.perf_counter() - t0)
+        print(f"{n:>10} {min(times) * 1e6:>10.1f} {sum(times) / repeat * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench/bench_replica.py
+"""
+METRICS replica vs. warehouse SQL for multi-day questions, on a seeded
+SQLite METRICS table (the Snowflake stand-in):
+
+    • first (full) sync and an incremental sync after one new day
+    • trailing 7 / 30 / 90-day per-channel totals: replica vs. GROUP BY query
+    • weekly ROAS trend from the precomputed rollups
+
+    python -m bench.bench_replica --days 730
+"""
+import argparse, os, sqlite3, tempfile, time
+from datetime import date, timedelta
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        from bench import fakes
+        db_path = os.path.join(workdir, "metrics.sqlite")
+        end = date.today() - timedelta(days=2)
+        fakes.seed_metrics_db(db_path, days=args.days, end=end)
+        os.environ.update({
+            "METRICS_DB_URI": f"sqlite:///{db_path}",
+            "METRICS_REPLICA_DIR": os.path.join(workdir, "replica"),
+            "METRICS_REPLICA_HISTORY": str(args.days + 7),
+        })
+        from sqlalchemy import text
+        from tools.budget_db import pool
+        from tools.metrics_replica import replica, range_payload, trend_payload
+
+        t0 = time.perf_counter()
+        rows = replica.sync()
+        print(f"full sync          {rows:>8} rows {(time.perf_counter() - t0) * 1e3:>10.1f} ms")
+
+        conn = sqlite3.connect(db_path)
+        new_day = (end + timedelta(days=1)).isoformat()
+        conn.executemany("INSERT INTO METRICS VALUES (?, ?, 100, 50, 300)",
+                         [(new_day, ch) for ch in fakes.CHANNELS])
+        conn.commit()
+        t0 = time.perf_counter()
+        rows = replica.sync()
+        print(f"incremental sync   {rows:>8} rows {(time.perf_counter() - t0) * 1e3:>10.1f} ms")
+
+        sql = text("""
+          SELECT channel, SUM(spend), SUM(clicks), SUM(sales) FROM METRICS
+          WHERE DATE BETWEEN :start AND :end GROUP BY channel ORDER BY channel
+        """)
+        last = end + timedelta(days=1)
+        print(f"\n{'query':<28}{'replica ms':>12}{'SQL ms':>12}")
+        for n in (7, 30, 90):
+            start = last - timedelta(days=n - 1)
+
+            def query():
+                with pool.connect() as c:
+                    c.execute(sql, {"start": start.isoformat(), "end": last.isoformat()}).fetchall()
+
+            local = _best(lambda: range_payload(start, last), args.repeat)
+            remote = _best(query, args.repeat)
+            print(f"{f'trailing {n} days':<28}{local * 1e3:>12.3f}{remote * 1e3:>12.3f}")
+
+        weeks = _best(lambda: trend_payload("roas", "week", last - timedelta(weeks=12), last),
+                      args.repeat)
+        print(f"{'weekly ROAS, 12 weeks':<28}{weeks * 1e3:>12.3f}{'':>12}")
+
+
+if __name__ == "__main__":
+    main()
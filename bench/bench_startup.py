@@ -0,0 +1,121 @@
+# bench/bench_startup.py
+"""
+Import-time and cold-start benchmark.
+
+Every sample runs in a fresh interpreter so nothing is already imported:
+
+    import     – `import orchestrator` / `import server` / `import mcp_tools`
+    cold start – import server + the first /chat turn of each branch
+                 (bench/fakes.py stand-ins, so no network or API spend)
+
+    python -m bench.bench_startup                  # medians over 5 runs
+    python -m bench.bench_startup --importtime     # + slowest imports of server.py
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("orchestrator", "server", "mcp_tools")
+COLD_QUESTIONS = {
+    "generic":         "hello there",
+    "web_search":      "What is performance max?",
+    "budget_insights": "Reallocate the budget for {day}",
+}
+
+
+# ── child side: one measurement, result as the last stdout line ─────
+def _child_import(module: str) -> dict:
+    t0 = time.perf_counter()
+    __import__(module)
+    return {"import_s": time.perf_counter() - t0}
+
+
+def _child_cold(args) -> dict:
+    import asyncio
+    from bench.load_test import prepare_env, wire_apps
+
+    out = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        t0 = time.perf_counter()
+        days = prepare_env(workdir, args)
+        chat_app, _ = wire_apps(args)
+        out["import_s"] = time.perf_counter() - t0
+
+        async def first_turns():
+            import httpx
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=chat_app),
+                                         base_url="http://chat", timeout=60) as client:
+                for branch, q in COLD_QUESTIONS.items():
+                    t1 = time.perf_counter()
+                    r = await client.post("/chat", json={"session_id": f"cold-{branch}",
+                                                         "message": q.format(day=days[-1])})
+                    r.raise_for_status()
+                    out[f"first_{branch}_s"] = time.perf_counter() - t1
+
+        asyncio.run(first_turns())
+    out["total_s"] = time.perf_counter() - t0
+    return out
+
+
+# ── parent side ─────────────────────────────────────────────────────
+def _spawn(*child_args: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.bench_startup", "--child", *child_args],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "WARMUP": "0"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "child failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _medians(samples: list[dict]) -> dict:
+    return {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+
+
+def importtime(module: str, top: int = 15) -> None:
+    """Slowest imports (cumulative µs) as reported by `python -X importtime`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name))
+    print(f"\nslowest imports under `import {module}`")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>10.1f} ms  {name}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--importtime", action="store_true")
+    ap.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--llm-latency", type=float, default=0.0)
+    ap.add_argument("--token-rate", type=float, default=1e6)
+    ap.add_argument("--serper-latency", type=float, default=0.0)
+    args = ap.parse_args()
+
+    if args.child:
+        kind, *rest = args.child
+        result = _child_import(rest[0]) if kind == "import" else _child_cold(args)
+        print(json.dumps(result))
+        return
+
+    print(f"{'import':<28}{'median ms':>12}")
+    for module in MODULES:
+        m = _medians([_spawn("import", module) for _ in range(args.runs)])
+        print(f"{module:<28}{m['import_s'] * 1000:>12.1f}")
+
+    m = _medians([_spawn("cold") for _ in range(args.runs)])
+    print(f"\n{'cold start (fakes)':<28}{'median ms':>12}")
+    for key, value in m.items():
+        print(f"{key:<28}{value * 1000:>12.1f}")
+
+    if args.importtime:
+        importtime("server")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# bench/bench_transport.py
+"""
+Per-call overhead of the MCP tool transports, on a warm metric cache so the
+numbers are transport cost rather than database time:
+
+    http (ASGI)      – mcp_client → JSON → FastAPI hub in-process (no socket)
+    http (loopback)  – the same through a real uvicorn server on 127.0.0.1
+    local async/sync – mcp_client → tools.call_tool, no HTTP, no JSON
+
+    python -m bench.bench_transport                # ASGI + local
+    python -m bench.bench_transport --loopback     # + a real socket
+"""
+import argparse, asyncio, os, socket, statistics, tempfile, threading, time
+
+TOOLS = (("get_budget", lambda day: {"day": day}),
+         ("propose_budget", lambda day: {"day": day, "total_shift": 0.02}))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def _row(name: str, samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"{name:<34}{p50 * 1e6:>12.1f}{p95 * 1e6:>12.1f}"
+
+
+async def _atime(client, tool: str, arguments: dict, n: int) -> list[float]:
+    await client.ainvoke(tool, arguments)            # warm cache / connection
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await client.ainvoke(tool, arguments)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _time(client, tool: str, arguments: dict, n: int) -> list[float]:
+    client.invoke(tool, arguments)
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        client.invoke(tool, arguments)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--calls", type=int, default=500)
+    ap.add_argument("--loopback", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        from bench import fakes
+        db_path = os.path.join(workdir, "metrics.sqlite")
+        day = fakes.seed_metrics_db(db_path, days=7)[0]
+        os.environ.update({
+            "METRICS_DB_URI": f"sqlite:///{db_path}",
+            "PROPOSAL_JOURNAL": os.path.join(workdir, "proposals.journal"),
+            "TRACE_LOG": "0", "WARMUP": "0",
+        })
+        import httpx
+        import mcp_client, mcp_tools
+
+        clients = {"http (ASGI)": mcp_client.MCPClient(base_url="http://hub/mcp",
+                                                        transport="http")}
+        clients["http (ASGI)"].set_transport(
+            async_transport=httpx.ASGITransport(app=mcp_tools.app))
+        server = None
+        if args.loopback:
+            port = _free_port()
+            server = _serve(mcp_tools.app, port)
+            clients["http (loopback)"] = mcp_client.MCPClient(
+                base_url=f"http://127.0.0.1:{port}/mcp", transport="http")
+        local = clients["local async"] = mcp_client.MCPClient(transport="local")
+
+        async def async_rows() -> list[str]:        # one loop: the clients pool per loop
+            rows = []
+            for tool, make in TOOLS:
+                for name, client in clients.items():
+                    samples = await _atime(client, tool, make(day), args.calls)
+                    rows.append(_row(f"{name:<17}{tool}", samples))
+            return rows
+
+        print(f"{args.calls} calls per row, warm metric cache")
+        print(f"{'transport / tool':<34}{'p50 µs':>12}{'p95 µs':>12}")
+        for row in asyncio.run(async_rows()):
+            print(row)
+        for tool, make in TOOLS:
+            print(_row(f"{'local sync':<17}{tool}", _time(local, tool, make(day), args.calls)))
+        if server is not None:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# bench/fakes.py
+"""
+Deterministic stand-ins for the paid dependencies, used by the benchmarks:
+
+• FakeChatModel   – replaces init_llm()/ChatOpenAI; configurable latency and
+                    token rate, speaks OpenAI function-calling for the budget agent
+• seed_metrics_db – SQLite file with synthetic METRICS rows (METRICS_DB_URI)
+• CannedSerper    – replaces web_search_agent.search
+• fake_redis      – fakeredis client for server.store
+"""
+import asyncio, json, random, re, sqlite3, time
+from datetime import date, timedelta
+from typing import Any
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, BaseMessage, FunctionMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+CHANNELS = ["google", "meta", "tiktok", "linkedin", "youtube", "display", "email", "affiliate"]
+
+_LOREM = (
+    "Spend shifts toward the channels with the strongest return while keeping "
+    "the total inside the agreed band and protecting volume on the rest"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Canned answers with a simulated time-to-first-token and token rate."""
+
+    latency: float = 0.35          # seconds before the first token
+    tokens_per_sec: float = 60.0
+    answer_tokens: int = 40
+    temperature: float = 0.0
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    # ── what to say ──────────────────────────────────────────────────
+    def _reply(self, messages: list[BaseMessage], functions: list | None) -> AIMessage:
+        text = "\n".join(str(m.content) for m in messages)
+
+        if "Route the user query" in text:
+            q = text.rsplit("User Query:", 1)[-1].lower()
+            if any(w in q for w in ("spend", "budget", "roas", "split")):
+                branch = "budget_insights"
+            elif any(w in q for w in ("what", "who", "latest", "news", "how")):
+                branch = "web_search"
+            else:
+                branch = "generic"
+            return AIMessage(content=json.dumps({"next": branch}))
+
+        if functions:
+            called = {m.name for m in messages if isinstance(m, FunctionMessage)}
+            m = re.search(r"Date hint: (\d{4}-\d{2}-\d{2})", text)
+            day = m.group(1) if m else date.today().isoformat()
+            for step in ("get_budget", "propose_budget"):
+                if step not in called:
+                    return AIMessage(content="", additional_kwargs={"function_call": {
+                        "name": step, "arguments": json.dumps({"day": day}),
+                    }})
+            table = next((str(m.content) for m in reversed(messages)
+                          if isinstance(m, FunctionMessage) and m.name == "propose_budget"), "")
+            return AIMessage(content=table.replace("|  |", "| shift toward ROAS |"))
+
+        return AIMessage(content=" ".join(_LOREM[i % len(_LOREM)] for i in range(self.answer_tokens)))
+
+    def _duration(self, msg: AIMessage) -> float:
+        n = max(1, len(str(msg.content).split()))
+        return self.latency + n / self.tokens_per_sec
+
+    # ── BaseChatModel plumbing ───────────────────────────────────────
+    def _generate(self, messages, stop=None, run_manager: CallbackManagerForLLMRun | None = None,
+                  **kwargs: Any) -> ChatResult:
+        msg = self._reply(messages, kwargs.get("functions"))
+        time.sleep(self._duration(msg))
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _agenerate(self, messages, stop=None,
+                         run_manager: AsyncCallbackManagerForLLMRun | None = None,
+                         **kwargs: Any) -> ChatResult:
+        msg = self._reply(messages, kwargs.get("functions"))
+        await asyncio.sleep(self._duration(msg))
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _astream(self, messages, stop=None,
+                       run_manager: AsyncCallbackManagerForLLMRun | None = None,
+                       **kwargs: Any):
+        msg = self._reply(messages, kwargs.get("functions"))
+        await asyncio.sleep(self.latency)
+        if msg.additional_kwargs:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", additional_kwargs=msg.additional_kwargs))
+            return
+        words = str(msg.content).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(1 / self.tokens_per_sec)
+            token = word if i == 0 else " " + word
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def fake_llm_factory(latency: float = 0.35, tokens_per_sec: float = 60.0):
+    """Factory for utils.set_llm_factory."""
+    def factory(temperature: float = 0.2, streaming: bool = True):
+        return FakeChatModel(latency=latency, tokens_per_sec=tokens_per_sec,
+                             temperature=temperature, streaming=streaming)
+    return factory
+
+
+# ── SQLite stand-in for Snowflake ───────────────────────────────────
+def seed_metrics_db(path: str, days: int = 90, channels: list[str] = CHANNELS,
+                    end: date | None = None, seed: int = 7) -> list[str]:
+    """Create METRICS / PROPOSED_BUDGETS and fill `days` days; returns the ISO days."""
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        DROP TABLE IF EXISTS METRICS;
+        DROP TABLE IF EXISTS PROPOSED_BUDGETS;
+        CREATE TABLE METRICS (DATE TEXT, CHANNEL TEXT, SPEND REAL, CLICKS INTEGER, SALES REAL);
+        CREATE INDEX metrics_date ON METRICS(DATE);
+        CREATE TABLE PROPOSED_BUDGETS (proposal_date TEXT, channel TEXT,
+            current_spend REAL, proposed_spend REAL, rationale TEXT);
+    """)
+    all_days, rows = [], []
+    for i in range(days):
+        day = (end - timedelta(days=i)).isoformat()
+        all_days.append(day)
+        for ch in channels:
+            spend = round(rng.uniform(200, 5000), 2)
+            clicks = int(spend / rng.uniform(0.4, 3.0))
+            rows.append((day, ch, spend, clicks, round(spend * rng.uniform(0.5, 6.0), 2)))
+    conn.executemany("INSERT INTO METRICS VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return all_days
+
+
+# ── Serper stand-in ─────────────────────────────────────────────────
+class CannedSerper:
+    """Mimics GoogleSerperRun.run / arun with fixed latency."""
+
+    def __init__(self, latency: float = 0.25):
+        self.latency = latency
+        self.calls = 0
+
+    def _answer(self, query: str) -> str:
+        return (f"{query}: industry reports show budgets moving to retail media and "
+                f"short-form video; CPMs rose 8% YoY; brands test creator-led ads. ") * 6
+
+    def run(self, query: str, *args, **kwargs) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._answer(query)
+
+    async def arun(self, query: str, *args, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._answer(query)
+
+
+def fake_redis():
+    import fakeredis
+    return fakeredis.aioredis.FakeRedis()
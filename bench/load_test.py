@@ -0,0 +1,233 @@
+# bench/load_test.py
+"""
+Offline load test for the chat service and the MCP hub.
+
+Everything paid is replaced by the stand-ins in bench/fakes.py (fake chat
+model, seeded SQLite METRICS, canned Serper, fakeredis); the real FastAPI
+apps are driven in-process through httpx.ASGITransport.
+
+    python -m bench.load_test --sessions 50 --turns 4 --concurrency 25
+    python -m bench.load_test --update-baseline      # record bench/baseline.json
+
+Exit status 1 when p95 latency or throughput regress by more than
+--tolerance against the stored baseline, 3 when there is no baseline to
+compare against (the gate was skipped, not passed; --allow-missing-baseline
+turns that into 0).
+"""
+import argparse, asyncio, json, os, random, sys, tempfile, time
+from collections import defaultdict
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+QUESTIONS = {
+    "budget_insights": [
+        "Reallocate the budget for {day}",
+        "What was our ROAS by channel on {day}?",
+        "Propose a new spend split for {day}",
+    ],
+    "web_search": [
+        "What are the latest trends in retail media advertising?",
+        "What is performance max?",
+        "News about third party cookies deprecation",
+    ],
+    "generic": ["hello there", "thanks!", "what can you do?"],
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarise(samples: dict[str, list[float]], wall: float) -> dict:
+    out = {}
+    for name, lat in sorted(samples.items()):
+        out[name] = {
+            "n": len(lat),
+            "p50_ms": round(percentile(lat, 50) * 1000, 1),
+            "p95_ms": round(percentile(lat, 95) * 1000, 1),
+            "p99_ms": round(percentile(lat, 99) * 1000, 1),
+            "rps": round(len(lat) / wall, 2) if wall else 0.0,
+        }
+    total = sum(len(v) for v in samples.values())
+    out["_all"] = {"n": total, "rps": round(total / wall, 2) if wall else 0.0,
+                   "wall_s": round(wall, 2)}
+    return out
+
+
+def print_table(title: str, report: dict) -> None:
+    print(f"\n{title}")
+    print(f"{'name':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for name, row in report.items():
+        if name.startswith("_"):
+            continue
+        print(f"{name:<18}{row['n']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['rps']:>9}")
+    a = report["_all"]
+    print(f"{'total':<18}{a['n']:>6}{'':>30}{a['rps']:>9}   ({a['wall_s']} s)")
+
+
+# ── environment: must be in place before the apps are imported ──────
+def prepare_env(workdir: str, args) -> list[str]:
+    from bench import fakes
+    db_path = os.path.join(workdir, "metrics.sqlite")
+    days = fakes.seed_metrics_db(db_path, days=args.days)
+    os.environ.update({
+        "METRICS_DB_URI": f"sqlite:///{db_path}",
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search.sqlite"),
+        "PROPOSAL_JOURNAL": os.path.join(workdir, "proposals.journal"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-bench"),
+        "SERPER_API_KEY": os.environ.get("SERPER_API_KEY", "bench"),
+    })
+    import utils
+    utils.set_llm_factory(fakes.fake_llm_factory(args.llm_latency, args.token_rate))
+    return days
+
+
+def wire_apps(args):
+    import httpx
+    from bench import fakes
+    import mcp_client, mcp_tools, server
+    from agents import web_search_agent
+
+    web_search_agent.search = fakes.CannedSerper(args.serper_latency)
+    server.store = server.SessionStore(fakes.fake_redis())
+    if getattr(args, "mcp_transport", "http") == "local":
+        mcp_client.client.use_local()           # tools run in-process, no hub hop
+    else:
+        mcp_client.client.set_transport(
+            async_transport=httpx.ASGITransport(app=mcp_tools.app))
+    return server.app, mcp_tools.app
+
+
+# ── load phases ─────────────────────────────────────────────────────
+async def run_chat(app, days: list[str], args) -> dict:
+    import httpx
+    rng = random.Random(args.seed)
+    samples: dict[str, list[float]] = defaultdict(list)
+    errors = 0
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://chat", timeout=120) as client:
+        async def session(i: int):
+            nonlocal errors
+            sid = f"bench-{i}"
+            for _ in range(args.turns):
+                branch = rng.choice(list(QUESTIONS))
+                q = rng.choice(QUESTIONS[branch]).format(day=rng.choice(days))
+                async with gate:
+                    t0 = time.perf_counter()
+                    r = await client.post("/chat", json={"session_id": sid, "message": q})
+                    dt = time.perf_counter() - t0
+                if r.status_code != 200:
+                    errors += 1
+                    continue
+                samples[r.json()["branch"]].append(dt)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        wall = time.perf_counter() - t0
+
+    report = summarise(samples, wall)
+    report["_all"]["errors"] = errors
+    return report
+
+
+async def run_hub(app, days: list[str], args) -> dict:
+    import httpx
+    rng = random.Random(args.seed + 1)
+    samples: dict[str, list[float]] = defaultdict(list)
+    gate = asyncio.Semaphore(args.concurrency)
+    calls = [("get_budget", {"day": rng.choice(days)}) for _ in range(args.hub_calls)]
+    calls += [("propose_budget", {"day": rng.choice(days)}) for _ in range(args.hub_calls)]
+    rng.shuffle(calls)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://hub", timeout=60) as client:
+        async def one(tool: str, arguments: dict):
+            async with gate:
+                t0 = time.perf_counter()
+                r = await client.post(f"/mcp/{tool}/invoke", json={"arguments": arguments})
+                dt = time.perf_counter() - t0
+            r.raise_for_status()
+            samples[tool].append(dt)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(t, a) for t, a in calls))
+        wall = time.perf_counter() - t0
+    return summarise(samples, wall)
+
+
+# ── regression gate ─────────────────────────────────────────────────
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    problems = []
+    for phase in ("chat", "hub"):
+        for name, base in baseline.get(phase, {}).items():
+            cur = current.get(phase, {}).get(name)
+            if cur is None:
+                continue
+            if name == "_all":
+                if cur["rps"] < base["rps"] * (1 - tolerance):
+                    problems.append(f"{phase} throughput {cur['rps']} < baseline {base['rps']}")
+                continue
+            if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                problems.append(f"{phase}/{name} p95 {cur['p95_ms']} ms > baseline {base['p95_ms']} ms")
+    return problems
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sessions", type=int, default=40)
+    ap.add_argument("--turns", type=int, default=3)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--hub-calls", type=int, default=200)
+    ap.add_argument("--days", type=int, default=60)
+    ap.add_argument("--llm-latency", type=float, default=0.35)
+    ap.add_argument("--token-rate", type=float, default=60.0)
+    ap.add_argument("--serper-latency", type=float, default=0.25)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--mcp-transport", choices=("http", "local"), default="http",
+                    help="how the chat service reaches the tools (see MCP_TRANSPORT)")
+    ap.add_argument("--tolerance", type=float, default=0.20)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--allow-missing-baseline", action="store_true",
+                    help="exit 0 instead of 3 when there is no baseline yet")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        days = prepare_env(workdir, args)
+        chat_app, hub_app = wire_apps(args)
+
+        report = {
+            "chat": asyncio.run(run_chat(chat_app, days, args)),
+            "hub": asyncio.run(run_hub(hub_app, days, args)),
+        }
+
+    print_table("chat service  (/chat)", report["chat"])
+    print_table("MCP hub  (/mcp/*/invoke)", report["hub"])
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nbaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSKIPPED: no baseline at {args.baseline} – nothing was compared; "
+              "run with --update-baseline to record one")
+        return 0 if args.allow_missing_baseline else 3
+    with open(args.baseline) as fh:
+        problems = compare(report, json.load(fh), args.tolerance)
+    for p in problems:
+        print("REGRESSION:", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# bulkhead.py
+"""
+Per-dependency concurrency bulkheads with admission control.
+
+Each downstream (openai, serper, mcp, snowflake) gets its own `Bulkhead`:
+at most `limit` calls in flight, at most `queue` callers waiting for a slot,
+and no caller waits longer than `max_wait` or past its request deadline.
+Instead of hanging, an over-full bulkhead raises `Rejected`, which the
+FastAPI apps turn into a fast 429 (queue full) / 503 (no slot in time) with
+Retry-After.  One slow dependency therefore only backs up its own branch.
+
+Limits come from BULKHEAD_<NAME>_LIMIT / _QUEUE / _WAIT.
+"""
+import asyncio, contextvars, math, os, threading, time
+from contextlib import asynccontextmanager, contextmanager
+import telemetry
+
+DEFAULTS = {                 # name: (limit, queue, max_wait seconds)
+    "openai":    (32, 64, 10.0),
+    "serper":    (8, 32, 5.0),
+    "mcp":       (32, 128, 10.0),
+    "snowflake": (8, 32, 10.0),
+}
+
+IN_FLIGHT = telemetry.registry.gauge(
+    "bulkhead_in_flight", "Calls holding a bulkhead slot", ("name",))
+QUEUE_DEPTH = telemetry.registry.gauge(
+    "bulkhead_queue_depth", "Callers waiting for a bulkhead slot", ("name",))
+WAIT_SECONDS = telemetry.registry.histogram(
+    "bulkhead_wait_seconds", "Time spent waiting for a bulkhead slot", ("name",))
+REJECTIONS = telemetry.registry.counter(
+    "bulkhead_rejections_total", "Calls shed by a bulkhead", ("name", "reason"))
+
+
+class Rejected(RuntimeError):
+    """A bulkhead shed the call; map to HTTP `status` with Retry-After."""
+
+    def __init__(self, name: str, reason: str, retry_after: float):
+        self.name, self.reason = name, reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status = 429 if reason == "queue_full" else 503
+        super().__init__(f"{name} is overloaded ({reason}), retry in {self.retry_after}s")
+
+
+# ── request deadline (set per request by server.py / the hub) ────────
+_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+_held: contextvars.ContextVar = contextvars.ContextVar("bulkheads_held", default=frozenset())
+
+
+def set_deadline(seconds: float | None) -> None:
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def remaining() -> float:
+    """Seconds left before the current request's deadline (inf if none)."""
+    d = _deadline.get()
+    return math.inf if d is None else d - time.monotonic()
+
+
+class Bulkhead:
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name, self.limit, self.queue, self.max_wait = name, limit, queue, max_wait
+        self.active = self.waiting = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._sync_sem = threading.BoundedSemaphore(limit)
+        self._sem: asyncio.Semaphore | None = None
+        self._loop = None
+
+    # ── bookkeeping ──────────────────────────────────────────────────
+    def _admit(self) -> float:
+        """Reserve a place in the queue → seconds we may wait, or raise Rejected."""
+        budget = min(self.max_wait, remaining())
+        with self._lock:
+            if budget <= 0:
+                reason = "deadline"
+            elif self.active >= self.limit and self.waiting >= self.queue:
+                reason = "queue_full"
+            else:
+                self.waiting += 1
+                QUEUE_DEPTH.set(self.waiting, name=self.name)
+                return budget
+        self._reject(reason)
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected += 1
+        REJECTIONS.inc(name=self.name, reason=reason)
+        raise Rejected(self.name, reason, self.max_wait)
+
+    def _enter(self, waited: float, got_slot: bool) -> None:
+        with self._lock:
+            self.waiting -= 1
+            QUEUE_DEPTH.set(self.waiting, name=self.name)
+            if got_slot:
+                self.active += 1
+                IN_FLIGHT.set(self.active, name=self.name)
+        WAIT_SECONDS.observe(waited, name=self.name)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.active -= 1
+            IN_FLIGHT.set(self.active, name=self.name)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:            # asyncio primitives are loop-bound
+            self._sem, self._loop = asyncio.Semaphore(self.limit), loop
+        return self._sem
+
+    # ── async callers ────────────────────────────────────────────────
+    @asynccontextmanager
+    async def slot(self):
+        if self.name in _held.get():          # re-entrant (e.g. _agenerate → _astream)
+            yield
+            return
+        budget = self._admit()
+        sem = self._semaphore()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(sem.acquire(), budget)
+        except asyncio.TimeoutError:
+            self._enter(time.perf_counter() - t0, got_slot=False)
+            self._reject("timeout")
+        except BaseException:
+            self._enter(time.perf_counter() - t0, got_slot=False)
+            raise
+        self._enter(time.perf_counter() - t0, got_slot=True)
+        held = _held.get()
+        _held.set(held | {self.name})
+        try:
+            yield
+        finally:
+            _held.set(held)
+            self._exit()
+            sem.release()
+
+    # ── thread callers (REPL, worker threads) ────────────────────────
+    @contextmanager
+    def sync_slot(self):
+        if self.name in _held.get():
+            yield
+            return
+        budget = self._admit()
+        t0 = time.perf_counter()
+        got = self._sync_sem.acquire(timeout=None if math.isinf(budget) else budget)
+        self._enter(time.perf_counter() - t0, got_slot=got)
+        if not got:
+            self._reject("timeout")
+        held = _held.get()
+        _held.set(held | {self.name})
+        try:
+            yield
+        finally:
+            _held.set(held)
+            self._exit()
+            self._sync_sem.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.active,
+                "waiting": self.waiting, "rejected": self.rejected}
+
+
+_bulkheads: dict[str, Bulkhead] = {}
+_registry_lock = threading.Lock()
+
+
+def get(name: str) -> Bulkhead:
+    """The process-wide bulkhead for a dependency, configured from env."""
+    with _registry_lock:
+        bh = _bulkheads.get(name)
+        if bh is None:
+            limit, queue, wait = DEFAULTS.get(name, (16, 64, 10.0))
+            env = f"BULKHEAD_{name.upper()}_"
+            bh = _bulkheads[name] = Bulkhead(
+                name,
+                limit=int(os.getenv(env + "LIMIT", limit)),
+                queue=int(os.getenv(env + "QUEUE", queue)),
+                max_wait=float(os.getenv(env + "WAIT", wait)),
+            )
+        return bh
+
+
+def stats() -> dict:
+    return {name: bh.stats() for name, bh in _bulkheads.items()}
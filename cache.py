@@ -0,0 +1,300 @@
+# cache.py
+"""
+Small in-process caching helpers shared by the agents and tools.
+
+• `TTLCache`    – thread-safe LRU with per-entry TTL and a byte budget
+• `SingleFlight` – collapses concurrent misses for the same key into one call
+• `AsyncSingleFlight` – the same for coroutines on one event loop
+• `PersistentCache` – `TTLCache` in front of SQLite, with fresh/stale lookups
+                    (`aget` / `aset` keep the SQLite I/O off the event loop)
+"""
+import asyncio, json, os, sqlite3, sys, threading, time
+from collections import OrderedDict
+
+
+def approx_size(value) -> int:
+    """Cheap byte estimate used for the memory cap (not exact, but monotonic)."""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approx_size(k) + approx_size(v) for k, v in value.items()) + 64
+    if isinstance(value, (list, tuple)):
+        return sum(approx_size(v) for v in value) + 56
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 default_ttl: float = 300.0, sizeof=approx_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._sizeof = sizeof
+        self._data: OrderedDict = OrderedDict()    # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return                               # would evict everything else
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key) -> bool:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+                return True
+            return False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._data),
+                "bytes":     self._bytes,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "evictions": self.evictions,
+                "hit_rate":  round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Thread-level request coalescing: while `fn` runs for a key, other callers
+    asking for the same key wait for that result instead of calling `fn` too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}       # key -> [Event, result, exception]
+        self.shared = 0              # callers that piggy-backed on another call
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+            else:
+                self.shared += 1
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = fn(*args, **kwargs)
+            return call[1]
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call[0].set()
+
+
+class _LeaderCancelled(Exception):
+    """Set on an AsyncSingleFlight future whose leader was cancelled."""
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines: followers await the leader's future.
+
+    A cancelled leader doesn't take its followers down with it: the first
+    follower to wake up re-runs `fn` as the new leader, the rest join it.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}       # key -> Future
+        self.shared = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        while (fut := self._calls.get(key)) is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(fut)
+            except _LeaderCancelled:
+                self.shared -= 1
+
+        fut = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args, **kwargs)
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()          # mark retrieved: there may be no followers
+            raise
+        finally:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class PersistentCache:
+    """
+    Memory LRU (`TTLCache`) in front of a SQLite table.
+
+    Entries remember when they were written, so `get` can tell the caller
+    whether a value is fresh (age < ttl) or merely usable (age < stale_ttl) –
+    the caller serves stale values immediately and refreshes in the background.
+    Values must be JSON-serialisable.
+    """
+
+    def __init__(self, path: str, table: str, ttl: float, stale_ttl: float | None = None,
+                 max_rows: int = 10_000, mem_entries: int = 512,
+                 mem_bytes: int = 8 * 1024 * 1024):
+        self.table = table
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl or ttl, ttl)
+        self.max_rows = max_rows
+        self.mem = TTLCache(max_entries=mem_entries, max_bytes=mem_bytes,
+                            default_ttl=self.stale_ttl,
+                            sizeof=lambda entry: approx_size(entry[0]))
+        self.disk_hits = self.disk_misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " written_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)"
+        )
+
+    def get(self, key: str):
+        """Return (value, fresh) or None when missing / older than stale_ttl."""
+        entry = self.mem.get(key)
+        if entry is None:
+            entry = self._load(key)
+        return self._fresh(entry)
+
+    async def aget(self, key: str):
+        """get() for event-loop callers: memory tier inline, SQLite in a worker thread."""
+        entry = self.mem.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._load, key)
+        return self._fresh(entry)
+
+    def _fresh(self, entry):
+        if entry is None:
+            return None
+        value, written_at = entry
+        return value, (time.time() - written_at) < self.ttl
+
+    def _load(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, written_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.stale_ttl:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        entry = (json.loads(row[0]), row[1])
+        self.mem.set(key, entry, ttl=self.stale_ttl - (now - row[1]))
+        return entry
+
+    def set(self, key: str, value) -> None:
+        now = time.time()
+        self.mem.set(key, (value, now))
+        self._write(key, value, now)
+
+    async def aset(self, key: str, value) -> None:
+        """set() for event-loop callers: the SQLite write runs in a worker thread."""
+        now = time.time()
+        self.mem.set(key, (value, now))
+        await asyncio.to_thread(self._write, key, value, now)
+
+    def _write(self, key: str, value, now: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, written_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # drop expired rows, then the least recently used beyond max_rows
+        self._conn.execute(f"DELETE FROM {self.table} WHERE written_at < ?",
+                           (now - self.stale_ttl,))
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_rows:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f" SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_rows,),
+            )
+
+    def stats(self) -> dict:
+        lookups = self.mem.hits + self.mem.misses
+        hits = self.mem.hits + self.disk_hits
+        return {
+            "memory": self.mem.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,294 @@
+# day_parser.py
+"""
+Fast date extraction for budget questions.
+
+Compiled regexes cover what users actually type – ISO and numeric dates,
+"July 1st", "yesterday", "last Monday", "3 days ago" – and ranges such as
+"last week", "last 7 days" or "from 2025-07-01 to 2025-07-07".  Results are
+memoized on (normalised text, today).  Only when nothing matches and the
+text looks date-ish does it fall back to dateparser, restricted to
+DATEPARSER_LANGUAGES and preloaded by `preload()` at startup.
+
+    python day_parser.py --check data/date_corpus.tsv     # correctness corpus
+"""
+import os, re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+import telemetry
+
+LANGUAGES = [l.strip() for l in os.getenv("DATEPARSER_LANGUAGES", "en").split(",") if l.strip()]
+DAY_FIRST = os.getenv("DATE_DAY_FIRST", "0") == "1"      # 03/04/2025 → 3 April
+FALLBACK = os.getenv("DATEPARSER_FALLBACK", "1") == "1"
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "date_corpus.tsv")
+
+DATE_PARSES = telemetry.registry.counter(
+    "date_parse_total", "Date extractions by path (fast / fallback / none), memo misses only",
+    ("path",))
+
+
+class DayRange(NamedTuple):
+    start: date
+    end: date               # inclusive
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+
+# ── vocabulary ───────────────────────────────────────────────────────
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+WEEKDAYS = {d: i for i, d in enumerate(
+    ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"))}
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+           "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+_MON = (r"(?P<mon>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|"
+        r"aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?")
+_ORD = r"(?:st|nd|rd|th)?"
+_NUM = r"(?P<n>\d+|" + "|".join(NUMBERS) + r")"
+_WD = r"(?P<wd>" + "|".join(WEEKDAYS) + r")"
+
+# explicit dates (also the building blocks of explicit ranges)
+_ISO = r"(?P<y>\d{4})[-/.](?P<m>\d{1,2})[-/.](?P<d>\d{1,2})"
+_NUMERIC = r"(?P<a>\d{1,2})[/.-](?P<b>\d{1,2})[/.-](?P<c>\d{4}|\d{2})"
+_MON_DAY = _MON + r"\s+(?P<d>\d{1,2})" + _ORD + r"(?:,?\s+(?P<y>\d{4}))?"
+_DAY_MON = r"(?P<d>\d{1,2})" + _ORD + r"\s+(?:of\s+)?" + _MON + r"(?:,?\s+(?P<y>\d{4}))?"
+
+_EXPLICIT = [re.compile(r"\b" + p + r"\b") for p in (_ISO, _NUMERIC, _MON_DAY, _DAY_MON)]
+_UNNAMED = re.compile(r"\(\?P<\w+>")          # same shapes, without group names
+_ANY_EXPLICIT = "|".join("(?:%s)" % _UNNAMED.sub("(?:", p)
+                         for p in (_ISO, _NUMERIC, _MON_DAY, _DAY_MON))
+_EXPLICIT_RANGE = re.compile(
+    rf"\b(?:from|between)\s+({_ANY_EXPLICIT})\s+(?:to|until|till|through|and|-)\s+({_ANY_EXPLICIT})\b")
+
+_RELATIVE = {
+    "today":      re.compile(r"\b(?:today|tonight|this morning)\b"),
+    "yesterday":  re.compile(r"\b(?:yesterday|yday)\b"),
+    "day_before": re.compile(r"\b(?:the\s+)?day before yesterday\b"),
+    "ago":        re.compile(_NUM.replace("(?P<n>", r"\b(?P<n>") + r"\s+(?P<unit>day|week|month)s?\s+ago\b"),
+    "weekday":    re.compile(r"\b(?:(?P<rel>last|past|previous|this|on)\s+)?" + _WD + r"\b"),
+}
+_RANGES = {
+    "last_n":     re.compile(r"\b(?:last|past|previous)\s+" + _NUM + r"\s+(?P<unit>day|week)s?\b"),
+    "last_week":  re.compile(r"\b(?:last|previous|past)\s+week\b"),
+    "this_week":  re.compile(r"\b(?:this\s+week|week\s+to\s+date|wtd)\b"),
+    "last_month": re.compile(r"\b(?:last|previous|past)\s+month\b"),
+    "this_month": re.compile(r"\b(?:this\s+month|month\s+to\s+date|mtd)\b"),
+    "weekend":    re.compile(r"\b(?:last|past|this)\s+weekend\b"),
+    "ytd":        re.compile(r"\b(?:year\s+to\s+date|ytd)\b"),
+}
+# nothing matched: only texts with a date-ish token are worth dateparser's time
+_HINT = re.compile(r"\d|\b(?:" + "|".join(MONTHS) + "|" + "|".join(w[:3] for w in WEEKDAYS) +
+                   r"|ago|tomorrow|week|month|year|quarter|day)")
+
+
+# ── helpers ──────────────────────────────────────────────────────────
+def _month(token: str) -> int:
+    return MONTHS[token[:3]]
+
+def _year(y: str | None, m: int, d: int, today: date) -> date:
+    if y:
+        year = int(y)
+        return date(year + 2000 if year < 100 else year, m, d)
+    cand = date(today.year, m, d)            # no year → most recent past occurrence
+    return cand if cand <= today else date(today.year - 1, m, d)
+
+def _count(token: str) -> int:
+    return int(token) if token.isdigit() else NUMBERS[token]
+
+def _add_months(d: date, months: int) -> date:
+    y, m = divmod(d.month - 1 + months, 12)
+    y, m = d.year + y, m + 1
+    last = (date(y + (m == 12), m % 12 + 1, 1) - timedelta(days=1)).day
+    return date(y, m, min(d.day, last))
+
+def _explicit(m: re.Match, today: date) -> date:
+    g = m.groupdict()
+    if g.get("mon"):
+        return _year(g.get("y"), _month(g["mon"]), int(g["d"]), today)
+    if g.get("a"):
+        a, b, c = int(g["a"]), int(g["b"]), g["c"]
+        day_first = DAY_FIRST or a > 12
+        mm, dd = (b, a) if day_first else (a, b)
+        return _year(c, mm, dd, today)
+    return date(int(g["y"]), int(g["m"]), int(g["d"]))
+
+def _parse_explicit(text: str, today: date) -> date | None:
+    for rx in _EXPLICIT:
+        m = rx.search(text)
+        if m:
+            try:
+                return _explicit(m, today)
+            except ValueError:
+                continue
+    return None
+
+def _relative(kind: str, m: re.Match, today: date) -> DayRange:
+    if kind == "today":
+        d = today
+    elif kind == "yesterday":
+        d = today - timedelta(days=1)
+    elif kind == "day_before":
+        d = today - timedelta(days=2)
+    elif kind == "ago":
+        n, unit = _count(m["n"]), m["unit"]
+        d = _add_months(today, -n) if unit == "month" else \
+            today - timedelta(days=n * (7 if unit == "week" else 1))
+    else:                                    # weekday
+        back = (today.weekday() - WEEKDAYS[m["wd"]]) % 7
+        if m["rel"] in ("last", "past", "previous") and back == 0:
+            back = 7
+        # "this friday" on a Wednesday: the most recent one – a future day has no metrics
+        d = today - timedelta(days=back)
+    return DayRange(d, d)
+
+def _range(kind: str, m: re.Match, today: date) -> DayRange:
+    monday = today - timedelta(days=today.weekday())
+    if kind == "last_n":
+        n = _count(m["n"]) * (7 if m["unit"] == "week" else 1)
+        return DayRange(today - timedelta(days=n), today - timedelta(days=1))
+    if kind == "last_week":
+        return DayRange(monday - timedelta(days=7), monday - timedelta(days=1))
+    if kind == "this_week":
+        return DayRange(monday, today)
+    if kind == "last_month":
+        first = today.replace(day=1)
+        return DayRange(_add_months(first, -1), first - timedelta(days=1))
+    if kind == "this_month":
+        return DayRange(today.replace(day=1), today)
+    if kind == "weekend":
+        saturday = monday - timedelta(days=2)
+        return DayRange(saturday, saturday + timedelta(days=1))
+    return DayRange(date(today.year, 1, 1), today)      # ytd
+
+
+# ── fast path ────────────────────────────────────────────────────────
+def _fast(text: str, today: date) -> DayRange | None:
+    """Earliest date expression in the text wins (like dateparser's search)."""
+    m = _EXPLICIT_RANGE.search(text)
+    if m:
+        a, b = _parse_explicit(m.group(1), today), _parse_explicit(m.group(2), today)
+        if a and b:
+            return DayRange(min(a, b), max(a, b))
+
+    best: tuple[int, DayRange] | None = None
+    for rx in _EXPLICIT:
+        for m in rx.finditer(text):
+            try:
+                d = _explicit(m, today)
+            except ValueError:
+                continue
+            if best is None or m.start() < best[0]:
+                best = (m.start(), DayRange(d, d))
+            break
+    for kind, rx in _RANGES.items():
+        m = rx.search(text)
+        if m and (best is None or m.start() < best[0]):
+            best = (m.start(), _range(kind, m, today))
+    for kind, rx in _RELATIVE.items():
+        m = rx.search(text)
+        if m and (best is None or m.start() < best[0]):
+            best = (m.start(), _relative(kind, m, today))
+    return best[1] if best else None
+
+
+# ── dateparser fallback ──────────────────────────────────────────────
+_search_dates = None
+
+def preload() -> None:
+    """Import dateparser and load the configured languages (call at startup)."""
+    global _search_dates
+    if _search_dates is None and FALLBACK:
+        from dateparser.search import search_dates
+        search_dates("on 1 July 2025", languages=LANGUAGES)
+        _search_dates = search_dates
+
+def _fallback(text: str, today: date) -> DayRange | None:
+    if not FALLBACK or not _HINT.search(text):
+        return None
+    preload()
+    hits = _search_dates(text, languages=LANGUAGES, settings={
+        "PREFER_DATES_FROM": "past",
+        "RELATIVE_BASE": datetime.combine(today, time()),
+    })
+    if not hits:
+        return None
+    d = hits[0][1].date()                    # hits is [(matched_text, datetime)]
+    return DayRange(d, d)
+
+
+# ── public API ───────────────────────────────────────────────────────
+_ws = re.compile(r"\s+")
+
+@lru_cache(maxsize=int(os.getenv("DATE_PARSE_CACHE", 4096)))
+def _parse(norm: str, today: date) -> DayRange | None:
+    found = _fast(norm, today)
+    if found is not None:
+        DATE_PARSES.inc(path="fast")
+        return found
+    found = _fallback(norm, today)
+    DATE_PARSES.inc(path="fallback" if found else "none")
+    return found
+
+_pinned: date | None = None
+
+def pin_today(day: date | None) -> None:
+    """Make relative dates resolve against `day` (replay.py); None unpins."""
+    global _pinned
+    _pinned = day
+
+def reference_day() -> date:
+    """The day relative dates count from: today unless pinned."""
+    return _pinned or date.today()
+
+def parse_range(text: str, today: date | None = None) -> DayRange | None:
+    """First date or date range mentioned in `text` (None if there is none)."""
+    return _parse(_ws.sub(" ", text.lower()).strip(), today or reference_day())
+
+def parse_day(text: str, today: date | None = None) -> date | None:
+    """First date in `text`; for a range, its last day."""
+    found = parse_range(text, today)
+    return found.end if found else None
+
+
+def check(path: str = CORPUS_PATH) -> list[str]:
+    """
+    Run the correctness corpus: `text<TAB>expected` lines where expected is
+    YYYY-MM-DD, YYYY-MM-DD..YYYY-MM-DD or `-`; a `# today: YYYY-MM-DD` line
+    sets the reference day.  Returns the failures.
+    """
+    today, failures = date.today(), []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if line.startswith("# today:"):
+                today = date.fromisoformat(line.split(":", 1)[1].strip())
+                continue
+            if not line.strip() or line.startswith("#"):
+                continue
+            text, _, expected = line.partition("\t")
+            got = parse_range(text, today)
+            shown = "-" if got is None else (
+                got.start.isoformat() if got.days == 1
+                else f"{got.start.isoformat()}..{got.end.isoformat()}")
+            if shown != expected.strip():
+                failures.append(f"{text!r}: expected {expected.strip()}, got {shown}")
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Check the fast date parser against a corpus")
+    ap.add_argument("--check", default=CORPUS_PATH)
+    opts = ap.parse_args()
+
+    failed = check(opts.check)
+    for f in failed:
+        print("FAIL", f)
+    print(f"{len(failed)} failure(s)")
+    raise SystemExit(1 if failed else 0)
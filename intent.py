@@ -0,0 +1,163 @@
+# intent.py
+"""
+In-process intent classifier for the router.
+
+Character n-gram TF-IDF features + nearest-centroid (cosine) over the three
+router branches.  Pure Python on sparse dicts – a prediction is a few hundred
+dict lookups, well under a millisecond, so most turns never pay for the
+routing LLM call.
+
+    python intent.py --eval data/router_holdout.tsv     # per-branch precision
+"""
+import math, os, re
+from collections import Counter, defaultdict
+
+TRAIN_PATH = os.getenv("ROUTER_TRAIN_PATH",
+                       os.path.join(os.path.dirname(__file__), "data", "router_intents.tsv"))
+NGRAM_RANGE = (2, 4)
+SOFTMAX_SCALE = 10.0      # sharpens cosine scores into a confidence
+
+_ws = re.compile(r"\s+")
+
+
+def load_examples(path: str) -> tuple[list[str], list[str]]:
+    """Read `label<TAB>text` lines; `#` starts a comment line."""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, _, text = line.partition("\t")
+            texts.append(text)
+            labels.append(label.strip())
+    return texts, labels
+
+
+def _ngrams(text: str) -> Counter:
+    t = " " + _ws.sub(" ", text.lower().strip()) + " "
+    grams: Counter = Counter()
+    lo, hi = NGRAM_RANGE
+    for n in range(lo, hi + 1):
+        for i in range(len(t) - n + 1):
+            grams[t[i:i + n]] += 1
+    return grams
+
+
+def _normalise(vec: dict) -> dict:
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    return {k: v / norm for k, v in vec.items()} if norm else vec
+
+
+class IntentClassifier:
+    def __init__(self):
+        self.idf: dict[str, float] = {}
+        self.centroids: dict[str, dict[str, float]] = {}
+
+    # ── training ─────────────────────────────────────────────────────
+    def fit(self, texts: list[str], labels: list[str]) -> "IntentClassifier":
+        docs = [_ngrams(t) for t in texts]
+        df: Counter = Counter()
+        for d in docs:
+            df.update(d.keys())
+        n_docs = len(docs)
+        self.idf = {g: math.log((1 + n_docs) / (1 + c)) + 1 for g, c in df.items()}
+
+        sums: dict[str, dict] = defaultdict(lambda: defaultdict(float))
+        for d, label in zip(docs, labels):
+            for g, w in self._vectorise(d).items():
+                sums[label][g] += w
+        self.centroids = {label: _normalise(vec) for label, vec in sums.items()}
+        return self
+
+    @classmethod
+    def from_file(cls, path: str = TRAIN_PATH) -> "IntentClassifier":
+        return cls().fit(*load_examples(path))
+
+    # ── inference ────────────────────────────────────────────────────
+    def _vectorise(self, grams: Counter) -> dict:
+        vec = {g: (1 + math.log(c)) * self.idf[g] for g, c in grams.items() if g in self.idf}
+        return _normalise(vec)
+
+    def scores(self, text: str) -> dict[str, float]:
+        """Softmax-scaled cosine similarity to every branch centroid."""
+        vec = self._vectorise(_ngrams(text))
+        cos = {
+            label: sum(w * centroid.get(g, 0.0) for g, w in vec.items())
+            for label, centroid in self.centroids.items()
+        }
+        exp = {label: math.exp(SOFTMAX_SCALE * c) for label, c in cos.items()}
+        z = sum(exp.values())
+        return {label: e / z for label, e in exp.items()}
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Return (branch, confidence in [0, 1])."""
+        scores = self.scores(text)
+        label = max(scores, key=scores.get)
+        return label, scores[label]
+
+
+def evaluate(clf: IntentClassifier, path: str, threshold: float = 0.0) -> dict:
+    """
+    Per-branch precision / recall on a held-out file.  Predictions below
+    `threshold` count as deferred (they would go to the LLM router).
+    """
+    texts, labels = load_examples(path)
+    tp, fp, fn = Counter(), Counter(), Counter()
+    deferred = 0
+    for text, gold in zip(texts, labels):
+        pred, conf = clf.predict(text)
+        if conf < threshold:
+            deferred += 1
+            continue
+        if pred == gold:
+            tp[gold] += 1
+        else:
+            fp[pred] += 1
+            fn[gold] += 1
+    report = {}
+    for label in sorted(set(labels) | set(clf.centroids)):
+        p_den, r_den = tp[label] + fp[label], tp[label] + fn[label]
+        report[label] = {
+            "precision": round(tp[label] / p_den, 3) if p_den else None,
+            "recall":    round(tp[label] / r_den, 3) if r_den else None,
+            "support":   labels.count(label),
+        }
+    report["_deferred"] = deferred
+    report["_total"] = len(texts)
+    return report
+
+
+# ── process-wide instance, trained once on first use / at startup ────
+_classifier: IntentClassifier | None = None
+
+def classifier() -> IntentClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = IntentClassifier.from_file(TRAIN_PATH)
+    return _classifier
+
+
+if __name__ == "__main__":
+    import argparse, time
+
+    ap = argparse.ArgumentParser(description="Evaluate the router intent classifier")
+    ap.add_argument("--train", default=TRAIN_PATH)
+    ap.add_argument("--eval", required=True, help="held-out label<TAB>text file")
+    ap.add_argument("--threshold", type=float,
+                    default=float(os.getenv("ROUTER_CONFIDENCE", "0.5")))
+    opts = ap.parse_args()
+
+    clf = IntentClassifier.from_file(opts.train)
+    rep = evaluate(clf, opts.eval, opts.threshold)
+    print(f"{'branch':<18}{'precision':>10}{'recall':>10}{'support':>9}")
+    for label, row in rep.items():
+        if not label.startswith("_"):
+            print(f"{label:<18}{str(row['precision']):>10}{str(row['recall']):>10}{row['support']:>9}")
+    print(f"deferred to LLM: {rep['_deferred']}/{rep['_total']} (threshold {opts.threshold})")
+
+    texts, _ = load_examples(opts.eval)
+    t0 = time.perf_counter()
+    for t in texts:
+        clf.predict(t)
+    print(f"mean predict: {(time.perf_counter() - t0) / len(texts) * 1e6:.0f} µs")
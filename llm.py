@@ -0,0 +1,376 @@
+# llm.py
+"""
+Shared LLM client layer – `utils.init_llm()` hands out clients from here.
+
+• one chat client per (model, temperature, streaming); all of them share a
+  single keep-alive httpx pool
+• single-flight: identical in-flight calls (same model, temperature and
+  prompt hash) share one upstream request; streamed calls share one upstream
+  stream that every caller replays
+• opt-in exact-match response cache for temperature-0 calls (LLM_CACHE=1),
+  LRU-bounded, with hit/miss stats
+• every upstream call holds a slot of the `openai` bulkhead
+• per-agent metrics via the `LLMMetrics` callback
+"""
+import asyncio, copy, hashlib, json, os, threading, time
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+import bulkhead
+import telemetry
+from cache import TTLCache, SingleFlight, AsyncSingleFlight
+
+MODEL = os.getenv("OPENAI_MODEL_NAME", "gpt-4o")
+
+CACHE_ENABLED = os.getenv("LLM_CACHE", "0") == "1"
+response_cache = TTLCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2048)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    default_ttl=float(os.getenv("LLM_CACHE_TTL", 3600)),
+    sizeof=lambda v: len(repr(v)),
+)
+
+LLM_REQUESTS = telemetry.registry.counter(
+    "llm_requests_total", "LLM calls by outcome (upstream / coalesced / cache_hit)", ("outcome",))
+
+_sync_flight = SingleFlight()
+_async_flight = AsyncSingleFlight()
+_streams: dict = {}          # request key -> _Broadcast of the in-flight stream
+
+
+def prompt_hash(messages) -> str:
+    """Stable hash of a chat prompt – how replay.py matches recorded outputs."""
+    payload = [(m.type, m.content, m.additional_kwargs) for m in messages]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _record(agent: str, prompt: str | None, response, seconds: float, partial: bool) -> None:
+    gen = next((g for gens in response.generations for g in gens), None)
+    msg = getattr(gen, "message", None)
+    if msg is None:
+        return
+    telemetry.record_event("llm", agent=agent, prompt=prompt, ms=round(seconds * 1000, 2),
+                           partial=partial, content=msg.content,
+                           additional_kwargs=msg.additional_kwargs)
+
+
+# ── metrics callback ─────────────────────────────────────────────────
+class LLMMetrics(BaseCallbackHandler):
+    """
+    Per-agent call latency, time-to-first-token and token usage → telemetry;
+    outputs go to the turn's recording when profiling.py records one.
+    """
+    run_inline = True        # stay on the caller's context (trace timeline)
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._runs: dict = {}            # run_id -> [start, first_token_at, prompt_hash]
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kw):
+        prompt = prompt_hash(messages[0]) if telemetry.recording() else None
+        self._runs[run_id] = [time.perf_counter(), None, prompt]
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kw):
+        self._runs[run_id] = [time.perf_counter(), None, None]
+
+    def on_llm_new_token(self, token, *, run_id, **kw):
+        run = self._runs.get(run_id)
+        if run is not None and run[1] is None:
+            run[1] = time.perf_counter()
+            telemetry.LLM_TTFT.observe(run[1] - run[0], agent=self.agent)
+
+    def on_llm_end(self, response, *, run_id, **kw):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        dt = time.perf_counter() - run[0]
+        telemetry.LLM_SECONDS.observe(dt, agent=self.agent)
+        telemetry.record_stage(f"llm:{self.agent}", run[0], dt)
+        if telemetry.recording():
+            _record(self.agent, run[2], response, dt, partial=False)
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if prompt is None:          # streamed calls report usage on the message
+            for gens in response.generations:
+                for g in gens:
+                    meta = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                    prompt = (prompt or 0) + meta.get("input_tokens", 0)
+                    completion = (completion or 0) + meta.get("output_tokens", 0)
+        if prompt:
+            telemetry.LLM_TOKENS.inc(prompt, agent=self.agent, kind="prompt")
+        if completion:
+            telemetry.LLM_TOKENS.inc(completion, agent=self.agent, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, response=None, **kw):
+        run = self._runs.pop(run_id, None)
+        # a stream closed early (the router) ends here with what it had so far
+        if run is not None and response is not None and telemetry.recording():
+            _record(self.agent, run[2], response, time.perf_counter() - run[0], partial=True)
+
+
+# ── reuse helpers: callers that didn't pay for a call don't count its tokens ──
+def _reused_result(result):
+    result = copy.deepcopy(result)
+    if result.llm_output:
+        result.llm_output = {**result.llm_output, "token_usage": {}}
+    for g in result.generations:
+        if getattr(g, "message", None) is not None:
+            g.message.usage_metadata = None
+    return result
+
+def _reused_chunk(chunk):
+    chunk = copy.deepcopy(chunk)
+    chunk.message.usage_metadata = None
+    return chunk
+
+
+class _Broadcast:
+    """One upstream stream, replayed to every caller that asked for the same request."""
+
+    def __init__(self):
+        self.chunks: list = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.listeners = 0
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk) -> None:
+        self.chunks.append(chunk)
+        self._wake()
+
+    def close(self, error: BaseException | None = None) -> None:
+        self.done, self.error = True, error
+        self._wake()
+
+    async def follow(self):
+        self.listeners += 1
+        i = 0
+        try:
+            while True:
+                while i < len(self.chunks):
+                    i += 1
+                    yield self.chunks[i - 1]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.listeners -= 1
+            if self.listeners == 0 and not self.done and self.task is not None:
+                self.task.cancel()          # nobody is reading any more
+
+
+class SharedCalls:
+    """
+    Mixin for a LangChain chat model: bulkhead + single-flight + temperature-0
+    response cache around the provider's _generate / _stream hooks.
+    """
+
+    def _request_key(self, kind: str, messages, stop, kwargs) -> str:
+        payload = [
+            kind, getattr(self, "model_name", type(self).__name__),
+            getattr(self, "temperature", None),
+            [(m.type, m.content, m.additional_kwargs) for m in messages],
+            stop, kwargs,
+        ]
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _cacheable(self) -> bool:
+        return CACHE_ENABLED and getattr(self, "temperature", None) == 0
+
+    def _cached(self, key: str):
+        if not self._cacheable():
+            return None
+        hit = response_cache.get(key)
+        if hit is not None:
+            LLM_REQUESTS.inc(outcome="cache_hit")
+        return hit
+
+    # ── plain calls ──────────────────────────────────────────────────
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._request_key("generate", messages, stop, kwargs)
+        hit = self._cached(key)
+        if hit is not None:
+            return _reused_result(hit)
+
+        upstream, called = super()._generate, []
+
+        def call():
+            called.append(True)
+            with bulkhead.get("openai").sync_slot():
+                return upstream(messages, stop, run_manager, **kwargs)
+
+        result = _sync_flight.do(key, call)
+        return self._settle(key, result, leader=bool(called))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._request_key("generate", messages, stop, kwargs)
+        hit = self._cached(key)
+        if hit is not None:
+            return _reused_result(hit)
+
+        upstream, called = super()._agenerate, []
+
+        async def call():
+            called.append(True)
+            async with bulkhead.get("openai").slot():
+                return await upstream(messages, stop, run_manager, **kwargs)
+
+        result = await _async_flight.do(key, call)
+        return self._settle(key, result, leader=bool(called))
+
+    def _settle(self, key: str, result, leader: bool):
+        if not leader:
+            LLM_REQUESTS.inc(outcome="coalesced")
+            return _reused_result(result)
+        LLM_REQUESTS.inc(outcome="upstream")
+        if self._cacheable():
+            response_cache.set(key, result)
+        return result
+
+    # ── streamed calls ───────────────────────────────────────────────
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # sync streaming is the single-user REPL path: bulkhead only
+        LLM_REQUESTS.inc(outcome="upstream")
+        with bulkhead.get("openai").sync_slot():
+            yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._request_key("stream", messages, stop, kwargs)
+        hit = self._cached(key)
+        if hit is not None:
+            for chunk in hit:
+                chunk = _reused_chunk(chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        bc = _streams.get(key)
+        leader = bc is None
+        if leader:
+            LLM_REQUESTS.inc(outcome="upstream")
+            bc = _streams[key] = _Broadcast()
+            upstream = super()._astream(messages, stop, run_manager, **kwargs)
+            bc.task = asyncio.get_running_loop().create_task(self._pump(key, bc, upstream))
+        else:
+            LLM_REQUESTS.inc(outcome="coalesced")
+
+        async for chunk in bc.follow():
+            if not leader:      # the upstream call reports tokens to the leader only
+                chunk = _reused_chunk(chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _pump(self, key: str, bc: _Broadcast, upstream) -> None:
+        try:
+            async with bulkhead.get("openai").slot():
+                async for chunk in upstream:
+                    bc.publish(chunk)
+            bc.close()
+            if self._cacheable():
+                response_cache.set(key, list(bc.chunks))
+        except asyncio.CancelledError:
+            bc.close(asyncio.CancelledError())
+        except BaseException as e:
+            bc.close(e)
+        finally:
+            if _streams.get(key) is bc:
+                del _streams[key]
+
+
+# ── one keep-alive pool for every client ─────────────────────────────
+_http = None
+
+def _http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    global _http
+    if _http is None:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=30,
+        )
+        timeout = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", 60)), connect=5.0)
+        _http = (httpx.Client(limits=limits, timeout=timeout),
+                 httpx.AsyncClient(limits=limits, timeout=timeout))
+    return _http
+
+
+_pooled_cls = None
+
+def _chat_openai_cls():
+    global _pooled_cls
+    if _pooled_cls is None:
+        from langchain_openai import ChatOpenAI     # deferred: the openai SDK is slow to import
+
+        class PooledChatOpenAI(SharedCalls, ChatOpenAI):
+            """ChatOpenAI on the shared pool, with coalescing / caching / bulkhead."""
+
+        _pooled_cls = PooledChatOpenAI
+    return _pooled_cls
+
+
+# ── factory ──────────────────────────────────────────────────────────
+_llm_factory = None
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+def set_llm_factory(factory) -> None:
+    """
+    Swap the chat model handed out by init_llm (benchmarks, replays).
+    `factory(temperature=…, streaming=…)` must return a LangChain chat model;
+    call before the agents are imported.  None restores ChatOpenAI.
+    """
+    global _llm_factory
+    _llm_factory = factory
+    _clients.clear()
+
+def _build(temperature: float, streaming: bool, model: str):
+    if _llm_factory is not None:
+        return _llm_factory(temperature=temperature, streaming=streaming)
+    http_client, http_async_client = _http_clients()
+    return _chat_openai_cls()(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=model,
+        temperature=temperature,
+        streaming=streaming,   # nice UX; safe in LangGraph
+        stream_usage=True,     # token counts on streamed calls too
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+def shared_llm(temperature: float = 0.2, streaming: bool = True, model: str | None = None):
+    """The process-wide client for this config (built on first use)."""
+    model = model or MODEL
+    key = (model, temperature, streaming)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build(temperature, streaming, model)
+    return client
+
+def init_llm(temperature: float = 0.2, streaming: bool = True, agent: str = "default",
+             model: str | None = None):
+    """
+    Return the shared chat client for this config, metered as `agent`.
+    `model` pins a model name; by default OPENAI_MODEL_NAME (gpt-4o).
+    """
+    return shared_llm(temperature, streaming, model).with_config(callbacks=[LLMMetrics(agent)])
+
+def stats() -> dict:
+    return {
+        "clients": len(_clients),
+        "response_cache": {**response_cache.stats(), "enabled": CACHE_ENABLED},
+        "coalesced": _sync_flight.shared + _async_flight.shared,
+        "streams_in_flight": len(_streams),
+    }
@@ -1,6 +1,4 @@
 from orchestrator import build_graph
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 
 graph = build_graph()
 
@@ -9,6 +7,6 @@ while True:
     if q.lower() in {"exit", "quit"}:
         break
     state = None
-    for step in graph.stream({"question": q}, stream_mode="values"):
+    for step in graph.stream({"question": q, "session_id": "cli"}, stream_mode="values"):
         state = step
     print("\nAgent ➜", state["answer"])
\ No newline at end of file
@@ -0,0 +1,409 @@
+# mcp_client.py
+"""
+Shared, pooled client for the MCP tool hub.
+
+One `MCPClient` per process keeps a keep-alive connection pool (sync and
+async), applies per-tool timeouts and retries transient failures with
+exponential back-off + full jitter.  `batch` / `abatch` hit `/mcp/batch` so
+several tool calls cost a single round trip.
+
+With MCP_TRANSPORT=local the tools/ modules run in this process instead
+(hub co-located with the chat service, tests): arguments are validated once,
+results are handed back without JSON and there is no HTTP hop.
+"""
+import asyncio, atexit, math, os, random, threading, time
+import httpx
+from dotenv import load_dotenv
+import telemetry
+import bulkhead
+import tools
+
+load_dotenv()
+
+MCP_BASE = os.getenv("MCP_BASE", "http://localhost:9000/mcp")
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "http")       # http | local
+
+DEFAULT_TIMEOUT = float(os.getenv("MCP_TIMEOUT", "15"))
+# per-tool overrides, also settable as MCP_TIMEOUT_<TOOL>=seconds
+TOOL_TIMEOUTS = {
+    "get_budget":    10.0,
+    "save_proposal": 30.0,
+}
+
+MAX_RETRIES = int(os.getenv("MCP_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("MCP_BACKOFF_BASE", "0.2"))   # seconds
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Tools that must not be replayed once the request reached the hub (a retry
+# after a 5xx could write twice).  They are only retried on connect errors.
+NON_IDEMPOTENT = {"save_proposal"}
+
+
+MCP_CALL_SECONDS = telemetry.registry.histogram(
+    "mcp_client_call_seconds", "MCP call latency seen by the caller (incl. retries)", ("tool",))
+
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+def _headers() -> dict:
+    # trace id + what is left of the caller's deadline, so the hub sheds
+    # work nobody will wait for
+    headers = {}
+    tid = telemetry.current_trace_id()
+    if tid:
+        headers[telemetry.TRACE_HEADER] = tid
+    left = bulkhead.remaining()
+    if not math.isinf(left):
+        headers[DEADLINE_HEADER] = str(max(0, int(left * 1000)))
+    return headers
+
+
+class MCPToolError(RuntimeError):
+    """A tool invocation failed on the hub side."""
+
+
+def _raise_shed(resp: httpx.Response) -> None:
+    """Hub answered 429/503 + Retry-After → surface it as bulkhead.Rejected."""
+    if resp.status_code in (429, 503) and "Retry-After" in resp.headers:
+        reason = "queue_full" if resp.status_code == 429 else "timeout"
+        raise bulkhead.Rejected("mcp-hub", reason, float(resp.headers["Retry-After"]))
+
+
+class LocalTransport:
+    """
+    Calls the tools/ modules in-process through tools.call_tool.  Async
+    callers run the tool on their own loop; sync callers hand it to one
+    background loop.  Results may be shared with the tool caches – read only.
+    """
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        # what the hub would do at its startup / shutdown
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                tools.discover()
+                for fn in tools.STARTUP:
+                    fn()
+                atexit.register(self._shutdown)
+                self._started = True
+
+    @staticmethod
+    def _shutdown() -> None:
+        for fn in tools.SHUTDOWN:
+            fn()
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="mcp-local",
+                                     daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    async def _call(self, tool: str, arguments: dict):
+        self._start()
+        if tool not in tools.TOOLS:
+            raise MCPToolError(f"Unknown tool '{tool}'")
+        try:
+            return await tools.call_tool(tool, arguments)
+        except bulkhead.Rejected:
+            raise
+        except Exception as e:
+            raise MCPToolError(f"{tool}: {e}") from e
+
+    async def ainvoke(self, tool: str, arguments: dict, timeout: float):
+        return await asyncio.wait_for(self._call(tool, arguments), timeout)
+
+    def invoke(self, tool: str, arguments: dict, timeout: float):
+        # scheduled from this thread, so the task inherits the trace id / deadline
+        fut = asyncio.run_coroutine_threadsafe(self._call(tool, arguments),
+                                               self._background_loop())
+        try:
+            return fut.result(timeout)
+        except TimeoutError:
+            fut.cancel()
+            raise
+
+    async def abatch(self, calls: list[dict]) -> list[dict]:
+        self._start()
+        return await tools.call_batch(calls)
+
+    def batch(self, calls: list[dict], timeout: float) -> list[dict]:
+        return asyncio.run_coroutine_threadsafe(
+            self.abatch(calls), self._background_loop()).result(timeout)
+
+
+def _http2_available() -> bool:
+    if os.getenv("MCP_HTTP2", "1") == "0":
+        return False
+    try:
+        import h2  # noqa: F401  (optional: pip install httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+class MCPClient:
+    def __init__(
+        self,
+        base_url: str = MCP_BASE,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF_BASE,
+        http2: bool | None = None,
+        transport: str = MCP_TRANSPORT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30,
+        )
+        # HTTP/2 is negotiated via ALPN, i.e. only takes effect on https hubs
+        self._http2 = _http2_available() if http2 is None else http2
+        self._transport = None
+        self._async_transport = None
+        self._client: httpx.Client | None = None
+        self._aclient: httpx.AsyncClient | None = None
+        self.bulkhead = bulkhead.get("mcp")
+        self.local: LocalTransport | None = LocalTransport() if transport == "local" else None
+
+    def use_local(self, enabled: bool = True) -> None:
+        """Run tools in-process (True) or call the hub over HTTP (False)."""
+        self.local = LocalTransport() if enabled else None
+
+    def set_transport(self, transport=None, async_transport=None) -> None:
+        """
+        Send calls through custom httpx transports, e.g.
+        httpx.ASGITransport(app=mcp_tools.app) to reach an in-process hub.
+        """
+        self.close()
+        self._aclient = None
+        self._transport = transport
+        self._async_transport = async_transport
+
+    # ── pooled transports (created on first use) ─────────────────────
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(
+                base_url=self.base_url, limits=self._limits,
+                http2=self._http2, timeout=DEFAULT_TIMEOUT,
+                transport=self._transport,
+            )
+        return self._client
+
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                base_url=self.base_url, limits=self._limits,
+                http2=self._http2, timeout=DEFAULT_TIMEOUT,
+                transport=self._async_transport,
+            )
+        return self._aclient
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    # ── helpers ──────────────────────────────────────────────────────
+    @staticmethod
+    def timeout_for(tool: str) -> float:
+        env = os.getenv(f"MCP_TIMEOUT_{tool.upper()}")
+        if env:
+            return float(env)
+        return TOOL_TIMEOUTS.get(tool, DEFAULT_TIMEOUT)
+
+    def _timeout(self, tool: str, timeout: float | None) -> float:
+        # never wait on the hub past the caller's own deadline
+        return max(0.1, min(timeout or self.timeout_for(tool), bulkhead.remaining()))
+
+    def _delay(self, attempt: int) -> float:
+        # full jitter: spread concurrent retries instead of synchronising them
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _should_retry(self, tool: str, attempt: int, exc: Exception | None,
+                      resp: httpx.Response | None) -> bool:
+        if attempt >= self.retries:
+            return False
+        if isinstance(exc, httpx.ConnectError | httpx.ConnectTimeout):
+            return True            # never reached the hub → always safe
+        if tool in NON_IDEMPOTENT:
+            return False
+        if exc is not None:
+            return isinstance(exc, httpx.TransportError)
+        if resp is not None and "Retry-After" in resp.headers:
+            return False           # hub shed the call – retrying now adds load
+        return resp is not None and resp.status_code in RETRY_STATUSES
+
+    @staticmethod
+    def _result(resp: httpx.Response):
+        _raise_shed(resp)
+        resp.raise_for_status()
+        return resp.json()["result"]
+
+    # ── single invocation ────────────────────────────────────────────
+    @staticmethod
+    def _record(tool: str, arguments: dict, t0: float, result=None, error=None) -> None:
+        # profiled turns keep every tool result so replay.py can serve it back
+        if telemetry.recording():
+            telemetry.record_event("tool", tool=tool, arguments=arguments,
+                                   ms=round((time.perf_counter() - t0) * 1000, 2),
+                                   **({"error": str(error)} if error is not None
+                                      else {"result": result}))
+
+    def invoke(self, tool: str, arguments: dict, timeout: float | None = None):
+        t0 = time.perf_counter()
+        try:
+            with telemetry.span(f"mcp:{tool}", MCP_CALL_SECONDS, tool=tool):
+                if self.local is not None:      # the hub's own bulkheads still apply
+                    result = self.local.invoke(tool, arguments, self._timeout(tool, timeout))
+                else:
+                    with self.bulkhead.sync_slot():
+                        result = self._invoke(tool, arguments, timeout)
+        except Exception as e:
+            self._record(tool, arguments, t0, error=e)
+            raise
+        self._record(tool, arguments, t0, result)
+        return result
+
+    async def ainvoke(self, tool: str, arguments: dict, timeout: float | None = None):
+        t0 = time.perf_counter()
+        try:
+            with telemetry.span(f"mcp:{tool}", MCP_CALL_SECONDS, tool=tool):
+                if self.local is not None:
+                    result = await self.local.ainvoke(tool, arguments,
+                                                      self._timeout(tool, timeout))
+                else:
+                    async with self.bulkhead.slot():
+                        result = await self._ainvoke(tool, arguments, timeout)
+        except Exception as e:
+            self._record(tool, arguments, t0, error=e)
+            raise
+        self._record(tool, arguments, t0, result)
+        return result
+
+    def _invoke(self, tool: str, arguments: dict, timeout: float | None):
+        timeout = self._timeout(tool, timeout)
+        attempt = 0
+        while True:
+            exc = resp = None
+            try:
+                resp = self.client.post(f"/{tool}/invoke",
+                                        json={"arguments": arguments},
+                                        headers=_headers(),
+                                        timeout=timeout)
+            except httpx.TransportError as e:
+                exc = e
+            if not self._should_retry(tool, attempt, exc, resp):
+                if exc is not None:
+                    raise exc
+                return self._result(resp)
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def _ainvoke(self, tool: str, arguments: dict, timeout: float | None):
+        timeout = self._timeout(tool, timeout)
+        attempt = 0
+        while True:
+            exc = resp = None
+            try:
+                resp = await self.aclient.post(f"/{tool}/invoke",
+                                               json={"arguments": arguments},
+                                               headers=_headers(),
+                                               timeout=timeout)
+            except httpx.TransportError as e:
+                exc = e
+            if not self._should_retry(tool, attempt, exc, resp):
+                if exc is not None:
+                    raise exc
+                return self._result(resp)
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    # ── batched invocation (one round trip, run concurrently on the hub) ──
+    @staticmethod
+    def _batch_payload(calls: list[dict]) -> dict:
+        return {"calls": [{"tool": c["tool"], "arguments": c.get("arguments", {})}
+                          for c in calls]}
+
+    @classmethod
+    def _unpack(cls, calls: list[dict], items: list[dict], t0: float,
+                return_exceptions: bool) -> list:
+        for call, item in zip(calls, items):
+            cls._record(call["tool"], call.get("arguments", {}), t0,
+                        item.get("result"), item.get("error"))
+        out = []
+        for item in items:
+            if "error" in item:
+                err = MCPToolError(f"{item.get('tool')}: {item['error']}")
+                if not return_exceptions:
+                    raise err
+                out.append(err)
+            else:
+                out.append(item["result"])
+        return out
+
+    def _batch_timeout(self, calls: list[dict]) -> float:
+        return max((self.timeout_for(c["tool"]) for c in calls), default=DEFAULT_TIMEOUT)
+
+    def batch(self, calls: list[dict], return_exceptions: bool = False) -> list:
+        """calls = [{"tool": "get_budget", "arguments": {"day": "2025-07-01"}}, …]"""
+        if not calls:
+            return []
+        t0 = time.perf_counter()
+        if self.local is not None:
+            with telemetry.span("mcp:batch", MCP_CALL_SECONDS, tool="batch"):
+                items = self.local.batch(self._batch_payload(calls)["calls"],
+                                         self._batch_timeout(calls))
+            return self._unpack(calls, items, t0, return_exceptions)
+        with telemetry.span("mcp:batch", MCP_CALL_SECONDS, tool="batch"), \
+                self.bulkhead.sync_slot():
+            resp = self.client.post("/batch", json=self._batch_payload(calls),
+                                    headers=_headers(),
+                                    timeout=self._batch_timeout(calls))
+        _raise_shed(resp)
+        resp.raise_for_status()
+        return self._unpack(calls, resp.json()["results"], t0, return_exceptions)
+
+    async def abatch(self, calls: list[dict], return_exceptions: bool = False) -> list:
+        if not calls:
+            return []
+        t0 = time.perf_counter()
+        if self.local is not None:
+            with telemetry.span("mcp:batch", MCP_CALL_SECONDS, tool="batch"):
+                items = await asyncio.wait_for(
+                    self.local.abatch(self._batch_payload(calls)["calls"]),
+                    self._batch_timeout(calls))
+            return self._unpack(calls, items, t0, return_exceptions)
+        with telemetry.span("mcp:batch", MCP_CALL_SECONDS, tool="batch"):
+            async with self.bulkhead.slot():
+                resp = await self.aclient.post("/batch", json=self._batch_payload(calls),
+                                               headers=_headers(),
+                                               timeout=self._batch_timeout(calls))
+        _raise_shed(resp)
+        resp.raise_for_status()
+        return self._unpack(calls, resp.json()["results"], t0, return_exceptions)
+
+
+# shared instance – import this rather than building new clients
+client = MCPClient()
@@ -1,10 +1,14 @@
 # mcp_tools.py
-import importlib, pkgutil
-from fastapi import FastAPI, APIRouter, HTTPException
+import math, os, time
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import uvicorn
-import inspect
+import telemetry
+import bulkhead
+import tools
+from tools import call_tool
 
 load_dotenv()
 
@@ -12,13 +16,40 @@ app = FastAPI(title="MCP-Tool-Hub")
 mcp = APIRouter(prefix="/mcp")          # renamed var for clarity
 app.include_router(mcp)
 
+# tools.TOOLS (name -> (Args model, run fn)) and tools.call_tool are shared
+# by the routes below and by mcp_client's in-process transport
+
+# ── trace id from the chat service (X-Trace-Id) → per-request stage log ──
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+
+@app.middleware("http")
+async def _trace(request: Request, call_next):
+    telemetry.start_trace(request.headers.get(telemetry.TRACE_HEADER))
+    deadline_ms = request.headers.get("X-Deadline-Ms")      # set by mcp_client
+    if deadline_ms:
+        try:
+            deadline = float(deadline_ms) / 1000
+        except ValueError:
+            deadline = math.nan
+        if not math.isfinite(deadline):
+            return JSONResponse({"detail": f"bad X-Deadline-Ms: {deadline_ms[:32]!r}"},
+                                status_code=400)
+        bulkhead.set_deadline(deadline)
+    else:
+        bulkhead.set_deadline(None)
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    response.headers[telemetry.TRACE_HEADER] = telemetry.current_trace_id()
+    if TRACE_LOG and request.url.path.startswith("/mcp/"):
+        telemetry.log_trace("mcp-hub", time.perf_counter() - t0, path=request.url.path)
+    return response
+
 def register_tool_pkg(mod):
     name = mod.__name__.split(".")[-1]
     schema_route = f"/{name}/schema"
     invoke_route = f"/{name}/invoke"
 
     args_model: BaseModel = mod.Args      # type: ignore[attr-defined]
-    run_fn = mod.run
 
     @mcp.get(schema_route)
     async def schema():
@@ -28,22 +59,34 @@ def register_tool_pkg(mod):
     async def invoke(payload: dict):
         if "arguments" not in payload:
             raise HTTPException(422, detail="Missing 'arguments'")
-        args = args_model(**payload["arguments"])
-        result = run_fn(**args.dict())
+        try:
+            return {"result": await call_tool(name, payload["arguments"])}
+        except ValueError as e:           # incl. pydantic ValidationError
+            raise HTTPException(422, detail=str(e))
 
-        # if the tool returned a coroutine, await it
-        if inspect.iscoroutine(result):
-            result = await result
+    print(f"Registered MCP tool: {name}")
 
-        return {"result": result}
+# overloaded dependency → fast 429 / 503 with Retry-After instead of a hang
+@app.exception_handler(bulkhead.Rejected)
+async def _shed(request: Request, exc: bulkhead.Rejected):
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status,
+                        headers={"Retry-After": str(exc.retry_after)})
 
-    print(f"Registered MCP tool: {name}")
+# auto-discover (tools/__init__.py): tool modules get routes; modules
+# exposing `stats()` are served at /stats, `startup()` / `shutdown()` run
+# with the hub's lifecycle
+tools.discover()
+for mod in tools.MODULES.values():
+    register_tool_pkg(mod)
+STATS: dict = {"bulkheads": bulkhead.stats, **tools.STATS}
 
-# auto-discover
-for _, module_name, _ in pkgutil.iter_modules(["tools"]):
-    mod = importlib.import_module(f"tools.{module_name}")
-    if hasattr(mod, "Args") and hasattr(mod, "run"):
-        register_tool_pkg(mod)
+# ── batch invoke: several tool calls, run concurrently, one round trip ──
+@mcp.post("/batch")
+async def batch(payload: dict):
+    calls = payload.get("calls")
+    if not isinstance(calls, list):
+        raise HTTPException(422, detail="Missing 'calls'")
+    return {"results": await tools.call_batch(calls)}
 
 # include the router **after** all tools are registered
 app.include_router(mcp)
@@ -55,5 +98,25 @@ def manifest():
         for r in app.routes if r.path.endswith("/schema")
     ]
 
+@app.on_event("startup")
+async def _startup_hooks():
+    for fn in tools.STARTUP:
+        fn()
+
+@app.on_event("shutdown")
+async def _shutdown_hooks():
+    # e.g. flush the proposal write-behind queue before exiting
+    for fn in tools.SHUTDOWN:
+        fn()
+
+@app.get("/stats")
+def stats():
+    return {name: fn() for name, fn in STATS.items()}
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(telemetry.registry.render(),
+                             media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=9000)
@@ -1,7 +1,206 @@
-# memory.py  (new helper file)
-from collections import deque
-from langchain_core.messages import HumanMessage, AIMessage
+# memory.py
+"""
+Session-scoped conversation history.
 
-MAX_TURNS = 20        # keep the last 20 exchanges
+Every chat session gets its own `SessionHistory`, trimmed by token count
+rather than turn count so the prompt size per call stays bounded.  Turns
+that fall off the window are folded into a rolling digest that is replayed
+as a single system message (extractive by default, LLM-summarised when
+MEMORY_SUMMARIZE=1).
+"""
+import os, threading
+from collections import OrderedDict
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (
+    BaseMessage, HumanMessage, AIMessage, SystemMessage,
+    messages_from_dict, messages_to_dict,
+)
 
-history: deque = deque(maxlen=MAX_TURNS)   # shared inside the process
\ No newline at end of file
+MAX_HISTORY_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", 1500))   # per session window
+DIGEST_MAX_TOKENS = int(os.getenv("MEMORY_DIGEST_TOKENS", 250))
+MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", 10_000))     # in-process LRU
+SUMMARIZE = os.getenv("MEMORY_SUMMARIZE", "0") == "1"
+DEFAULT_SESSION = "default"
+
+_enc = None            # tiktoken encoding, loaded on first use (BPE file read)
+
+def count_tokens(text: str) -> int:
+    global _enc
+    if _enc is None:
+        try:
+            import tiktoken
+            _enc = tiktoken.get_encoding("o200k_base")
+        except Exception:             # tiktoken missing / encoding unavailable
+            _enc = False
+    if _enc is False:
+        return len(text) // 4 + 1
+    return len(_enc.encode(text, disallowed_special=()))
+
+
+def _role(m: BaseMessage) -> str:
+    return "User" if isinstance(m, HumanMessage) else "Assistant"
+
+
+class SessionHistory(BaseChatMessageHistory):
+    """Token-bounded window of turns plus a digest of everything older."""
+
+    def __init__(self, session_id: str, max_tokens: int = MAX_HISTORY_TOKENS):
+        self.session_id = session_id
+        self.max_tokens = max_tokens
+        self.turns: list[BaseMessage] = []
+        self._tokens: list[int] = []
+        self.digest = ""
+        self._pending: list[BaseMessage] = []     # trimmed, not yet summarised
+        self._unsaved: list[BaseMessage] = []     # added since the last persist
+        self._lock = threading.Lock()
+
+    # ── BaseChatMessageHistory API (what ConversationBufferMemory reads) ──
+    @property
+    def messages(self) -> list[BaseMessage]:
+        if self.digest:
+            return [SystemMessage(content=f"Earlier in this conversation: {self.digest}")] + self.turns
+        return list(self.turns)
+
+    def add_message(self, message: BaseMessage) -> None:
+        with self._lock:
+            self.turns.append(message)
+            self._tokens.append(count_tokens(message.content))
+            self._unsaved.append(message)
+            self._trim()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns, self._tokens, self._pending, self._unsaved = [], [], [], []
+            self.digest = ""
+
+    # ── window management ────────────────────────────────────────────
+    @property
+    def token_count(self) -> int:
+        return sum(self._tokens)
+
+    def _trim(self) -> None:
+        dropped = []
+        while len(self.turns) > 1 and sum(self._tokens) > self.max_tokens:
+            dropped.append(self.turns.pop(0))
+            self._tokens.pop(0)
+        if dropped:
+            self._pending.extend(dropped)
+            if not SUMMARIZE:
+                self.digest = self._extractive(dropped)
+
+    def _extractive(self, dropped: list[BaseMessage]) -> str:
+        # keep the most recent part of "digest + dropped turns" within budget
+        text = " ".join([self.digest] + [f"{_role(m)}: {m.content}" for m in dropped]).strip()
+        budget = DIGEST_MAX_TOKENS * 4
+        self._pending = []
+        return text if len(text) <= budget else "…" + text[-budget:]
+
+    def _summary_prompt(self) -> str:
+        lines = "\n".join(f"{_role(m)}: {m.content}" for m in self._pending)
+        return (
+            f"Update this running summary of a marketing-analytics chat in at most "
+            f"{DIGEST_MAX_TOKENS} tokens. Keep dates, channels, numbers and decisions.\n\n"
+            f"Summary so far: {self.digest or '(none)'}\n\nNew turns:\n{lines}"
+        )
+
+    def fold(self, llm) -> None:
+        """Summarise turns that fell off the window into the digest."""
+        if self._pending:
+            self.digest = llm.invoke(self._summary_prompt()).content
+            self._pending = []
+
+    async def afold(self, llm) -> None:
+        if self._pending:
+            self.digest = (await llm.ainvoke(self._summary_prompt())).content
+            self._pending = []
+
+    # ── persistence helpers ──────────────────────────────────────────
+    def drain_unsaved(self) -> list[BaseMessage]:
+        """Messages added since the last call – what a turn needs to persist."""
+        with self._lock:
+            out, self._unsaved = self._unsaved, []
+            return out
+
+    def snapshot(self) -> dict:
+        return {"messages": messages_to_dict(self.turns), "digest": self.digest}
+
+    def restore(self, messages: list, digest: str = "") -> None:
+        with self._lock:
+            self.turns = _as_messages(messages)
+            self._tokens = [count_tokens(m.content) for m in self.turns]
+            self.digest = digest
+            self._pending, self._unsaved = [], []
+            self._trim()
+
+
+def _as_messages(items: list) -> list[BaseMessage]:
+    """Accept message dicts, message objects or legacy bare strings."""
+    out: list[BaseMessage] = []
+    for i, item in enumerate(items):
+        if isinstance(item, BaseMessage):
+            out.append(item)
+        elif isinstance(item, dict):
+            out.extend(messages_from_dict([item]))
+        else:   # old snapshots stored plain text, alternating user / assistant
+            out.append(HumanMessage(content=str(item)) if i % 2 == 0 else AIMessage(content=str(item)))
+    return out
+
+
+class SessionStore:
+    """session_id → SessionHistory, LRU-bounded so idle sessions don't pile up."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, max_tokens: int = MAX_HISTORY_TOKENS):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self._sessions: OrderedDict[str, SessionHistory] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str | None) -> SessionHistory:
+        sid = session_id or DEFAULT_SESSION
+        with self._lock:
+            hist = self._sessions.get(sid)
+            if hist is None:
+                hist = self._sessions[sid] = SessionHistory(sid, self.max_tokens)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(sid)
+            return hist
+
+    def load(self, session_id: str, messages: list, digest: str = "") -> SessionHistory:
+        hist = self.get(session_id)
+        hist.restore(messages, digest)
+        return hist
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+
+sessions = SessionStore()          # shared inside the process
+
+
+_summarizer = None
+# on the summarizer's runs: /chat/stream must not send its tokens as the answer
+SUMMARIZER_TAG = "memory_summarizer"
+
+def summarizer():
+    """LLM used to fold old turns into the digest (only when MEMORY_SUMMARIZE=1)."""
+    global _summarizer
+    if _summarizer is None:
+        from utils import init_llm
+        _summarizer = init_llm(agent="summarizer").with_config(tags=[SUMMARIZER_TAG])
+    return _summarizer
+
+
+def after_turn(session_id: str) -> None:
+    if SUMMARIZE:
+        sessions.get(session_id).fold(summarizer())
+
+
+async def aafter_turn(session_id: str) -> None:
+    if SUMMARIZE:
+        await sessions.get(session_id).afold(summarizer())
@@ -1,17 +1,19 @@
-import json
-from typing import TypedDict, Literal
+import asyncio, contextvars, json, os, re, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import aclosing, closing
+from typing import Annotated, TypedDict, Literal
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
 from langchain_core.prompts import PromptTemplate
-from memory import history
+from langchain_core.runnables import RunnableLambda
+from memory import sessions, count_tokens, DEFAULT_SESSION
 
-from utils import init_llm, correct_json
-from agents import (
-    generic_bot,
-    web_search_agent as web,
-    budget_recommender_agent as budget,
-)
+from utils import init_llm
+import telemetry
+import bulkhead
+from intent import classifier
+import agents        # lazy registry: agent modules load on first use / warm()
 
 BUDGET_KEYWORDS = {"spend", "budget", "roas", "channel", "metrics"}
 
@@ -22,94 +24,350 @@ ROUTER_PROMPT = """
       • web_search            – factual or open-ended questions answerable via the web
       • generic               – greetings or off-topic
 
+    If the query clearly asks for two different things (e.g. our own metrics
+    AND something from the web), list both branches.
+
     Respond ONLY with JSON like: 
-    {{"next": "<branch>"}}
+    {{"next": "<branch>"}}   or   {{"next": ["budget_insights", "web_search"]}}
 
     User Query: {question}
     """
 
-llm = init_llm()
+# JSON mode and a tiny completion budget: the reply is one short object, and
+# the stream is dropped as soon as its `next` value is complete
+ROUTER_MAX_TOKENS = int(os.getenv("ROUTER_MAX_TOKENS", 24))
+
+_llm = None
+
+def router_llm():
+    global _llm
+    if _llm is None:
+        _llm = init_llm(temperature=0, agent="router").bind(
+            response_format={"type": "json_object"}, max_tokens=ROUTER_MAX_TOKENS)
+    return _llm
+
+# Local classifier answers when it is at least this confident; below it the
+# routing LLM decides.  Trained once, on first use or in warm().
+ROUTER_CONFIDENCE = float(os.getenv("ROUTER_CONFIDENCE", "0.5"))
 
 # ── State schema ──────────────────────────────────────────────────────────────
+def _merge_answers(left: dict | None, right: dict | None) -> dict:
+    return {**(left or {}), **(right or {})}
+
 class RouterState(TypedDict):
     question: str
+    session_id: str
     branch: str
     answer: str
     history: list
+    # multi-intent turns: one entry per branch, written concurrently by the
+    # fanned-out leaves and joined by merge_node
+    branches: list
+    sub_questions: dict
+    answers: Annotated[dict, _merge_answers]
 
 # ── Router node ───────────────────────────────────────────────────────────────
-def router(state: RouterState) -> Command:
-    prompt_tmpl = PromptTemplate.from_template(ROUTER_PROMPT)
-    
+prompt_tmpl = PromptTemplate.from_template(ROUTER_PROMPT)
+
+ROUTER_DECISIONS = telemetry.registry.counter(
+    "router_decisions_total", "Routing decisions by branch and source", ("branch", "source"))
+ROUTER_PARSE_FAILURES = telemetry.registry.counter(
+    "router_parse_failures_total",
+    "Router LLM replies without a usable `next` (no_next / bad_value / unknown_branch)",
+    ("reason",))
+ROUTER_STREAM_EXITS = telemetry.registry.counter(
+    "router_stream_exits_total", "Router LLM streams by how they ended (early / complete)", ("how",))
+FANOUTS = telemetry.registry.counter(
+    "router_fanouts_total", "Turns dispatched to several branches in parallel")
+BRANCH_TIMEOUTS = telemetry.registry.counter(
+    "fanout_branch_timeouts_total", "Fanned-out branches cancelled at their deadline", ("branch",))
+
+# a fanned-out branch that isn't done by then is cancelled; the merge
+# answers with whatever finished
+FANOUT_DEADLINE = float(os.getenv("FANOUT_BRANCH_DEADLINE", 25))
+# sync path (graph.invoke): threads can't be cancelled, so a late branch is
+# abandoned – it finishes in the background and its answer is dropped
+_late_branches = ThreadPoolExecutor(thread_name_prefix="fanout")
+
+BRANCH_TO_NODE = {
+    "budget_insights":      "budget_node",
+    "web_search":           "search_node",
+    "generic":              "generic_node",
+}
+
+# a compound question splits into clauses at "?", ";" or "and / also …"
+# followed by a new question word
+_CLAUSE_SPLIT = re.compile(
+    r"\?\s+|;\s*|,?\s+\b(?:and|also|plus|as well as)\s+"
+    r"(?=(?:what|how|who|which|where|when|why|is|are|do|does|did|can|could|"
+    r"should|tell|show|give|find|any)\b)",
+    re.I,
+)
+
+def _clause_branch(clause: str) -> str | None:
+    if any(k in clause.lower() for k in BUDGET_KEYWORDS):
+        return "budget_insights"
+    branch, confidence = classifier().predict(clause)
+    return branch if confidence >= ROUTER_CONFIDENCE else None
+
+def _local_fanout(question: str) -> dict | None:
+    """{branch: sub-question} when clauses confidently hit ≥2 specialist branches."""
+    clauses = [c.strip(" ,") for c in _CLAUSE_SPLIT.split(question) if c and c.strip(" ,")]
+    if len(clauses) < 2:
+        return None
+    parts: dict = {}
+    for clause in clauses:
+        branch = _clause_branch(clause)
+        if branch and branch != "generic":
+            parts[branch] = f"{parts[branch]} {clause}" if branch in parts else clause
+    if len(parts) < 2:
+        return None
+    for branch in parts:
+        ROUTER_DECISIONS.inc(branch=branch, source="fanout")
+    return parts
+
+def _local_branch(question: str) -> str | None:
     # ── Keyword shortcut for budget questions ─────────
-    q_lower = state["question"].lower()
+    q_lower = question.lower()
     if any(k in q_lower for k in BUDGET_KEYWORDS):
-        branch = "budget_insights"
-    else:
-        # Pass the last turns so the router can leverage context
-        text = (prompt_tmpl | llm).invoke(
-            {"question": state["question"], "history": list(history)}
-        ).content      # plain string
+        ROUTER_DECISIONS.inc(branch="budget_insights", source="keyword")
+        return "budget_insights"
+
+    # ── In-process classifier; None → ask the LLM ─────
+    branch, confidence = classifier().predict(question)
+    if confidence >= ROUTER_CONFIDENCE:
+        ROUTER_DECISIONS.inc(branch=branch, source="classifier")
+        return branch
+    return None
+
+# `"next": "<branch>"` or `"next": [ ... ]`, once its value is closed
+_NEXT_VALUE = re.compile(r'"next"\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\]]*\])')
+
+class _NextScanner:
+    """Reads the router's JSON as it streams; `feed` is True once `next` is decided."""
 
-        text = correct_json(text)
-        print("[ROUTER raw]", text)
+    def __init__(self):
+        self.text = ""
+        self.branches: list[str] | None = None
+        self.failure: str | None = None
 
+    def feed(self, token) -> bool:
+        self.text += token if isinstance(token, str) else ""
+        m = _NEXT_VALUE.search(self.text)
+        if m is None:
+            return False
         try:
-            branch = json.loads(text)["next"]
-        except Exception:
-            print("Failed to parse router response. Falling back to 'generic'.")
-            branch = "generic"
-
-    mapping = {
-        "budget_insights":      "budget_node",
-        "web_search":           "search_node",
-        "generic":              "generic_node",
-    }
-    return Command(goto=mapping.get(branch, "generic_node"), update={"branch": branch})
+            nxt = json.loads(m.group(1))
+        except ValueError:
+            self.failure = "bad_value"
+            return True
+        branches = [nxt] if isinstance(nxt, str) else nxt
+        if not branches or not all(isinstance(b, str) for b in branches):
+            self.failure = "bad_value"
+        elif not all(b in BRANCH_TO_NODE for b in branches):
+            self.failure = "unknown_branch"
+        else:
+            self.branches = branches
+        return True
 
-# ── Leaf nodes ────────────────────────────────────
-def budget_node(state: RouterState):
-    answer = budget.run(state["question"])
+    def result(self, early: bool) -> list[str]:
+        ROUTER_STREAM_EXITS.inc(how="early" if early else "complete")
+        if self.branches is None:
+            reason = self.failure or "no_next"
+            ROUTER_PARSE_FAILURES.inc(reason=reason)
+            ROUTER_DECISIONS.inc(branch="generic", source="llm_fallback")
+            return ["generic"]
+        for branch in self.branches:
+            ROUTER_DECISIONS.inc(branch=branch, source="llm")
+        return self.branches
+
+def _llm_branches(question: str) -> list[str]:
+    scan, early = _NextScanner(), False
+    # closing the stream early cancels the upstream request
+    with closing((prompt_tmpl | router_llm()).stream({"question": question})) as chunks:
+        for chunk in chunks:
+            if scan.feed(chunk.content):
+                early = True
+                break
+    return scan.result(early)
+
+async def _allm_branches(question: str) -> list[str]:
+    scan, early = _NextScanner(), False
+    async with aclosing((prompt_tmpl | router_llm()).astream({"question": question})) as chunks:
+        async for chunk in chunks:
+            if scan.feed(chunk.content):
+                early = True
+                break
+    return scan.result(early)
+
+def _route(branches: list[str], sub_questions: dict | None = None) -> Command:
+    branches = [b for b in dict.fromkeys(branches) if b in BRANCH_TO_NODE] or ["generic"]
+    if len(branches) > 1 and "generic" in branches:
+        branches.remove("generic")              # chit-chat adds nothing to a fan-out
+    nodes = [BRANCH_TO_NODE[b] for b in branches]
+    if len(nodes) > 1:
+        FANOUTS.inc()
     return Command(
-        update={
-            "answer": answer, 
-            "branch": state.get("branch"),
-            "history": list(history)
-        },
-        goto=END,
+        goto=nodes if len(nodes) > 1 else nodes[0],      # list → parallel branches
+        update={"branch": "+".join(branches), "branches": branches,
+                "sub_questions": sub_questions or {}},
     )
 
-def search_node(state: RouterState):
-    answer = web.run(state["question"])
+def _local_route(question: str) -> Command | None:
+    parts = _local_fanout(question)
+    if parts:
+        return _route(list(parts), parts)
+    branch = _local_branch(question)
+    return _route([branch]) if branch else None
+
+def _recorded(cmd: Command, source: str) -> Command:
+    telemetry.record_event("route", source=source, **cmd.update)
+    return cmd
+
+def router(state: RouterState) -> Command:
+    with telemetry.span("route:local"):
+        cmd = _local_route(state["question"])
+    if cmd is not None:
+        return _recorded(cmd, "local")
+    return _recorded(_route(_llm_branches(state["question"])), "llm")
+
+async def arouter(state: RouterState) -> Command:
+    with telemetry.span("route:local"):
+        cmd = _local_route(state["question"])
+    if cmd is not None:
+        return _recorded(cmd, "local")
+    return _recorded(_route(await _allm_branches(state["question"])), "llm")
+
+# ── Leaf nodes ────────────────────────────────────
+def _sid(state: RouterState) -> str:
+    return state.get("session_id") or DEFAULT_SESSION
+
+def _fanned_out(state: RouterState) -> bool:
+    return len(state.get("branches") or []) > 1
+
+def _question(state: RouterState, branch: str) -> str:
+    return (state.get("sub_questions") or {}).get(branch) or state["question"]
+
+def _finish(state: RouterState, answer: str, branch: str) -> Command:
+    if _fanned_out(state):
+        return Command(update={"answers": {branch: answer}}, goto="merge_node")
     return Command(
         update={
-            "answer": answer, 
-            "branch": state.get("branch"),
-            "history": list(history)
+            "answer":  answer,
+            "branch":  state.get("branch"),                  # keep for debug
+            "history": sessions.get(_sid(state)).messages    # optional
         },
         goto=END,
     )
 
+async def _within_deadline(state: RouterState, branch: str, coro):
+    """Single branch: just run.  Fanned out: cancel at the branch deadline."""
+    if not _fanned_out(state):
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, min(FANOUT_DEADLINE, bulkhead.remaining()))
+    except asyncio.TimeoutError:
+        BRANCH_TIMEOUTS.inc(branch=branch)
+        return None
+
+def _within_deadline_sync(state: RouterState, branch: str, fn, *args):
+    """`_within_deadline` for the sync nodes: abandon the branch at its deadline."""
+    if not _fanned_out(state):
+        return fn(*args)
+    fut = _late_branches.submit(contextvars.copy_context().run, fn, *args)
+    try:
+        return fut.result(timeout=min(FANOUT_DEADLINE, bulkhead.remaining()))
+    except FutureTimeout:
+        BRANCH_TIMEOUTS.inc(branch=branch)
+        return None
+
+def budget_node(state: RouterState):
+    budget = agents.get("budget_insights")
+    answer = _within_deadline_sync(state, "budget_insights", budget.run,
+                                   _question(state, "budget_insights"), _sid(state))
+    return _finish(state, answer, "budget_insights")
+
+async def abudget_node(state: RouterState):
+    budget = agents.get("budget_insights")
+    answer = await _within_deadline(state, "budget_insights",
+                                    budget.arun(_question(state, "budget_insights"), _sid(state)))
+    return _finish(state, answer, "budget_insights")
+
+def search_node(state: RouterState):
+    answer = _within_deadline_sync(state, "web_search", agents.get("web_search").run,
+                                   _question(state, "web_search"))
+    return _finish(state, answer, "web_search")
+
+async def asearch_node(state: RouterState):
+    answer = await _within_deadline(state, "web_search",
+                                    agents.get("web_search").arun(_question(state, "web_search")))
+    return _finish(state, answer, "web_search")
+
 def generic_node(state: RouterState):
-    answer = generic_bot.run(state["question"])
+    return _finish(state, agents.get("generic").run(state["question"], _sid(state)), "generic")
+
+async def ageneric_node(state: RouterState):
+    return _finish(state, await agents.get("generic").arun(state["question"], _sid(state)), "generic")
+
+# ── Merge node (fan-out only): one reply, a section per branch ───────
+SECTION_TITLES = {
+    "budget_insights": "📊 Budget insights",
+    "web_search":      "🌐 From the web",
+    "generic":         "💬",
+}
+
+def merge_node(state: RouterState) -> Command:
+    answers = state.get("answers") or {}
+    sections = []
+    for branch in state.get("branches") or []:
+        text = answers.get(branch) or "_No answer in time for this part – ask me again._"
+        sections.append(f"**{SECTION_TITLES.get(branch, branch)}**\n\n{text}")
     return Command(
         update={
-            "answer":  answer,
-            "branch":  state.get("branch"),   # keep for debug
-            "history": list(history)          # optional
+            "answer":  "\n\n".join(sections),
+            "branch":  state.get("branch"),
+            "history": sessions.get(_sid(state)).messages,
         },
-        goto=END
+        goto=END,
     )
 
+async def amerge_node(state: RouterState) -> Command:
+    return merge_node(state)
+
+# ── Warm-up (server.py runs this in the background after startup) ───
+def warm() -> dict:
+    """Build everything a first turn would otherwise pay for; seconds per part."""
+    t0 = time.perf_counter()
+    classifier()
+    count_tokens("warm")
+    router_llm()
+    took = {"router": round(time.perf_counter() - t0, 3)}
+    took.update(agents.warm())
+    return took
+
 # ── Build the graph ───────────────────────────────────────────────────────────
+def _timed_node(name: str, fn, afn) -> RunnableLambda:
+    # wall time per node → graph_node_seconds{node=…} and the trace timeline
+    return RunnableLambda(
+        telemetry.timed(fn, name, telemetry.NODE_SECONDS, node=name),
+        afunc=telemetry.timed(afn, name, telemetry.NODE_SECONDS, node=name),
+        name=name,
+    )
+
 def build_graph():
     g = StateGraph(RouterState)
-    g.add_node("router", router)
-    g.add_node("budget_node",      budget_node)
-    g.add_node("search_node",      search_node)
-    g.add_node("generic_node",     generic_node)
+    # Each node carries a sync and an async implementation: graph.invoke /
+    # graph.stream (main.py REPL) run the former, graph.ainvoke / graph.astream
+    # (server.py) run the latter without tying up a worker thread.
+    g.add_node("router",           _timed_node("router", router, arouter))
+    g.add_node("budget_node",      _timed_node("budget_node", budget_node, abudget_node))
+    g.add_node("search_node",      _timed_node("search_node", search_node, asearch_node))
+    g.add_node("generic_node",     _timed_node("generic_node", generic_node, ageneric_node))
+    g.add_node("merge_node",       _timed_node("merge_node", merge_node, amerge_node))
 
+    # router → one leaf, or several in parallel (Command(goto=[…])); when the
+    # turn was fanned out the leaves also hand over to merge_node
     g.add_edge(START, "router")
-    for leaf in ("budget_node", "generic_node", "search_node"):
+    for leaf in ("budget_node", "generic_node", "search_node", "merge_node"):
         g.add_edge(leaf, END)
     return g.compile()
\ No newline at end of file
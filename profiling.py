@@ -0,0 +1,213 @@
+# profiling.py
+"""
+On-demand profiling for single /chat turns, plus a replayable recording of
+each profiled turn.
+
+A turn is profiled when it is picked by PROFILE_SAMPLE_RATE (0–1, default 0)
+or sends the X-Profile header.  The header is ignored unless PROFILE_TOKEN is
+set (then it must carry that token) or PROFILE_HEADER_ENABLED=1 (then
+`X-Profile: 1` is enough; for local use).  The response carries
+`X-Profile-Id`, a server-generated id, and PROFILE_DIR receives:
+
+    <id>.json     the stage timeline (extract_day, route:*, llm:*,
+                  agent_executor, mcp:*, db:* …) and the recording: question,
+                  session history, routing decision, every LLM output, MCP
+                  tool call and search result, the answer.  replay.py
+                  re-runs it offline.
+    <id>.folded   sampled stacks in flamegraph.pl / speedscope "folded" form
+
+The sampler reads sys._current_frames() every PROFILE_INTERVAL seconds, so
+it sees the whole process: on a busy worker, other turns' stacks show up
+too.  Only one sampler runs at a time.  A turn that finds it busy still gets
+its timeline and recording.
+
+Recordings hold whole session histories, so only the newest
+PROFILE_MAX_TURNS turns (default 200) are kept.
+"""
+import hmac, json, os, random, re, secrets, sys, threading, time
+from collections import Counter
+from datetime import date, datetime, timezone
+import telemetry
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "0") == "1"
+TOKEN = os.getenv("PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+MAX_TURNS = int(os.getenv("PROFILE_MAX_TURNS", 200))
+_PROFILE_FILE = re.compile(r"^([0-9a-f]{16})\.(?:json|folded)$")
+
+PROFILED = telemetry.registry.counter(
+    "profiled_turns_total", "Turns profiled, by trigger (header / sampled)", ("trigger",))
+
+
+# ── stack sampler ────────────────────────────────────────────────────
+class Sampler:
+    """Wall-clock stack sampler over every thread of the process."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: dict = {}             # code object → "func (file:line)"
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = \
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> "Sampler":
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def hot(self, n: int = 15) -> list[dict]:
+        """Frames most often on top of a stack, i.e. where the time went."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{"frame": f, "samples": c, "share": round(c / total, 3)}
+                for f, c in leaves.most_common(n)]
+
+
+_sampler_lock = threading.Lock()
+
+
+def new_profile_id() -> str:
+    """File name of a profiled turn: never taken from the request."""
+    return secrets.token_hex(8)
+
+def _prune(keep: int) -> None:
+    """Drop the oldest profiled turns beyond `keep` (their .json and .folded)."""
+    turns: dict = {}
+    for entry in os.scandir(PROFILE_DIR):
+        m = _PROFILE_FILE.match(entry.name)
+        if m:
+            turns.setdefault(m.group(1), []).append(entry)
+    if len(turns) <= keep:
+        return
+    oldest = sorted(turns.values(), key=lambda es: max(e.stat().st_mtime for e in es))
+    for entries in oldest[:len(turns) - keep]:
+        for e in entries:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+
+# ── one profiled turn ────────────────────────────────────────────────
+class TurnProfile:
+    def __init__(self, endpoint: str, question: str, session_id: str, trigger: str,
+                 profile_id: str | None = None):
+        from memory import sessions
+        self.id = profile_id or new_profile_id()
+        self.trace_id = telemetry.current_trace_id() or telemetry.new_trace_id()
+        self.endpoint, self.trigger = endpoint, trigger
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.inputs = {"question": question, "session_id": session_id,
+                       "history": sessions.get(session_id).snapshot()}
+        self.events = telemetry.start_recording()
+        self.t0 = time.perf_counter()
+        self.sampler = Sampler().start() if _sampler_lock.acquire(blocking=False) else None
+
+    def finish(self, state: dict | None = None, error: BaseException | None = None) -> str:
+        """Stop sampling and write <id>.json / <id>.folded; returns the .json path."""
+        total = time.perf_counter() - self.t0
+        if self.sampler is not None:
+            self.sampler.stop()
+            _sampler_lock.release()
+
+        base = os.path.join(PROFILE_DIR, self.id)
+        t0_ms = round(self.t0 * 1000, 2)
+
+        def rel(items: list[dict], key: str) -> list[dict]:       # ms since turn start
+            return [{**e, key: round(e[key] - t0_ms, 2)} for e in items]
+
+        trace = {
+            "profile_id": self.id, "trace_id": self.trace_id,
+            "endpoint": self.endpoint, "trigger": self.trigger,
+            "started_at": self.started_at, "today": date.today().isoformat(),
+            "total_ms": round(total * 1000, 2),
+            "input": self.inputs,
+            "events": rel(self.events, "at_ms"),
+            "output": {"answer": (state or {}).get("answer"),
+                       "branch": (state or {}).get("branch")},
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "timeline": sorted(rel(telemetry.timeline(), "start_ms"),
+                               key=lambda s: s["start_ms"]),
+            "profile": None,
+        }
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if self.sampler is not None:
+            with open(base + ".folded", "w", encoding="utf-8") as fh:
+                fh.write(self.sampler.folded())
+            trace["profile"] = {"interval": self.sampler.interval,
+                                "samples": self.sampler.samples,
+                                "folded": base + ".folded", "hot": self.sampler.hot()}
+        with open(base + ".json", "w", encoding="utf-8") as fh:
+            json.dump(trace, fh, indent=1, default=str)
+        _prune(MAX_TURNS)
+        return base + ".json"
+
+
+def trigger(headers) -> str | None:
+    """Why this request gets profiled ("header" / "sampled"), or None."""
+    value = headers.get(PROFILE_HEADER, "")
+    if value and (hmac.compare_digest(value.encode(), TOKEN.encode()) if TOKEN
+                  else HEADER_ENABLED and value.lower() in ("1", "true", "yes")):
+        return "header"
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        return "sampled"
+    return None
+
+def start(trigger: str | None, endpoint: str, question: str,
+          session_id: str, profile_id: str | None = None) -> TurnProfile | None:
+    """Begin profiling the turn in the current context (no-op without a trigger)."""
+    if trigger is None:
+        return None
+    PROFILED.inc(trigger=trigger)
+    return TurnProfile(endpoint, question, session_id, trigger, profile_id)
+
+def finish(prof: TurnProfile | None, state: dict | None = None,
+           error: BaseException | None = None) -> None:
+    if prof is None:
+        return
+    try:
+        print(f"[profile] {prof.finish(state, error)}")
+    except Exception as e:
+        print(f"[profile] write failed: {e}")
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
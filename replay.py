@@ -0,0 +1,290 @@
+# replay.py
+"""
+Re-run turns recorded by profiling.py (PROFILE_DIR/<id>.json) through
+orchestrator.build_graph(), offline and deterministically:
+
+• each LLM call gets the recorded output, matched by prompt hash and
+  otherwise the next unused output in recorded order
+• MCP tool calls and web searches return the recorded results
+• the session history and the day relative dates count from are restored
+
+Only this process's own code runs: date parsing, routing, prompt building,
+the AgentExecutor loop and rendering.  That makes it the place to profile
+hot-path regressions without OpenAI, Serper, the hub or Snowflake.
+
+    python replay.py .cache/profiles/<id>.json --repeat 20
+    python replay.py .cache/profiles/*.json --profile        # + sampled stacks
+    python replay.py <id>.json --timing recorded             # wait recorded latencies
+
+Exit status 1 when a replayed answer differs from the recorded one.
+"""
+import argparse, asyncio, json, os, statistics, sys, tempfile, threading, time
+from collections import Counter, defaultdict
+from datetime import date
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_player = None                 # the Player of the trace being replayed
+_timing = "none"               # "recorded" → sleep each call's recorded latency
+
+
+def _canon(arguments) -> str:
+    return json.dumps(arguments, sort_keys=True, default=str)
+
+
+class Player:
+    """Hands out one recording's LLM outputs, tool results and search snippets."""
+
+    def __init__(self, trace: dict):
+        self.trace = trace
+        self.events = trace["events"]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.used: set[int] = set()
+        self.exact: Counter = Counter()
+        self.inexact: Counter = Counter()
+        self.missing: Counter = Counter()
+
+    def _take(self, kind: str, exact, loose=lambda e: True) -> dict | None:
+        with self._lock:
+            free = [i for i, e in enumerate(self.events)
+                    if e["kind"] == kind and i not in self.used]
+            i = next((i for i in free if exact(self.events[i])), None)
+            if i is not None:
+                self.exact[kind] += 1
+            else:
+                i = next((i for i in free if loose(self.events[i])), None)
+                (self.inexact if i is not None else self.missing)[kind] += 1
+            if i is None:
+                return None
+            self.used.add(i)
+            return self.events[i]
+
+    def llm(self, messages) -> dict | None:
+        from llm import prompt_hash
+        h = prompt_hash(messages)
+        return self._take("llm", lambda e: e.get("prompt") == h)
+
+    def tool(self, tool: str, arguments: dict) -> dict | None:
+        key = _canon(arguments)
+        return self._take("tool", lambda e: e["tool"] == tool and _canon(e["arguments"]) == key,
+                          lambda e: e["tool"] == tool)
+
+    def search(self, query: str) -> dict | None:
+        return self._take("search", lambda e: e["query"] == query)
+
+    def unused(self) -> int:
+        return sum(1 for i, e in enumerate(self.events)
+                   if e["kind"] in ("llm", "tool", "search") and i not in self.used)
+
+
+def _wait(event: dict | None) -> float:
+    return (event or {}).get("ms", 0) / 1000 if _timing == "recorded" else 0.0
+
+
+# ── stand-ins ────────────────────────────────────────────────────────
+class ReplayChatModel(BaseChatModel):
+    """Answers from the current recording instead of calling a provider."""
+
+    temperature: float = 0.0
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _reply(self, messages) -> tuple[AIMessage, float]:
+        e = _player.llm(messages) if _player is not None else None
+        if e is None:
+            return AIMessage(content=""), 0.0
+        return AIMessage(content=e["content"],
+                         additional_kwargs=e.get("additional_kwargs") or {}), _wait(e)
+
+    @staticmethod
+    def _chunks(msg: AIMessage):
+        if msg.additional_kwargs:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=msg.content, additional_kwargs=msg.additional_kwargs))
+            return
+        for i, word in enumerate(str(msg.content).split(" ")):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        msg, wait = self._reply(messages)
+        time.sleep(wait)
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        msg, wait = self._reply(messages)
+        await asyncio.sleep(wait)
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg, wait = self._reply(messages)
+        time.sleep(wait)
+        for chunk in self._chunks(msg):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg, wait = self._reply(messages)
+        await asyncio.sleep(wait)
+        for chunk in self._chunks(msg):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class ReplayTransport:
+    """mcp_client.MCPClient.local stand-in: tool results from the recording."""
+
+    @staticmethod
+    def _item(tool: str, arguments: dict) -> dict:
+        e = _player.tool(tool, arguments) if _player is not None else None
+        if e is None:
+            return {"tool": tool, "error": "not in the recording"}
+        if "error" in e:
+            return {"tool": tool, "error": e["error"]}
+        return {"tool": tool, "result": e["result"], "ms": e.get("ms", 0)}
+
+    @staticmethod
+    def _result(item: dict):
+        if "error" in item:
+            import mcp_client
+            raise mcp_client.MCPToolError(f"{item['tool']}: {item['error']}")
+        return item["result"]
+
+    async def ainvoke(self, tool: str, arguments: dict, timeout: float):
+        item = self._item(tool, arguments)
+        await asyncio.sleep(_wait(item))
+        return self._result(item)
+
+    def invoke(self, tool: str, arguments: dict, timeout: float):
+        item = self._item(tool, arguments)
+        time.sleep(_wait(item))
+        return self._result(item)
+
+    async def abatch(self, calls: list[dict]) -> list[dict]:
+        items = [self._item(c["tool"], c.get("arguments", {})) for c in calls]
+        await asyncio.sleep(max((_wait(i) for i in items), default=0.0))
+        return items
+
+    def batch(self, calls: list[dict], timeout: float) -> list[dict]:
+        items = [self._item(c["tool"], c.get("arguments", {})) for c in calls]
+        time.sleep(max((_wait(i) for i in items), default=0.0))
+        return items
+
+
+class ReplaySearch:
+    """web_search_agent.search stand-in (GoogleSerperRun.run / arun)."""
+
+    def run(self, query: str, *args, **kwargs) -> str:
+        e = _player.search(query) if _player is not None else None
+        return e["snippets"] if e else ""
+
+    async def arun(self, query: str, *args, **kwargs) -> str:
+        return self.run(query)
+
+
+# ── driver ───────────────────────────────────────────────────────────
+def setup(timing: str = "none"):
+    """Swap in the stand-ins and build the graph; call before anything imports agents."""
+    global _timing
+    _timing = timing
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    # replayed turns must neither read nor fill the real caches
+    os.environ["SEARCH_CACHE_PATH"] = os.path.join(workdir, "web_search.sqlite")
+    os.environ["LLM_CACHE"] = "0"
+
+    import utils, mcp_client
+    utils.set_llm_factory(lambda temperature=0.2, streaming=True:
+                          ReplayChatModel(temperature=temperature, streaming=streaming))
+    mcp_client.client.local = ReplayTransport()
+    from agents import web_search_agent
+    web_search_agent.search = ReplaySearch()
+    from orchestrator import build_graph
+    return build_graph()
+
+
+async def _turn(graph, trace: dict) -> tuple[float, dict, list[dict]]:
+    import telemetry
+    from memory import sessions
+    inp = trace["input"]
+    history = inp.get("history") or {}
+    sessions.load(inp["session_id"], history.get("messages", []), history.get("digest", ""))
+    telemetry.start_trace()
+    t0 = time.perf_counter()
+    state = await graph.ainvoke({"question": inp["question"], "session_id": inp["session_id"]})
+    return time.perf_counter() - t0, state, telemetry.timeline()
+
+
+async def replay(graph, path: str, repeat: int, profile: bool) -> bool:
+    """Replay one recording `repeat` times; True when the answer matches."""
+    global _player
+    import day_parser, profiling
+    trace = profiling.load(path)
+    _player = Player(trace)
+    day_parser.pin_today(date.fromisoformat(trace["today"]) if trace.get("today") else None)
+
+    q = trace["input"]["question"]
+    print(f"▶ {trace['trace_id']}  {q[:60]!r}  "
+          f"(recorded {trace['total_ms']:.0f} ms, branch {trace['output'].get('branch')})")
+
+    sampler = profiling.Sampler().start() if profile else None
+    times, state, timeline = [], {}, []
+    try:
+        for _ in range(repeat):
+            _player.reset()
+            # own task per run: a fresh context for the trace id / timeline
+            dt, state, timeline = await asyncio.create_task(_turn(graph, trace))
+            times.append(dt)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+
+    same = state.get("answer") == trace["output"].get("answer")
+    print(f"   replay  p50 {statistics.median(times) * 1e3:.1f} ms · "
+          f"min {min(times) * 1e3:.1f} ms over {repeat} run(s)")
+    print(f"   answer  {'✅ matches the recording' if same else '⚠️  differs from the recording'}")
+    p = _player
+    lookups = ", ".join(
+        f"{kind} {p.exact[kind]} exact/{p.inexact[kind]} by order/{p.missing[kind]} missing"
+        for kind in ("llm", "tool", "search")
+        if p.exact[kind] + p.inexact[kind] + p.missing[kind])
+    print(f"   lookups {lookups or 'none'}; {p.unused()} recorded event(s) unused")
+
+    stages: dict = defaultdict(float)
+    for s in timeline:
+        stages[s["stage"]] += s["ms"]
+    for stage, ms in sorted(stages.items(), key=lambda kv: -kv[1])[:10]:
+        print(f"     {stage:<28}{ms:>9.2f} ms")
+
+    if sampler is not None:
+        out = os.path.splitext(path)[0] + ".replay.folded"
+        with open(out, "w", encoding="utf-8") as fh:
+            fh.write(sampler.folded())
+        print(f"   profile {sampler.samples} samples → {out}")
+        for h in sampler.hot(8):
+            print(f"     {h['share']:>6.1%}  {h['frame']}")
+    return same
+
+
+async def main(opts) -> int:
+    graph = setup(opts.timing)
+    results = [await replay(graph, path, opts.repeat, opts.profile) for path in opts.traces]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay turns recorded by profiling.py")
+    ap.add_argument("traces", nargs="+", help="PROFILE_DIR/<id>.json files")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--profile", action="store_true", help="sample stacks while replaying")
+    ap.add_argument("--timing", choices=("none", "recorded"), default="none",
+                    help="recorded: wait each LLM / tool call's recorded latency")
+    sys.exit(asyncio.run(main(ap.parse_args())))
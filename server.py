@@ -1,76 +1,144 @@
 # server.py  (abridged)
 
-import os, uuid, json, redis, anyio
-from fastapi import FastAPI, HTTPException
+import asyncio, os, uuid, json, time
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from orchestrator import build_graph
+from orchestrator import build_graph, warm
+from memory import sessions, SUMMARIZER_TAG
+from session_store import SessionStore
+import agents
+import mcp_client
+import telemetry
+import bulkhead
+import llm
+import profiling
 
 graph = build_graph()                 # compile once
 
-# ── 1.  connect to Redis ───────────────────────────────────────────
-# Try Redis, else fall back to in-process dict
-try:
-    import redis
-    r = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
-    _use_redis = True
-except ImportError:
-    _use_redis = False
-    _inproc_sessions = {}
-
-SESSION_TTL = 30 * 60  # 30 min
-
-def load_state(sid: str) -> dict:
-    if _use_redis:
-        raw = r.get(sid)
-        return json.loads(raw) if raw else {}
-    else:
-        return _inproc_sessions.get(sid, {})
-
-def save_state(sid: str, state: dict):
-    # Build a JSON-serializable snapshot
-    snapshot = {}
-    for k, v in state.items():
-        if k == "history" and isinstance(v, list):
-            # turn messages into plain strings
-            snapshot["history"] = [
-                (m.content if hasattr(m, "content") else str(m))
-                for m in v
-            ]
-        elif isinstance(v, (str, int, float, bool, type(None))):
-            snapshot[k] = v
-        else:
-            # skip anything else (e.g. ConversationBufferMemory, callbacks, etc.)
-            pass
-
-    data = json.dumps(snapshot)
-    if _use_redis:
-        r.setex(sid, SESSION_TTL, data)
-    else:
-        _inproc_sessions[sid] = snapshot
+# ── 1.  session persistence (Redis, else in-process) ──────────────
+store = SessionStore.from_env()         # no I/O; Redis is pinged at startup
+
+async def load_state(sid: str) -> None:
+    """Seed this worker's session history from the store."""
+    snap, near_hit = await store.load(sid)
+    if near_hit and sid in sessions:
+        return                  # this worker already holds the live history
+    sessions.load(sid, snap["history"], snap["meta"].get("digest", ""))
+
+async def save_state(sid: str, state: dict):
+    # only the messages this turn produced are written, with role/type kept
+    hist = sessions.get(sid)
+    meta = {k: v for k, v in state.items()
+            if k in ("branch",) and isinstance(v, str)}
+    meta["digest"] = hist.digest
+    await store.append(sid, hist.drain_unsaved(), meta)
 
 # ── 2.  FastAPI endpoint stays async ───────────────────────────────
 app = FastAPI(title="Campaign-Agent API")
 
+# Agents and their clients load lazily; once the port is open, build them in a
+# worker thread so the first real turn doesn't pay for it.  WARMUP=0 disables.
+WARMUP = os.getenv("WARMUP", "1") == "1"
+_warmup = None
+
+def _warm() -> None:
+    t0 = time.perf_counter()
+    try:
+        took = warm()
+        print(f"[warmup] ready in {time.perf_counter() - t0:.2f}s {took}")
+    except Exception as e:
+        print(f"[warmup] failed: {e}")
+
+@app.on_event("startup")
+async def _connect_store():
+    await store.connect()
+
+@app.on_event("startup")
+async def _start_warmup():
+    global _warmup
+    if WARMUP:
+        _warmup = asyncio.get_running_loop().run_in_executor(None, _warm)
+
+@app.on_event("shutdown")
+async def _close_pools():
+    await mcp_client.client.aclose()
+    await store.close()
+
+@app.get("/stats")
+def stats():
+    web = agents.loaded("web_search")
+    return {"web_search": web.stats() if web else {"loaded": False},
+            "sessions": store.stats(),
+            "bulkheads": bulkhead.stats(),
+            "llm": llm.stats(),
+            "warm": bool(_warmup and _warmup.done())}
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(telemetry.registry.render(),
+                             media_type="text/plain; version=0.0.4")
+
+# one trace per turn; the id is echoed back and forwarded to the MCP hub
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+TURN_SECONDS = telemetry.registry.histogram(
+    "chat_turn_seconds", "End-to-end /chat turn latency", ("endpoint", "branch"))
+
+def _end_trace(endpoint: str, t0: float, sid: str, branch: str | None) -> None:
+    dt = time.perf_counter() - t0
+    TURN_SECONDS.observe(dt, endpoint=endpoint, branch=branch or "error")
+    if TRACE_LOG:
+        telemetry.log_trace("chat", dt, endpoint=endpoint, session_id=sid, branch=branch)
+
+# ── admission control: every turn has a deadline; a dependency whose
+#    bulkhead is full sheds the turn with 429 / 503 + Retry-After ─────
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 60))
+
+@app.exception_handler(bulkhead.Rejected)
+async def _shed(request: Request, exc: bulkhead.Rejected):
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status,
+                        headers={"Retry-After": str(exc.retry_after)})
+
 class ChatReq(BaseModel):
     session_id: str | None = None
     message:    str
 
 @app.post("/chat")
-async def chat(req: ChatReq):
+async def chat(req: ChatReq, request: Request, response: Response):
+    tid   = telemetry.start_trace(request.headers.get(telemetry.TRACE_HEADER))
+    response.headers[telemetry.TRACE_HEADER] = tid
+    t0    = time.perf_counter()
+    bulkhead.set_deadline(REQUEST_DEADLINE)
     sid   = req.session_id or str(uuid.uuid4())
-    stored = load_state(sid)
+    with telemetry.span("load_state"):
+        await load_state(sid)
+    # opt-in: X-Profile (see profiling.trigger) or PROFILE_SAMPLE_RATE → profile + recording
+    prof = profiling.start(profiling.trigger(request.headers), "chat", req.message, sid)
+    if prof is not None:
+        response.headers[profiling.PROFILE_ID_HEADER] = prof.id
 
-    # graph.invoke is still synchronous → run it in a worker thread
+    # every node has an async implementation → no worker thread is held
+    # while the turn waits on OpenAI / Serper / the MCP hub
     try:
-        new_state = await anyio.to_thread.run_sync(
-            graph.invoke,
-            {"question": req.message},
-            stored,
+        new_state = await graph.ainvoke(
+            {"question": req.message, "session_id": sid},
         )
+    except bulkhead.Rejected as e:
+        _end_trace("chat", t0, sid, "shed")
+        profiling.finish(prof, error=e)
+        raise
     except Exception as e:
-        raise HTTPException(500, str(e))
+        _end_trace("chat", t0, sid, None)
+        profiling.finish(prof, error=e)
+        raise HTTPException(500, str(e), headers={telemetry.TRACE_HEADER: tid})
+    except BaseException as e:          # cancelled: still free the sampler
+        profiling.finish(prof, error=e)
+        raise
 
-    save_state(sid, new_state)
+    with telemetry.span("save_state"):
+        await save_state(sid, new_state)
+    _end_trace("chat", t0, sid, new_state.get("branch"))
+    profiling.finish(prof, new_state)
 
     return {
         "session_id": sid,
@@ -78,6 +146,111 @@ async def chat(req: ChatReq):
         "branch"    : new_state["branch"],
     }
 
+# ── 3.  Streaming variant: Server-Sent Events ──────────────────────
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _branch_of(output) -> str | None:
+    # router returns a Command; its update carries the branch
+    update = getattr(output, "update", output)
+    return update.get("branch") if isinstance(update, dict) else None
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatReq, request: Request):
+    """
+    Same turn as /chat, streamed as SSE:
+      session → route → (tool_start / tool_end)* → token* → done   (or error)
+
+    Token events name the node that produced them; only the answering
+    agent's model is streamed (not the router or the memory summarizer).  A fanned-out turn runs
+    its branches in parallel, so their tokens would interleave: it sends the
+    merged reply as a single token event once every branch is done.
+    """
+    tid    = request.headers.get(telemetry.TRACE_HEADER) or telemetry.new_trace_id()
+    sid    = req.session_id or str(uuid.uuid4())
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+               telemetry.TRACE_HEADER: tid}
+    profile = profiling.trigger(request.headers)
+    profile_id = profiling.new_profile_id() if profile else None
+    if profile:
+        headers[profiling.PROFILE_ID_HEADER] = profile_id
+
+    async def events():
+        # the body is produced after the endpoint returned → (re)start the trace here
+        telemetry.start_trace(tid)
+        bulkhead.set_deadline(REQUEST_DEADLINE)
+        t0 = time.perf_counter()
+        with telemetry.span("load_state"):
+            await load_state(sid)
+        ttft = None
+        fanned = False
+        final: dict = {}
+        prof = profiling.start(profile, "stream", req.message, sid, profile_id)
+        error = None
+        try:
+            yield _sse("session", {"session_id": sid, "trace_id": tid})
+            try:
+                async for ev in graph.astream_events(
+                    {"question": req.message, "session_id": sid}, version="v2"
+                ):
+                    kind = ev["event"]
+                    node = ev.get("metadata", {}).get("langgraph_node")
+
+                    if kind == "on_chain_end" and ev["name"] == "router" and node == "router":
+                        branch = _branch_of(ev["data"].get("output"))
+                        fanned = "+" in (branch or "")
+                        yield _sse("route", {"branch": branch})
+
+                    elif kind == "on_tool_start":
+                        yield _sse("tool_start", {"tool": ev["name"], "input": ev["data"].get("input")})
+
+                    elif kind == "on_tool_end":
+                        yield _sse("tool_end", {"tool": ev["name"]})
+
+                    elif kind == "on_chat_model_stream" and node != "router" and not fanned \
+                            and SUMMARIZER_TAG not in ev.get("tags", ()):
+                        text = ev["data"]["chunk"].content
+                        if text:
+                            if ttft is None:
+                                ttft = time.perf_counter() - t0
+                            yield _sse("token", {"text": text, "node": node})
+
+                    elif kind == "on_chain_end" and not ev.get("parent_ids"):
+                        final = ev["data"].get("output") or {}
+            except bulkhead.Rejected as e:
+                error = e
+                _end_trace("stream", t0, sid, "shed")
+                yield _sse("error", {"detail": str(e), "status": e.status,
+                                     "retry_after": e.retry_after})
+                return
+            except Exception as e:
+                error = e
+                _end_trace("stream", t0, sid, None)
+                yield _sse("error", {"detail": str(e)})
+                return
+
+            if fanned and final.get("answer"):
+                ttft = time.perf_counter() - t0
+                yield _sse("token", {"text": final["answer"], "node": "merge_node"})
+
+            with telemetry.span("save_state"):
+                await save_state(sid, final)
+            _end_trace("stream", t0, sid, final.get("branch"))
+            yield _sse("done", {
+                "session_id": sid,
+                "reply":      final.get("answer"),
+                "branch":     final.get("branch"),
+                "ttft_ms":    round(ttft * 1000) if ttft is not None else None,
+                "total_ms":   round((time.perf_counter() - t0) * 1000),
+            })
+        except BaseException as e:      # client went away mid-stream
+            error = error or e
+            raise
+        finally:
+            profiling.finish(prof, final, error)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,183 @@
+# session_store.py
+"""
+Session persistence for server.py.
+
+Per session two Redis keys are kept:
+
+    sess:{sid}:msgs   list  – one compact, encoded message per entry
+    sess:{sid}:meta   hash  – digest, last branch, …
+
+Each turn only RPUSHes the messages that turn produced, LTRIMs the list and
+refreshes the TTL in a single pipelined round trip, so the bytes written per
+turn don't grow with the conversation.  Every append also bumps
+`meta.version`; reads go through a small in-process LRU near-cache that is
+trusted only while its version still matches Redis (one HGET), so a session
+that moved to another worker and back is reloaded, not served stale.
+Without Redis – not installed, or unreachable when `connect()` pings it at
+startup, unless REDIS_REQUIRED=1 – the same API is served from an
+in-process, TTL-evicting cache.
+"""
+import asyncio, json, os, zlib
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from cache import TTLCache
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", 30 * 60))            # 30 min
+MAX_STORED_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", 100))
+NEAR_CACHE_TTL = float(os.getenv("SESSION_NEAR_CACHE_TTL", 60))
+NEAR_CACHE_SIZE = int(os.getenv("SESSION_NEAR_CACHE_SIZE", 2048))
+CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2))
+
+try:
+    import msgpack
+
+    def _pack(obj) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def _unpack(raw: bytes):
+        return msgpack.unpackb(raw, raw=False)
+except ImportError:                         # zlib'd JSON is the fallback codec
+    def _pack(obj) -> bytes:
+        return zlib.compress(json.dumps(obj, separators=(",", ":")).encode(), 6)
+
+    def _unpack(raw: bytes):
+        return json.loads(zlib.decompress(raw))
+
+
+_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+def encode_message(m: BaseMessage) -> bytes:
+    """[type, content] (+ additional_kwargs when present) → bytes."""
+    item = [m.type, m.content]
+    if m.additional_kwargs:
+        item.append(m.additional_kwargs)
+    return _pack(item)
+
+def decode_message(raw: bytes) -> BaseMessage:
+    item = _unpack(raw)
+    cls = _TYPES.get(item[0], AIMessage)
+    return cls(content=item[1], additional_kwargs=item[2] if len(item) > 2 else {})
+
+
+def _key(sid: str, part: str) -> str:
+    return f"sess:{sid}:{part}"
+
+
+class SessionStore:
+    def __init__(self, redis_client=None, ttl: int = SESSION_TTL,
+                 max_messages: int = MAX_STORED_MESSAGES):
+        self.redis = redis_client            # redis.asyncio.Redis or None
+        self.required = False                # connect() raises instead of falling back
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.near = TTLCache(max_entries=NEAR_CACHE_SIZE, default_ttl=NEAR_CACHE_TTL)
+        # no Redis → this *is* the store, so it lives as long as a session
+        self._local = None if redis_client else self._local_cache()
+
+    def _local_cache(self) -> TTLCache:
+        return TTLCache(max_entries=int(os.getenv("SESSION_LOCAL_MAX", 10_000)),
+                        default_ttl=self.ttl)
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Store for REDIS_URL; no I/O here – the server awaits `connect()` at startup."""
+        url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        required = os.getenv("REDIS_REQUIRED", "0") == "1"
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            if required:
+                raise RuntimeError("REDIS_REQUIRED=1 but the redis package is not installed")
+            print("redis not installed – sessions are kept in-process only")
+            return cls(None)
+        store = cls(aioredis.from_url(url))
+        store.required = required
+        return store
+
+    async def connect(self) -> None:
+        """Ping Redis: fail (or fall back to in-process) now rather than on the first turn."""
+        if self.redis is None:
+            return
+        try:
+            await asyncio.wait_for(self.redis.ping(), CONNECT_TIMEOUT)
+        except Exception as e:
+            where = self.redis.connection_pool.connection_kwargs.get("host", "?")
+            if self.required:
+                raise RuntimeError(f"Redis at {where} is unreachable: {e!r}") from e
+            print(f"Redis at {where} unreachable ({e!r}) – sessions are kept in-process only")
+            await self.close()
+            self.redis, self._local = None, self._local_cache()
+
+    # ── read ─────────────────────────────────────────────────────────
+    async def load(self, sid: str) -> tuple[dict, bool]:
+        """
+        Return ({"history": [BaseMessage], "meta": {…}}, from_near_cache).
+        An unknown session yields an empty history.
+        """
+        if self._local is not None:
+            snap = self._local.get(sid)
+            return snap or {"history": [], "meta": {}}, snap is not None
+        snap = self.near.get(sid)
+        if snap is not None:
+            # another worker may have written since: trust the copy only at the same version
+            version = await self.redis.hget(_key(sid, "meta"), "version")
+            if int(version or 0) == snap["version"]:
+                return snap, True
+            self.near.invalidate(sid)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lrange(_key(sid, "msgs"), 0, -1)
+        pipe.hgetall(_key(sid, "meta"))
+        raw_msgs, raw_meta = await pipe.execute()
+        meta = {k.decode(): v.decode() for k, v in raw_meta.items()}
+        snap = {
+            "history": [decode_message(r) for r in raw_msgs],
+            "version": int(meta.pop("version", 0)),
+            "meta": meta,
+        }
+        self.near.set(sid, snap)
+        return snap, False
+
+    # ── write (one turn) ─────────────────────────────────────────────
+    async def append(self, sid: str, messages: list[BaseMessage], meta: dict) -> None:
+        meta = {k: v for k, v in meta.items() if isinstance(v, (str, int, float))}
+        base = self._local.get(sid) if self._local is not None else self.near.get(sid)
+        snap = None
+        if base is not None or self._local is not None:
+            base = base or {"history": [], "meta": {}}
+            snap = {
+                "history": (base["history"] + list(messages))[-self.max_messages:],
+                "meta": {**base["meta"], **meta},
+                "version": base.get("version", 0) + 1,
+            }
+
+        if self._local is not None:
+            self._local.set(sid, snap)
+            return
+
+        msgs_key, meta_key = _key(sid, "msgs"), _key(sid, "meta")
+        pipe = self.redis.pipeline(transaction=False)
+        if messages:
+            pipe.rpush(msgs_key, *(encode_message(m) for m in messages))
+            pipe.ltrim(msgs_key, -self.max_messages, -1)
+        if meta:
+            pipe.hset(meta_key, mapping=meta)
+        pipe.hincrby(meta_key, "version", 1)
+        pipe.expire(msgs_key, self.ttl)
+        pipe.expire(meta_key, self.ttl)
+        version = (await pipe.execute())[-3]
+
+        # keep the near-cache only when it held the full history and no
+        # other worker wrote in between (our write is then exactly +1)
+        if snap is not None and version == snap["version"]:
+            self.near.set(sid, snap)
+        else:
+            self.near.invalidate(sid)
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            close = getattr(self.redis, "aclose", None) or self.redis.close
+            await close()
+
+    def stats(self) -> dict:
+        return {"backend": "redis" if self.redis else "in-process",
+                "near_cache": self.near.stats()}
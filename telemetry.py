@@ -0,0 +1,257 @@
+# telemetry.py
+"""
+Hot-path instrumentation without extra dependencies.
+
+• Counter / Gauge / Histogram in a process-wide `registry`, rendered in the
+  Prometheus text format by the /metrics endpoints of server.py and mcp_tools.py
+• a trace id (contextvar) that server.py sets per /chat turn and mcp_client
+  forwards to the hub in the X-Trace-Id header
+• `span(...)` – times a stage into a histogram *and* onto the current
+  trace's timeline, so one slow turn can be broken down stage by stage
+"""
+import asyncio, contextvars, functools, json, threading, time, uuid
+from contextlib import contextmanager
+
+TRACE_HEADER = "X-Trace-Id"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    """Label value escaping per the Prometheus text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_label_str(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict = {}          # key -> [bucket counts…, sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = self.header()
+        for key, s in items:
+            les = [str(b) for b in self.buckets] + ["+Inf"]
+            for le, c in zip(les, s[:len(self.buckets)] + [s[-1]]):
+                labels = _label_str(self.labels, key, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{labels} {c}")
+            out.append(f"{self.name}_sum{_label_str(self.labels, key)} {s[-2]}")
+            out.append(f"{self.name}_count{_label_str(self.labels, key)} {s[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, doc, labels=(), **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, doc, labels, **kw)
+            return m
+
+    def counter(self, name, doc, labels=()) -> Counter:
+        return self._get(Counter, name, doc, labels)
+
+    def gauge(self, name, doc, labels=()) -> Gauge:
+        return self._get(Gauge, name, doc, labels)
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, doc, labels, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+# ── metrics shared across modules ────────────────────────────────────
+NODE_SECONDS = registry.histogram(
+    "graph_node_seconds", "Wall time per LangGraph node", ("node",))
+LLM_SECONDS = registry.histogram(
+    "llm_call_seconds", "Wall time per LLM call", ("agent",))
+LLM_TTFT = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time to first streamed token", ("agent",))
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "LLM tokens by agent and kind (prompt/completion)", ("agent", "kind"))
+MCP_TOOL_SECONDS = registry.histogram(
+    "mcp_tool_seconds", "MCP tool invocation latency (hub side)", ("tool",))
+MCP_TOOL_ERRORS = registry.counter(
+    "mcp_tool_errors_total", "MCP tool invocations that raised", ("tool",))
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_seconds", "Warehouse statement duration", ("query",))
+
+
+# ── trace id + per-trace stage timeline ──────────────────────────────
+_trace_id: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+_timeline: contextvars.ContextVar = contextvars.ContextVar("timeline", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(trace_id: str | None = None) -> str:
+    """Begin a trace in the current context (one per request)."""
+    tid = trace_id or new_trace_id()
+    _trace_id.set(tid)
+    _timeline.set([])
+    return tid
+
+
+def current_trace_id() -> str | None:
+    return _trace_id.get()
+
+
+def timeline() -> list[dict]:
+    return list(_timeline.get() or [])
+
+
+def record_stage(stage: str, started: float, seconds: float) -> None:
+    tl = _timeline.get()
+    if tl is not None:
+        tl.append({"stage": stage, "start_ms": round(started * 1000, 2),
+                   "ms": round(seconds * 1000, 2)})
+
+
+@contextmanager
+def span(stage: str, hist: Histogram | None = None, **labels):
+    """Time a block into `hist` and onto the current trace's timeline."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        if hist is not None:
+            hist.observe(dt, **labels)
+        record_stage(stage, t0, dt)
+
+
+def timed(fn, stage: str, hist: Histogram, **labels):
+    """Wrap a sync or async callable in `span(stage, hist, **labels)`."""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def awrapper(*a, **kw):
+            with span(stage, hist, **labels):
+                return await fn(*a, **kw)
+        return awrapper
+
+    @functools.wraps(fn)
+    def wrapper(*a, **kw):
+        with span(stage, hist, **labels):
+            return fn(*a, **kw)
+    return wrapper
+
+
+# ── per-turn recording (profiling.py): what a replay needs to re-run it ──
+_recording: contextvars.ContextVar = contextvars.ContextVar("recording", default=None)
+
+
+def start_recording() -> list[dict]:
+    """Collect record_event() calls made in this context from now on."""
+    events: list[dict] = []
+    _recording.set(events)
+    return events
+
+
+def recording() -> bool:
+    return _recording.get() is not None
+
+
+def record_event(kind: str, **data) -> None:
+    """Append an event (LLM output, tool result, …) to the current recording, if any."""
+    events = _recording.get()
+    if events is not None:
+        events.append({"kind": kind, "at_ms": round(time.perf_counter() * 1000, 2), **data})
+
+
+def log_trace(service: str, total_seconds: float, **extra) -> None:
+    """One structured line per request: the stage breakdown for this trace."""
+    tl = sorted(timeline(), key=lambda s: s["start_ms"])
+    if tl:
+        t0 = tl[0]["start_ms"]
+        tl = [{**s, "start_ms": round(s["start_ms"] - t0, 2)} for s in tl]
+    print(json.dumps({
+        "trace_id": current_trace_id(), "service": service,
+        "total_ms": round(total_seconds * 1000, 2), **extra, "stages": tl,
+    }))
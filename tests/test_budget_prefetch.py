@@ -0,0 +1,60 @@
+# tests/test_budget_prefetch.py
+import asyncio, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("langchain")
+from agents import budget_recommender_agent as agent
+from cache import TTLCache
+from tools.metrics import build_payload
+
+QUESTION = "How did our channels do on 2025-07-10?"
+
+
+class FakeHub:
+    """mcp_client stand-in: get_budget answers at once."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _payload(self, tool, arguments):
+        assert tool == "get_budget"
+        self.calls += 1
+        return build_payload(arguments["day"], [("search", 100.0, 10, 300.0)])
+
+    def invoke(self, tool, arguments):
+        return self._payload(tool, arguments)
+
+    async def ainvoke(self, tool, arguments):
+        return self._payload(tool, arguments)
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    fake = FakeHub()
+    monkeypatch.setattr(agent, "mcp", fake)
+    monkeypatch.setattr(agent, "_tables", TTLCache())
+    return fake
+
+
+def test_cache_hit_is_injected_without_a_fetch(hub):
+    agent._tables.set("2025-07-10", "metrics 2025-07-10\n…")
+    inputs, pending = agent._prepare(QUESTION)
+    assert pending is None and hub.calls == 0
+    assert inputs["prefetched"][1].content == "metrics 2025-07-10\n…"
+
+    inputs, pending = asyncio.run(agent._aprepare(QUESTION))
+    assert pending is None and hub.calls == 0 and "prefetched" in inputs
+
+
+def test_fast_fetch_is_injected(hub):
+    inputs, pending = agent._prepare(QUESTION)
+    assert hub.calls == 1 and pending[2] is True
+    assert "search" in inputs["prefetched"][1].content
+
+
+def test_fast_fetch_is_injected_async(hub):
+    inputs, pending = asyncio.run(agent._aprepare(QUESTION))
+    assert hub.calls == 1 and pending[2] is True
+    assert "search" in inputs["prefetched"][1].content
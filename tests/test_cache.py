@@ -0,0 +1,57 @@
+# tests/test_cache.py
+import asyncio, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import AsyncSingleFlight
+
+
+def test_async_singleflight_coalesces():
+    flight, calls = AsyncSingleFlight(), []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*[flight.do("k", fn) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["ok"] * 5
+    assert len(calls) == 1 and flight.shared == 4 and len(flight) == 0
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    flight, calls = AsyncSingleFlight(), []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader, results
+
+    leader, results = asyncio.run(main())
+    assert leader.cancelled()
+    assert results == [2, 2, 2]          # one re-run, shared by every follower
+    assert len(flight) == 0
+
+
+def test_leader_error_reaches_followers():
+    flight = AsyncSingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*[flight.do("k", fn) for _ in range(3)],
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
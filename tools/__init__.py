@@ -0,0 +1,74 @@
+# tools/__init__.py
+"""
+Tool registry shared by the MCP hub (mcp_tools.py) and the in-process
+transport (mcp_client, MCP_TRANSPORT=local).
+
+Every module in this package that defines `Args` + `run` is a tool.  Modules
+exposing `stats()` / `startup()` / `shutdown()` have them collected as well.
+"""
+import asyncio, importlib, inspect, pkgutil, threading
+import telemetry
+
+# name -> (Args model, run fn)
+TOOLS: dict = {}
+MODULES: dict = {}          # tool name -> module
+STATS: dict = {}
+STARTUP: list = []
+SHUTDOWN: list = []
+
+_discovered = False
+_lock = threading.Lock()
+
+
+def discover() -> dict:
+    """Import every module of the package once; returns TOOLS."""
+    global _discovered
+    with _lock:
+        if _discovered:
+            return TOOLS
+        for _, module_name, _ in pkgutil.iter_modules(__path__):
+            mod = importlib.import_module(f"{__name__}.{module_name}")
+            if hasattr(mod, "Args") and hasattr(mod, "run"):
+                TOOLS[module_name] = (mod.Args, mod.run)
+                MODULES[module_name] = mod
+            if callable(getattr(mod, "stats", None)):
+                STATS[module_name] = mod.stats
+            if callable(getattr(mod, "startup", None)):
+                STARTUP.append(mod.startup)
+            if callable(getattr(mod, "shutdown", None)):
+                SHUTDOWN.append(mod.shutdown)
+        _discovered = True
+    return TOOLS
+
+
+async def call_tool(name: str, arguments: dict):
+    """Validate `arguments` against the tool's Args once and run it."""
+    args_model, run_fn = discover()[name]
+    with telemetry.span(f"tool:{name}", telemetry.MCP_TOOL_SECONDS, tool=name):
+        try:
+            args = args_model(**arguments)
+            result = run_fn(**args.dict())
+
+            # if the tool returned a coroutine, await it
+            if inspect.iscoroutine(result):
+                result = await result
+        except Exception:
+            telemetry.MCP_TOOL_ERRORS.inc(tool=name)
+            raise
+    return result
+
+
+async def call_batch(calls: list[dict]) -> list[dict]:
+    """Run several calls concurrently; one bad call must not sink the batch."""
+    tools = discover()
+
+    async def one(call: dict) -> dict:
+        name = call.get("tool")
+        if name not in tools:
+            return {"tool": name, "error": f"Unknown tool '{name}'"}
+        try:
+            return {"tool": name, "result": await call_tool(name, call.get("arguments", {}))}
+        except Exception as e:
+            return {"tool": name, "error": str(e)}
+
+    return list(await asyncio.gather(*(one(c) for c in calls)))
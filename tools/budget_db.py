@@ -1,32 +1,173 @@
 # tools/budget_db.py
 from datetime import date
-from textwrap import dedent
-from langchain_community.utilities.sql_database import SQLDatabase
-import os
+import asyncio, os, threading
 from dotenv import load_dotenv
 import anyio
+from sqlalchemy import text
+from cache import TTLCache, SingleFlight, AsyncSingleFlight
+from tools.db_pool import DBPool
+from tools.metrics import build_payload
+from tools.write_behind import WriteBehindQueue
+import telemetry
+import bulkhead
 
 load_dotenv()
 
-_db = SQLDatabase.from_uri(
+# METRICS_DB_URI points the tools at another SQLAlchemy database with the
+# same METRICS / PROPOSED_BUDGETS tables (e.g. the SQLite file the benchmarks seed)
+DB_URI = os.getenv("METRICS_DB_URI") or (
     f"snowflake://{os.getenv('SNOWFLAKE_USER')}:{os.getenv('SNOWFLAKE_PASSWORD')}"
     f"@{os.getenv('SNOWFLAKE_ACCOUNT')}/{os.getenv('SNOWFLAKE_DATABASE')}/"
     f"{os.getenv('SNOWFLAKE_SCHEMA')}?warehouse={os.getenv('SNOWFLAKE_WAREHOUSE')}"
 )
+# bounded pool: DB_POOL_MIN connections opened at startup, at most
+# DB_POOL_MAX, every statement cancelled after DB_STATEMENT_TIMEOUT seconds
+pool = DBPool(
+    DB_URI, name="snowflake",
+    min_size=int(os.getenv("DB_POOL_MIN", 2)),
+    # bulkhead slots + the write-behind writer + slack for the warm-up
+    max_size=int(os.getenv("DB_POOL_MAX", bulkhead.get("snowflake").limit + 2)),
+    wait_timeout=float(os.getenv("DB_POOL_WAIT", 10)),
+    statement_timeout=float(os.getenv("DB_STATEMENT_TIMEOUT", 30)),
+    recycle=float(os.getenv("DB_POOL_RECYCLE", 1800)),
+)
 
-def fetch_budget_sync(day: str) -> str:
-    q = f"""
-      SELECT channel, spend, clicks, sales
-      FROM METRICS
-      WHERE DATE = '{day}'
-      ORDER BY channel;
-    """
-    return _db.run(q)
+def engine():
+    # built on first use: create_engine loads the Snowflake dialect (slow import)
+    return pool.engine
 
-async def fetch_budget(day: str) -> str:
-    return await anyio.to_thread.run_sync(fetch_budget_sync, day)
+METRICS_SQL = text("""
+  SELECT channel, spend, clicks, sales
+  FROM METRICS
+  WHERE DATE = :day
+  ORDER BY channel
+""")
 
-def write_proposal_sync(day: str, markdown: str) -> bool:
+# ── metric cache ──────────────────────────────────────────────────
+# Closed days don't change, so they live long; today's rows are still
+# landing and only get a short TTL.
+PAST_DAY_TTL = float(os.getenv("METRICS_CACHE_PAST_TTL", 24 * 3600))
+TODAY_TTL = float(os.getenv("METRICS_CACHE_TODAY_TTL", 60))
+
+_metrics_cache = TTLCache(
+    max_entries=int(os.getenv("METRICS_CACHE_MAX_ENTRIES", 512)),
+    max_bytes=int(os.getenv("METRICS_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    default_ttl=PAST_DAY_TTL,
+)
+_inflight = SingleFlight()      # concurrent misses for one day → one query
+_ainflight = AsyncSingleFlight()    # …and on the async path, one slot + thread
+# day → write generation, bumped by invalidate_budget: a load that started
+# before a write must not put its (now stale) result back into the cache
+_generations: dict = {}
+_gen_lock = threading.Lock()
+
+def _cache_key(day: str) -> str:
+    try:
+        return date.fromisoformat(day.strip()).isoformat()
+    except ValueError:
+        return day.strip()
+
+def _ttl_for(day: str) -> float:
+    try:
+        closed = date.fromisoformat(day) < date.today()
+    except ValueError:
+        closed = False
+    return PAST_DAY_TTL if closed else TODAY_TTL
+
+def _query_budget(day: str) -> dict:
+    with telemetry.span("db:metrics", telemetry.DB_QUERY_SECONDS, query="metrics"), \
+            pool.connect() as conn:
+        rows = conn.execute(METRICS_SQL, {"day": day}).fetchall()
+    return build_payload(day, rows)
+
+METRICS_RANGE_SQL = text("""
+  SELECT DATE, channel, spend, clicks, sales
+  FROM METRICS
+  WHERE DATE BETWEEN :start AND :end
+  ORDER BY DATE, channel
+""")
+
+def fetch_budget_range(start: str, end: str) -> dict:
+    """{day: payload} for every day in [start, end] that has rows – one query, no cache."""
+    with telemetry.span("db:metrics_range", telemetry.DB_QUERY_SECONDS, query="metrics_range"), \
+            pool.connect() as conn:
+        rows = conn.execute(METRICS_RANGE_SQL, {"start": start, "end": end}).fetchall()
+    by_day: dict = {}
+    for r in rows:
+        by_day.setdefault(str(r[0])[:10], []).append(r[1:])
+    return {day: build_payload(day, day_rows) for day, day_rows in by_day.items()}
+
+def _load_budget(day: str, gen: int) -> dict:
+    result = _query_budget(day)
+    with _gen_lock:
+        if _generations.get(day, 0) == gen:
+            _metrics_cache.set(day, result, ttl=_ttl_for(day))
+    return result
+
+def fetch_budget_sync(day: str) -> dict:
+    """Columnar metrics for `day` (see tools/metrics.py for the layout)."""
+    day = _cache_key(day)
+    cached = _metrics_cache.get(day)
+    if cached is not None:
+        return cached
+    gen = _generations.get(day, 0)
+    # keyed on the generation too: callers after a write don't join an older load
+    return _inflight.do((day, gen), _load_budget, day, gen)
+
+def invalidate_budget(day: str) -> None:
+    day = _cache_key(day)
+    with _gen_lock:
+        _generations[day] = _generations.get(day, 0) + 1
+        _metrics_cache.invalidate(day)
+
+def stats() -> dict:
+    """Cache / queue counters surfaced by the MCP hub at /stats."""
+    return {
+        "metrics_cache": {**_metrics_cache.stats(),
+                          "coalesced": _inflight.shared + _ainflight.shared},
+        "proposal_queue": _writer.stats(),
+        "bulkhead": _db_bulkhead.stats(),
+        "pool": pool.stats(),
+    }
+
+# ── Snowflake bulkhead: bounded concurrency + its own worker threads, so a
+#    slow warehouse can't occupy anyio's shared thread pool ──────────────
+_db_bulkhead = bulkhead.get("snowflake")
+_db_limiter = (None, None)          # (event loop, anyio.CapacityLimiter)
+
+def _limiter():
+    global _db_limiter
+    loop = asyncio.get_running_loop()
+    if _db_limiter[0] is not loop:
+        _db_limiter = (loop, anyio.CapacityLimiter(_db_bulkhead.limit))
+    return _db_limiter[1]
+
+async def _in_db_thread(fn, *args):
+    async with _db_bulkhead.slot():
+        return await anyio.to_thread.run_sync(fn, *args, limiter=_limiter())
+
+async def fetch_budget(day: str) -> dict:
+    day = _cache_key(day)
+    cached = _metrics_cache.get(day)
+    if cached is not None:
+        return cached                   # hits never need a slot or a thread
+    # coalesce before taking a bulkhead slot: followers wait on the loop and
+    # hold neither a slot nor a worker thread (futures are per event loop)
+    key = (asyncio.get_running_loop(), day, _generations.get(day, 0))
+    return await _ainflight.do(key, _in_db_thread, fetch_budget_sync, day)
+
+# ── proposal writes ───────────────────────────────────────────────
+INSERT_PROPOSAL_SQL = text("""
+  INSERT INTO PROPOSED_BUDGETS
+      (proposal_date, channel, current_spend, proposed_spend, rationale)
+  VALUES (:proposal_date, :channel, :current_spend, :proposed_spend, :rationale)
+""")
+
+def _number(cell: str) -> float:
+    # tolerate "$1,200.50" / "1 200" as the model sometimes formats them
+    return float(cell.replace(",", "").replace("$", "").replace(" ", ""))
+
+def parse_proposal_table(markdown: str) -> list[dict]:
     """
     Parse a Markdown table like
 
@@ -34,9 +175,8 @@ def write_proposal_sync(day: str, markdown: str) -> bool:
       |---------|---------------|----------------|----|-----------------|
       | google  | 100           | 105            | 5% | Good perf       |
 
-    and insert rows into PROPOSED_BUDGETS.
+    into ProposalRow-shaped dicts. Raises ValueError on non-numeric spends.
     """
-
     rows = []
     for line in markdown.splitlines():
         if not line.startswith("|"):
@@ -46,26 +186,65 @@ def write_proposal_sync(day: str, markdown: str) -> bool:
             continue
         if cells[0].lower() == "channel":   # header row
             continue
-        if set(cells[0]) <= {"-"}:          # separator row
+        if set(cells[0]) <= {"-", ":"}:     # separator row
             continue
 
         channel, cur, prop, _delta, rationale = cells[:5]
-        # Escape single quotes inside rationale
-        rationale = rationale.replace("'", "''")
-        rows.append(
-            f"('{day}', '{channel}', {cur}, {prop}, '{rationale}')"
-        )
+        rows.append({
+            "channel": channel,
+            "current_spend": _number(cur),
+            "proposed_spend": _number(prop),
+            "rationale": rationale,
+        })
+    return rows
 
+def insert_proposal_rows(rows: list[dict]) -> int:
+    """Bulk insert with bound parameters – one executemany, one commit."""
     if not rows:
-        return False
+        return 0
+    with telemetry.span("db:insert_proposal", telemetry.DB_QUERY_SECONDS, query="insert_proposal"), \
+            pool.begin() as conn:
+        conn.execute(INSERT_PROPOSAL_SQL, rows)
+    for day in {r["proposal_date"] for r in rows}:
+        invalidate_budget(day)      # drop anything cached for the days we touched
+    return len(rows)
 
-    sql = dedent(f"""
-        INSERT INTO PROPOSED_BUDGETS 
-            (proposal_date, channel, current_spend, proposed_spend, rationale)
-        VALUES {", ".join(rows)};
-    """)
-    _db.run(sql)            # reuse the same SQLDatabase instance
-    return True
+def _with_date(day: str, rows: list[dict]) -> list[dict]:
+    day = _cache_key(day)
+    return [{"proposal_date": day, **r} for r in rows]
+
+def write_proposal_sync(day: str, markdown: str) -> bool:
+    """Parse the Markdown table and insert it synchronously."""
+    return insert_proposal_rows(_with_date(day, parse_proposal_table(markdown))) > 0
 
 async def write_proposal(day: str, markdown: str) -> bool:
-    return await anyio.to_thread.run_sync(write_proposal_sync, day, markdown)
\ No newline at end of file
+    return await _in_db_thread(write_proposal_sync, day, markdown)
+
+# ── write-behind queue: save_proposal returns once rows are journaled;
+#    each process locks its own journal slot (PROPOSAL_JOURNAL, .1, .2 …) ──
+_writer = WriteBehindQueue(
+    insert_proposal_rows,
+    journal_path=os.getenv("PROPOSAL_JOURNAL", ".cache/proposals.journal"),
+    max_batch=int(os.getenv("PROPOSAL_MAX_BATCH", 500)),
+    max_delay=float(os.getenv("PROPOSAL_MAX_DELAY", 0.5)),
+    max_attempts=int(os.getenv("PROPOSAL_MAX_ATTEMPTS", 5)),
+)
+
+def queue_proposal(day: str, rows: list[dict]) -> int:
+    """Durably queue validated rows for `day`; returns the row count."""
+    return _writer.put(_with_date(day, rows))
+
+def _warm_engine() -> None:
+    try:
+        pool.prewarm()          # dialect import + DB_POOL_MIN connections off the boot path
+    except Exception as e:
+        print(f"[budget_db] warm-up connect failed: {e}")
+
+def startup() -> None:
+    _writer.start()             # replays anything left in the journal
+    if os.getenv("WARMUP", "1") == "1":
+        threading.Thread(target=_warm_engine, name="db-warmup", daemon=True).start()
+
+def shutdown() -> None:
+    _writer.close()             # flush before the hub exits
+    pool.dispose()
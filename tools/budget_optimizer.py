@@ -0,0 +1,144 @@
+# tools/budget_optimizer.py
+"""
+Deterministic budget re-allocation.
+
+Given per-channel spend / sales arrays, shift money toward channels with the
+better return while keeping every channel inside [floor, cap] × its current
+spend and the grand total within ± MAX_TOTAL_SHIFT of today's total.
+
+Weighting: w_i = spend_i · (roas_i / roas_total) ** elasticity.  An elasticity
+below 1 models diminishing marginal returns, so a channel with twice the ROAS
+gets less than twice the extra budget.  A channel with no spend has no ROAS
+of its own: it is weighted at the blended ROAS × NEW_CHANNEL_PRIOR and may get
+a trial budget of up to NEW_CHANNEL_SHARE of the total (0 leaves it out).
+
+The split is λ·w_i clipped to the per-channel bounds; λ is found by false
+position on the (piecewise-linear) clipped total, stopping once it is within
+TOLERANCE of the target.  Cost is O(n) per step, usually a handful of steps,
+with no Python loop over channels – ~0.1–0.2 ms up to 1 000 channels, the
+NumPy call overhead dominating (bench/bench_optimizer.py).
+"""
+import numpy as np
+
+MAX_TOTAL_SHIFT = 0.05     # ± 5 % of the current total
+CHANNEL_FLOOR = 0.70       # a channel keeps at least 70 % of its spend …
+CHANNEL_CAP = 1.30         # … and gets at most 130 %
+ELASTICITY = 0.5
+NEW_CHANNEL_SHARE = 0.02   # a channel with no spend may get up to 2 % of the total …
+NEW_CHANNEL_PRIOR = 1.0    # … weighted as if it earned the blended ROAS
+TOLERANCE = 1e-10          # stop once the total is this close (relative) to the target
+_MAX_ITERATIONS = 60
+
+
+def reallocate(
+    spend,
+    sales,
+    *,
+    total_shift: float = 0.0,
+    max_total_shift: float = MAX_TOTAL_SHIFT,
+    floor: float = CHANNEL_FLOOR,
+    cap: float = CHANNEL_CAP,
+    elasticity: float = ELASTICITY,
+    new_channel_share: float = NEW_CHANNEL_SHARE,
+    new_channel_prior: float = NEW_CHANNEL_PRIOR,
+) -> np.ndarray:
+    """
+    Return the proposed spend per channel.
+
+    total_shift – requested relative change of the total (e.g. 0.03 → +3 %),
+                  clipped to ± max_total_shift.
+    """
+    spend = np.asarray(spend, dtype=np.float64)
+    sales = np.asarray(sales, dtype=np.float64)
+    if spend.shape != sales.shape or spend.ndim != 1:
+        raise ValueError("spend and sales must be 1-D arrays of equal length")
+    if spend.size == 0:
+        return spend.copy()
+    spend = np.clip(spend, 0.0, None)
+
+    current_total = spend.sum()
+    if current_total <= 0:
+        return np.zeros_like(spend)
+
+    # ── weights: spend scaled by relative ROAS ────────────────────────
+    roas = np.divide(sales, spend, out=np.zeros_like(spend), where=spend > 0)
+    ref = sales.sum() / current_total
+    rel = roas / ref if ref > 0 else np.ones_like(spend)
+    # no spend → no ROAS of its own: trial budget at the prior instead of 0
+    new = spend <= 0
+    base = np.where(new, new_channel_share * current_total, spend)
+    rel = np.where(new, new_channel_prior, rel)
+    weights = base * np.power(np.clip(rel, 0.0, None), elasticity)
+
+    lo = spend * floor
+    hi = np.where(new, base, spend * cap)
+
+    shift = float(np.clip(total_shift, -max_total_shift, max_total_shift))
+    target = float(np.clip(current_total * (1.0 + shift), lo.sum(), hi.sum()))
+
+    # ── find λ with Σ clip(λ·w, lo, hi) == target ────────────────────
+    if weights.sum() <= 0:
+        # nothing earns anything: scale uniformly inside the bounds
+        weights = base.copy()
+    active = weights > 0
+    # every channel saturates at its cap once λ ≥ max(hi/w)
+    lam_lo, lam_hi = 0.0, float(np.max(hi[active] / weights[active]))
+    f_lo = np.clip(lam_lo * weights, lo, hi).sum() - target
+    f_hi = np.clip(lam_hi * weights, lo, hi).sum() - target
+    tol = TOLERANCE * max(target, 1.0)
+    lam, side = lam_hi, 0
+    # Illinois false position: the total is piecewise linear in λ, so this
+    # lands within a few steps; stop as soon as the total is within `tol`
+    for _ in range(_MAX_ITERATIONS):
+        if abs(f_lo) <= tol or abs(f_hi) <= tol or f_hi == f_lo:
+            break
+        lam = lam_lo - f_lo * (lam_hi - lam_lo) / (f_hi - f_lo)
+        f = np.clip(lam * weights, lo, hi).sum() - target
+        if f < 0:
+            lam_lo, f_lo = lam, f
+            if side == -1:
+                f_hi *= 0.5
+            side = -1
+        else:
+            lam_hi, f_hi = lam, f
+            if side == 1:
+                f_lo *= 0.5
+            side = 1
+    lam = lam_lo if abs(f_lo) < abs(f_hi) else lam_hi
+    return np.clip(lam * weights, lo, hi)
+
+def propose(payload: dict, **opts) -> dict:
+    """Run `reallocate` on a get_budget payload (see tools/metrics.py)."""
+    channel = payload.get("channel", [])
+    current = np.asarray(payload.get("spend", []), dtype=np.float64)
+    proposed = np.round(reallocate(current, payload.get("sales", []), **opts), 2)
+    delta = np.divide(proposed - current, current,
+                      out=np.zeros_like(current), where=current > 0) * 100
+
+    result = {
+        "day": payload.get("day"),
+        "channel": list(channel),
+        "current_spend": current.tolist(),
+        "proposed_spend": proposed.tolist(),
+        "delta_pct": np.round(delta, 1).tolist(),
+        "roas": payload.get("roas", []),
+        "totals": {
+            "current_spend": round(float(current.sum()), 2),
+            "proposed_spend": round(float(proposed.sum()), 2),
+        },
+    }
+    result["table_markdown"] = to_markdown(result)
+    return result
+
+
+def to_markdown(result: dict) -> str:
+    """Proposal table with an empty rationale column for the LLM to fill."""
+    lines = [
+        "| channel | current_spend | proposed_spend | Δ% | brief_rationale |",
+        "|---------|---------------|----------------|----|-----------------|",
+    ]
+    for ch, cur, prop, d in zip(result["channel"], result["current_spend"],
+                                result["proposed_spend"], result["delta_pct"]):
+        change = "new" if cur == 0 and prop > 0 else f"{d:+.1f}%"
+        lines.append(f"| {ch} | {cur:.2f} | {prop:.2f} | {change} |  |")
+    return "\n".join(lines)
@@ -0,0 +1,209 @@
+# tools/db_pool.py
+"""
+Bounded, pre-warmed SQLAlchemy connection pool for the warehouse.
+
+• `min_size` connections are opened by `prewarm()` and kept; up to `max_size`
+  in total under load.  Waiting longer than `wait_timeout` for one raises
+  bulkhead.Rejected (→ 503 + Retry-After on the hub) instead of hanging.
+• every statement runs under a watchdog: after `statement_timeout` seconds
+  the query is cancelled through the driver (Snowflake
+  SYSTEM$CANCEL_ALL_QUERIES, sqlite3 / DuckDB `interrupt()`), the connection
+  is dropped and `StatementTimeout` is raised.  On Snowflake the session also
+  gets STATEMENT_TIMEOUT_IN_SECONDS, so the server stops the query even if
+  this process dies.
+• connections are pre-pinged on checkout and recycled after `recycle` seconds.
+• wait time, connections in use, pool size and utilisation → /metrics.
+
+The same class runs against SQLite (or DuckDB via duckdb_engine), which is
+what the benchmarks use instead of Snowflake.
+"""
+import os, threading, time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import QueuePool
+import telemetry
+import bulkhead
+
+WAIT_SECONDS = telemetry.registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled DB connection", ("pool",))
+IN_USE = telemetry.registry.gauge(
+    "db_pool_in_use", "Pooled DB connections checked out", ("pool",))
+OPEN = telemetry.registry.gauge(
+    "db_pool_open", "DB connections open (idle + in use)", ("pool",))
+UTILISATION = telemetry.registry.gauge(
+    "db_pool_utilisation", "Checked-out connections / max_size", ("pool",))
+TIMEOUTS = telemetry.registry.counter(
+    "db_statement_timeouts_total", "Statements cancelled at the statement timeout", ("pool",))
+
+
+class StatementTimeout(TimeoutError):
+    """A statement ran past the pool's statement timeout and was cancelled."""
+
+
+class DBPool:
+    def __init__(self, uri: str, name: str = "db", min_size: int = 2, max_size: int = 10,
+                 wait_timeout: float = 10.0, statement_timeout: float = 30.0,
+                 recycle: float = 1800.0):
+        self.uri, self.name = uri, name
+        self.min_size, self.max_size = min_size, max(min_size, max_size)
+        self.wait_timeout = wait_timeout
+        self.statement_timeout = statement_timeout
+        self.recycle = recycle
+        self.timeouts = self.opened = 0
+        self._in_use = 0
+        self._engine = None
+        self._lock = threading.Lock()
+
+    # ── engine (built on first use: the Snowflake dialect is a slow import) ──
+    @property
+    def dialect(self) -> str:
+        return self.uri.split(":", 1)[0].split("+", 1)[0]
+
+    def _connect_args(self) -> dict:
+        if self.dialect == "snowflake" and self.statement_timeout:
+            return {"session_parameters": {
+                "STATEMENT_TIMEOUT_IN_SECONDS": int(self.statement_timeout) + 1}}
+        if self.dialect == "sqlite":
+            return {"check_same_thread": False}     # pooled across worker threads
+        return {}
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(
+                        self.uri,
+                        poolclass=QueuePool,
+                        pool_size=self.min_size,
+                        max_overflow=self.max_size - self.min_size,
+                        pool_timeout=self.wait_timeout,
+                        pool_recycle=self.recycle,
+                        pool_pre_ping=True,
+                        connect_args=self._connect_args(),
+                    )
+                    self._instrument(engine)
+                    self._engine = engine
+        return self._engine
+
+    # ── statement watchdog + pool gauges ─────────────────────────────
+    def _instrument(self, engine) -> None:
+        @event.listens_for(engine, "connect")
+        def _opened(dbapi_conn, record):
+            self.opened += 1
+            self._gauges(engine)
+
+        @event.listens_for(engine, "close")
+        def _closed(dbapi_conn, record):
+            self._gauges(engine)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _arm(conn, cursor, statement, parameters, context, executemany):
+            if self.statement_timeout:
+                timer = threading.Timer(self.statement_timeout, self._cancel,
+                                        (conn.connection.dbapi_connection, conn.info))
+                timer.daemon = True
+                conn.info["watchdog"] = timer
+                conn.info["timed_out"] = False
+                timer.start()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _disarm(conn, cursor, statement, parameters, context, executemany):
+            timer = conn.info.pop("watchdog", None)
+            if timer is not None:
+                timer.cancel()
+
+        @event.listens_for(engine, "handle_error")
+        def _failed(ctx):
+            info = ctx.connection.info if ctx.connection is not None else {}
+            timer = info.pop("watchdog", None)
+            if timer is not None:
+                timer.cancel()
+            if info.pop("timed_out", False):
+                ctx.is_disconnect = True            # don't hand a cancelled session back
+                return StatementTimeout(
+                    f"{self.name}: statement cancelled after {self.statement_timeout:g}s")
+
+    def _cancel(self, dbapi_conn, info: dict) -> None:
+        info["timed_out"] = True
+        self.timeouts += 1
+        TIMEOUTS.inc(pool=self.name)
+        try:
+            if self.dialect == "snowflake":
+                cur = dbapi_conn.cursor()
+                cur.execute(f"SELECT SYSTEM$CANCEL_ALL_QUERIES({dbapi_conn.session_id})")
+                cur.close()
+            else:
+                dbapi_conn.interrupt()              # sqlite3 / duckdb
+        except Exception as e:
+            print(f"[db_pool:{self.name}] cancel failed: {e}")
+
+    def _gauges(self, engine=None) -> None:
+        pool = (engine or self._engine).pool
+        OPEN.set(pool.checkedin() + pool.checkedout(), pool=self.name)
+        IN_USE.set(self._in_use, pool=self.name)
+        UTILISATION.set(self._in_use / self.max_size, pool=self.name)
+
+    # ── checkout ─────────────────────────────────────────────────────
+    def _checkout(self, begin: bool):
+        t0 = time.perf_counter()
+        try:
+            ctx = self.engine.begin() if begin else self.engine.connect()
+            conn = ctx.__enter__()
+        except exc.TimeoutError:
+            WAIT_SECONDS.observe(time.perf_counter() - t0, pool=self.name)
+            raise bulkhead.Rejected(f"{self.name}-pool", "timeout", self.wait_timeout)
+        WAIT_SECONDS.observe(time.perf_counter() - t0, pool=self.name)
+        with self._lock:
+            self._in_use += 1
+        self._gauges()
+        return ctx, conn
+
+    @contextmanager
+    def _checked_out(self, begin: bool):
+        ctx, conn = self._checkout(begin)
+        try:
+            yield conn
+        except BaseException as e:
+            if not ctx.__exit__(type(e), e, e.__traceback__):
+                raise
+        else:
+            ctx.__exit__(None, None, None)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._gauges()
+
+    def connect(self):
+        """`with pool.connect() as conn:` – a pooled connection, statements guarded."""
+        return self._checked_out(begin=False)
+
+    def begin(self):
+        """Like connect(), inside a transaction committed on exit."""
+        return self._checked_out(begin=True)
+
+    # ── lifecycle ────────────────────────────────────────────────────
+    def prewarm(self) -> int:
+        """Open `min_size` connections now rather than on the first queries."""
+        conns = []
+        try:
+            for _ in range(self.min_size):
+                conns.append(self.engine.connect())
+        finally:
+            for c in conns:
+                c.close()                           # back to the pool, still open
+            if self._engine is not None:
+                self._gauges()
+        return len(conns)
+
+    def dispose(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+
+    def stats(self) -> dict:
+        out = {"min_size": self.min_size, "max_size": self.max_size,
+               "in_use": self._in_use, "opened": self.opened,
+               "statement_timeouts": self.timeouts}
+        if self._engine is not None:
+            out["open"] = self._engine.pool.checkedin() + self._engine.pool.checkedout()
+        return out
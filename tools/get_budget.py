@@ -6,5 +6,5 @@ import anyio
 class Args(BaseModel):
     day: str
 
-async def run(day: str) -> str:
+async def run(day: str) -> dict:
      return await fetch_budget(day)
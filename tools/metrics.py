@@ -0,0 +1,79 @@
+# tools/metrics.py
+"""
+Columnar metric payloads returned by `get_budget`.
+
+The hub ships a typed, column-oriented dict (one list per field) with the
+derived ratios computed server-side; `render_compact` turns it into the
+token-lean text block the budget agent puts in front of the LLM.
+
+METRICS carries no impressions, so the derived ratios are ROAS (sales/spend)
+and CPC (spend/clicks).
+"""
+
+BASE_COLUMNS = ("channel", "spend", "clicks", "sales")
+DERIVED_COLUMNS = ("roas", "cpc")
+
+
+def _ratio(num: float, den: float) -> float | None:
+    return round(num / den, 4) if den else None
+
+
+def build_payload(day: str, rows) -> dict:
+    """rows = [(channel, spend, clicks, sales), …] straight from the cursor."""
+    channel = [str(r[0]) for r in rows]
+    spend = [float(r[1] or 0) for r in rows]
+    clicks = [int(r[2] or 0) for r in rows]
+    sales = [float(r[3] or 0) for r in rows]
+
+    tot_spend, tot_clicks, tot_sales = sum(spend), sum(clicks), sum(sales)
+    return {
+        "day": day,
+        "columns": list(BASE_COLUMNS + DERIVED_COLUMNS),
+        "channel": channel,
+        "spend": spend,
+        "clicks": clicks,
+        "sales": sales,
+        "roas": [_ratio(s, p) for s, p in zip(sales, spend)],
+        "cpc": [_ratio(p, c) for p, c in zip(spend, clicks)],
+        "totals": {
+            "spend": round(tot_spend, 2),
+            "clicks": tot_clicks,
+            "sales": round(tot_sales, 2),
+            "roas": _ratio(tot_sales, tot_spend),
+            "cpc": _ratio(tot_spend, tot_clicks),
+        },
+    }
+
+
+def _fmt(v) -> str:
+    if v is None:
+        return "-"
+    if isinstance(v, float):
+        return f"{v:.2f}".rstrip("0").rstrip(".") if v % 1 else str(int(v))
+    return str(v)
+
+
+def render_compact(payload: dict) -> str:
+    """Pipe-separated block: one header line, one line per channel, a total."""
+    if not payload.get("channel"):
+        return f"metrics {payload.get('day')}: no rows"
+    cols = payload["columns"]
+    lines = [f"metrics {payload['day']}", "|".join(cols)]
+    for i in range(len(payload["channel"])):
+        lines.append("|".join(_fmt(payload[c][i]) for c in cols))
+    t = payload["totals"]
+    lines.append("|".join(["TOTAL"] + [_fmt(t.get(c)) for c in cols[1:]]))
+    return "\n".join(lines)
+
+
+def render_trend(payload: dict) -> str:
+    """metrics_trend payload → one line per channel (values per period, last change)."""
+    if not payload.get("periods"):
+        return f"{payload.get('metric')} by {payload.get('grain')}: no rows"
+    lines = [f"{payload['metric']} by {payload['grain']}",
+             "|".join(["channel"] + payload["periods"] + ["change_%"])]
+    for i, ch in enumerate(payload["channel"]):
+        lines.append("|".join([ch] + [_fmt(v) for v in payload["values"][i]]
+                              + [_fmt(payload["change_pct"][i])]))
+    lines.append("|".join(["TOTAL"] + [_fmt(v) for v in payload["total"]] + [""]))
+    return "\n".join(lines)
@@ -0,0 +1,14 @@
+# tools/metrics_range.py
+from datetime import date
+from pydantic import BaseModel
+import anyio
+from tools.metrics_replica import range_payload
+
+class Args(BaseModel):
+    start: date
+    end: date                   # inclusive
+    channels: list[str] = []    # empty → every channel
+
+async def run(start: date, end: date, channels: list[str] | None = None) -> dict:
+    # served from the local replica; may block briefly on a due sync
+    return await anyio.to_thread.run_sync(range_payload, start, end, channels or [])
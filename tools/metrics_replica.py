@@ -0,0 +1,372 @@
+# tools/metrics_replica.py
+"""
+Local columnar replica of METRICS for multi-day questions.
+
+Layout under METRICS_REPLICA_DIR (memory-mapped NumPy, one file per array):
+
+    daily_{spend,clicks,sales}.npy    [n_days, n_channels]  per-channel daily sums
+    weekly_{spend,clicks,sales}.npy   [n_weeks, n_channels] ISO-week rollups
+    meta.json                         base day, channels, watermark, version
+
+Row d of the daily arrays is `base + d days`; row w of the weekly arrays is
+the week starting on `week_base + 7·w days` (a Monday).  Ratios (ROAS, CPC)
+are derived from the summed columns at query time, vectorised over channels.
+
+`sync()` asks the warehouse only for days at or after the DATE watermark
+(minus METRICS_REPLICA_LOOKBACK days for late rows), grouped by day and
+channel, and rewrites the files atomically.  Readers keep whichever snapshot
+they opened.  Several processes may share the directory: an flock on
+`.lock` orders their writes (exclusive) against loads (shared), and each
+sync merges into the newest version on disk.
+
+Weekly series cover only the days inside the requested range: a week cut by
+either end is summed from the daily rows and labelled with its first day in
+range, and `period_days` says how many days each period holds.  The weekly
+change compares the last period with the same weekdays a week earlier.
+"""
+import fcntl, json, os, threading, time
+from contextlib import contextmanager
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import text
+import telemetry
+
+REPLICA_DIR = os.getenv("METRICS_REPLICA_DIR", ".cache/metrics_replica")
+SYNC_INTERVAL = float(os.getenv("METRICS_SYNC_INTERVAL", 300))      # seconds
+LOOKBACK_DAYS = int(os.getenv("METRICS_REPLICA_LOOKBACK", 2))      # late-arriving rows
+HISTORY_DAYS = int(os.getenv("METRICS_REPLICA_HISTORY", 800))      # first sync
+MEASURES = ("spend", "clicks", "sales")
+RATIOS = {"roas": ("sales", "spend"), "cpc": ("spend", "clicks")}
+
+SYNC_SECONDS = telemetry.registry.histogram(
+    "metrics_replica_sync_seconds", "Incremental METRICS replica syncs")
+SYNC_ROWS = telemetry.registry.counter(
+    "metrics_replica_rows_total", "Warehouse rows pulled into the METRICS replica")
+
+SYNC_SQL = text("""
+  SELECT DATE, channel, SUM(spend), SUM(clicks), SUM(sales)
+  FROM METRICS
+  WHERE DATE >= :since
+  GROUP BY DATE, channel
+""")
+
+
+def _day(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def _monday(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+class Snapshot:
+    """One consistent version of the replica (arrays memory-mapped read-only)."""
+
+    def __init__(self, meta: dict, daily: dict, weekly: dict):
+        self.meta, self.daily, self.weekly = meta, daily, weekly
+        self.channels: list[str] = meta["channels"]
+        self.base = date.fromisoformat(meta["base"]) if meta["base"] else None
+        self.week_base = date.fromisoformat(meta["week_base"]) if meta["week_base"] else None
+
+    @property
+    def empty(self) -> bool:
+        return self.base is None or not self.channels
+
+    def _columns(self, channels) -> np.ndarray:
+        if not channels:
+            return np.arange(len(self.channels))
+        wanted = {c.lower() for c in channels}
+        return np.array([i for i, c in enumerate(self.channels) if c.lower() in wanted], dtype=int)
+
+    def _rows(self, start: date, end: date, base: date, step: int, n: int) -> slice:
+        lo = max(0, (start - base).days // step)
+        hi = min(n, (end - base).days // step + 1)
+        return slice(lo, max(lo, hi))
+
+    # ── queries ──────────────────────────────────────────────────────
+    def _daily_sums(self, start: date, end: date, cols: np.ndarray) -> dict:
+        rows = self._rows(start, end, self.base, 1, self.daily["spend"].shape[0])
+        return {m: self.daily[m][rows][:, cols].sum(axis=0) for m in MEASURES}
+
+    def range_sums(self, start: date, end: date, channels=None):
+        """(channel names, {measure: per-channel sums}, days with data)."""
+        cols = self._columns(channels)
+        if self.empty or cols.size == 0:
+            return [], {m: np.zeros(0) for m in MEASURES}, 0
+        rows = self._rows(start, end, self.base, 1, self.daily["spend"].shape[0])
+        active = self.daily["spend"][rows][:, cols].sum(axis=1) > 0
+        return [self.channels[i] for i in cols], self._daily_sums(start, end, cols), \
+            int(active.sum())
+
+    def series(self, grain: str, start: date, end: date, channels=None):
+        """(period starts, channel names, {measure: [n_periods, n_channels]}, days per period)."""
+        cols = self._columns(channels)
+        if self.empty or cols.size == 0:
+            return [], [], {m: np.zeros((0, 0)) for m in MEASURES}, []
+        if grain != "week":
+            rows = self._rows(start, end, self.base, 1, self.daily["spend"].shape[0])
+            periods = [(self.base + timedelta(days=i)).isoformat()
+                       for i in range(rows.start, rows.stop)]
+            return periods, [self.channels[i] for i in cols], \
+                {m: self.daily[m][rows][:, cols] for m in MEASURES}, [1] * len(periods)
+
+        rows = self._rows(_monday(start), end, self.week_base, 7, self.weekly["spend"].shape[0])
+        arrays = {m: np.array(self.weekly[m][rows][:, cols], dtype=float) for m in MEASURES}
+        periods, days = [], []
+        for k, i in enumerate(range(rows.start, rows.stop)):
+            monday = self.week_base + timedelta(weeks=i)
+            lo, hi = max(monday, start), min(monday + timedelta(days=6), end)
+            if (hi - lo).days < 6:        # cut by the range: only its days in range
+                for m, sums in self._daily_sums(lo, hi, cols).items():
+                    arrays[m][k] = sums
+            periods.append(lo.isoformat())
+            days.append((hi - lo).days + 1)
+        return periods, [self.channels[i] for i in cols], arrays, days
+
+
+def ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    out = np.full(np.shape(num), np.nan)
+    np.divide(num, den, out=out, where=np.asarray(den) > 0)
+    return out
+
+
+class MetricsReplica:
+    def __init__(self, path: str = REPLICA_DIR, sync_interval: float = SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.last_sync = 0.0            # monotonic
+        self.last_sync_rows = 0
+        self.syncs = 0
+        self._snapshot: Snapshot | None = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ── disk ─────────────────────────────────────────────────────────
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _dir_lock(self, exclusive: bool):
+        """flock on <dir>/.lock: writers exclusive, loads shared (across processes)."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _load(self) -> Snapshot:
+        with self._dir_lock(exclusive=False):
+            return self._load_locked()
+
+    def _load_locked(self) -> Snapshot:
+        try:
+            with open(self._file("meta.json"), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except FileNotFoundError:
+            meta = {"version": 0, "base": None, "week_base": None,
+                    "channels": [], "watermark": None}
+            empty = {m: np.zeros((0, 0)) for m in MEASURES}
+            return Snapshot(meta, empty, dict(empty))
+        v = meta["version"]
+        daily = {m: np.load(self._file(f"daily_{m}.{v}.npy"), mmap_mode="r") for m in MEASURES}
+        weekly = {m: np.load(self._file(f"weekly_{m}.{v}.npy"), mmap_mode="r") for m in MEASURES}
+        return Snapshot(meta, daily, weekly)
+
+    def _write(self, meta: dict, daily: dict, weekly: dict) -> None:
+        """New versioned array files, then meta.json swapped in atomically (dir lock held)."""
+        v = meta["version"]
+        for m in MEASURES:
+            np.save(self._file(f"daily_{m}.{v}.npy"), daily[m])
+            np.save(self._file(f"weekly_{m}.{v}.npy"), weekly[m])
+        tmp = self._file(f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._file("meta.json"))
+        for name in os.listdir(self.path):      # older versions; open mmaps stay valid
+            if name.endswith(".npy") and not name.endswith(f".{v}.npy"):
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+
+    def snapshot(self) -> Snapshot:
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load()
+        return self._snapshot
+
+    # ── sync ─────────────────────────────────────────────────────────
+    def _fetch(self, since: date) -> list:
+        from tools.budget_db import pool          # the warehouse pool (tools/db_pool.py)
+        with telemetry.span("db:replica_sync", telemetry.DB_QUERY_SECONDS, query="replica_sync"), \
+                pool.connect() as conn:
+            return conn.execute(SYNC_SQL, {"since": since.isoformat()}).fetchall()
+
+    def sync(self) -> int:
+        """Pull days ≥ watermark − lookback; returns the warehouse rows read."""
+        with self._lock:
+            t0 = time.perf_counter()
+            old = self._load()          # another process may have synced since
+            watermark = old.meta["watermark"]
+            since = (date.fromisoformat(watermark) - timedelta(days=LOOKBACK_DAYS)
+                     if watermark else date.today() - timedelta(days=HISTORY_DAYS))
+            rows = self._fetch(since)
+            with self._dir_lock(exclusive=True):
+                latest = self._load_locked()
+                if latest.meta["version"] != old.meta["version"]:
+                    # lost the race: merge into theirs; our rows still cover `since` on
+                    old = latest
+                self._snapshot = self._merge(old, since, rows)
+            self.last_sync, self.last_sync_rows = time.monotonic(), len(rows)
+            self.syncs += 1
+            SYNC_ROWS.inc(len(rows))
+            SYNC_SECONDS.observe(time.perf_counter() - t0)
+            return len(rows)
+
+    def _merge(self, old: Snapshot, since: date, rows: list) -> Snapshot:
+        days = [_day(r[0]) for r in rows]
+        channels = list(old.channels)
+        for ch in sorted({str(r[1]) for r in rows} - set(channels)):
+            channels.append(ch)
+        if not channels or (old.empty and not days):
+            return old
+
+        span = list(days)
+        if not old.empty:
+            span += [old.base, old.base + timedelta(days=old.daily["spend"].shape[0] - 1)]
+        base, last = min(span), max(span)
+        n_days, n_ch = (last - base).days + 1, len(channels)
+
+        daily = {m: np.zeros((n_days, n_ch)) for m in MEASURES}
+        if not old.empty:
+            off, n_old = (old.base - base).days, old.daily["spend"].shape[0]
+            for m in MEASURES:
+                daily[m][off:off + n_old, :len(old.channels)] = old.daily[m]
+        # days from `since` on are replaced by what the warehouse has now
+        cut = max(0, (since - base).days)
+        for m in MEASURES:
+            daily[m][cut:] = 0
+        if rows:
+            d_idx = np.array([(d - base).days for d in days])
+            c_pos = {c: i for i, c in enumerate(channels)}
+            c_idx = np.array([c_pos[str(r[1])] for r in rows])
+            for k, m in enumerate(MEASURES, start=2):
+                np.add.at(daily[m], (d_idx, c_idx), np.array([float(r[k] or 0) for r in rows]))
+
+        # weekly rollups: pad to whole Monday-aligned weeks, reshape, sum
+        week_base = _monday(base)
+        lead = (base - week_base).days
+        n_weeks = -(-(lead + n_days) // 7)
+        weekly = {}
+        for m in MEASURES:
+            padded = np.zeros((n_weeks * 7, n_ch))
+            padded[lead:lead + n_days] = daily[m]
+            weekly[m] = padded.reshape(n_weeks, 7, n_ch).sum(axis=1)
+
+        watermark = max(days).isoformat() if days else old.meta["watermark"]
+        meta = {"version": old.meta["version"] + 1, "base": base.isoformat(),
+                "week_base": week_base.isoformat(), "channels": channels,
+                "watermark": watermark, "synced_at": time.time()}
+        self._write(meta, daily, weekly)
+        return self._load_locked()
+
+    def ensure_fresh(self) -> Snapshot:
+        """Sync when the last one is older than the interval; sync errors keep the old data."""
+        if time.monotonic() - self.last_sync >= self.sync_interval:
+            with self._refresh_lock:            # one caller syncs, the rest reuse it
+                if time.monotonic() - self.last_sync >= self.sync_interval:
+                    try:
+                        self.sync()
+                    except Exception as e:
+                        print(f"[metrics_replica] sync failed, serving last snapshot: {e}")
+                        self.last_sync = time.monotonic()   # don't retry on every call
+        return self.snapshot()
+
+    # ── background refresh (hub lifecycle) ──────────────────────────
+    def _loop(self) -> None:
+        while True:
+            self.ensure_fresh()
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="metrics-replica", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        meta = snap.meta if snap else {}
+        return {"watermark": meta.get("watermark"), "channels": len(meta.get("channels", [])),
+                "days": snap.daily["spend"].shape[0] if snap and not snap.empty else 0,
+                "syncs": self.syncs, "last_sync_rows": self.last_sync_rows}
+
+
+replica = MetricsReplica()
+
+
+# ── query helpers used by the metrics_range / metrics_trend tools ────
+def range_payload(start: date, end: date, channels=None) -> dict:
+    """Per-channel totals over [start, end] in the get_budget payload layout."""
+    from tools.metrics import build_payload
+    names, sums, days = replica.ensure_fresh().range_sums(start, end, channels)
+    rows = list(zip(names, sums["spend"].round(2).tolist(),
+                    sums["clicks"].astype(int).tolist(), sums["sales"].round(2).tolist()))
+    payload = build_payload(f"{start.isoformat()}..{end.isoformat()}", rows)
+    payload["days_with_data"] = days
+    return payload
+
+def trend_payload(metric: str, grain: str, start: date, end: date, channels=None) -> dict:
+    """One series per channel plus the total, and the last-vs-previous change."""
+    snap = replica.ensure_fresh()
+    periods, names, arrays, days = snap.series(grain, start, end, channels)
+
+    def metric_of(sums: dict) -> np.ndarray:
+        if metric in RATIOS:
+            num, den = RATIOS[metric]
+            return ratio(sums[num], sums[den])
+        return np.asarray(sums[metric])
+
+    values = metric_of(arrays)
+    total = metric_of({m: np.asarray(a).sum(axis=1) for m, a in arrays.items()})
+    change = None
+    if len(periods) >= 2:
+        previous = values[-2]
+        if grain == "week":
+            # the same weekdays one week earlier, so a week-to-date compares fairly
+            lo = date.fromisoformat(periods[-1])
+            hi = lo + timedelta(days=days[-1] - 1)
+            _, sums, _ = snap.range_sums(lo - timedelta(weeks=1), hi - timedelta(weeks=1),
+                                         channels)
+            previous = metric_of(sums)
+        change = ratio(values[-1] - previous, np.abs(previous)) * 100
+
+    def clean(a) -> list:
+        return [None if np.isnan(v) else round(float(v), 4) for v in np.ravel(a)]
+
+    return {
+        "metric": metric, "grain": grain, "periods": periods, "period_days": days,
+        "channel": names,
+        "values": [clean(values[:, i]) for i in range(len(names))],
+        "total": clean(total),
+        "change_pct": clean(change) if change is not None else [None] * len(names),
+    }
+
+
+# ── module hooks picked up by tools.discover() ───────────────────────
+def startup() -> None:
+    if os.getenv("METRICS_REPLICA", "1") == "1":
+        replica.start()
+
+def shutdown() -> None:
+    replica.stop()
+
+def stats() -> dict:
+    return replica.stats()
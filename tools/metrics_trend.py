@@ -0,0 +1,18 @@
+# tools/metrics_trend.py
+from datetime import date
+from typing import Literal
+from pydantic import BaseModel
+import anyio
+from tools.metrics_replica import trend_payload
+
+class Args(BaseModel):
+    start: date
+    end: date                                               # inclusive
+    metric: Literal["spend", "clicks", "sales", "roas", "cpc"] = "roas"
+    grain: Literal["day", "week"] = "day"
+    channels: list[str] = []
+
+async def run(start: date, end: date, metric: str = "roas", grain: str = "day",
+              channels: list[str] | None = None) -> dict:
+    return await anyio.to_thread.run_sync(trend_payload, metric, grain, start, end,
+                                         channels or [])
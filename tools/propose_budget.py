@@ -0,0 +1,12 @@
+# tools/propose_budget_tool.py
+from pydantic import BaseModel
+from tools.budget_db import fetch_budget
+from tools.budget_optimizer import propose
+
+class Args(BaseModel):
+    day: str
+    total_shift: float = 0.0     # requested change of the total, clipped to ± 5 %
+
+async def run(day: str, total_shift: float = 0.0) -> dict:
+    payload = await fetch_budget(day)        # served from the metric cache when warm
+    return propose(payload, total_shift=total_shift)
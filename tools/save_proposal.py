@@ -1,12 +1,19 @@
 # tools/save_proposal_tool.py
+from datetime import date
 from pydantic import BaseModel
-from tools.budget_db import write_proposal
-import anyio
+from tools.budget_db import queue_proposal, parse_proposal_table
+from tools.schemas import ProposalRow
 
 class Args(BaseModel):
-    budget_date: str
-    table_markdown: str
+    budget_date: date
+    rows: list[ProposalRow] = []
+    table_markdown: str | None = None      # legacy: parsed once into rows
 
-async  def run(budget_date: str, table_markdown: str) -> str:
-    ok =  await write_proposal(budget_date, table_markdown)
-    return "Saved" if ok else "Nothing written"
+async def run(budget_date: date, rows: list, table_markdown: str | None = None) -> str:
+    if not rows and table_markdown:
+        rows = [ProposalRow(**r).dict() for r in parse_proposal_table(table_markdown)]
+    if not rows:
+        return "Nothing written"
+    # journaled + queued; the background writer batches it into PROPOSED_BUDGETS
+    n = queue_proposal(budget_date.isoformat(), rows)
+    return f"Saved ({n} rows queued)"
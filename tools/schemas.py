@@ -0,0 +1,10 @@
+# tools/schemas.py
+"""Typed tool arguments shared by the MCP hub and the agents (no DB imports)."""
+from pydantic import BaseModel, Field
+
+
+class ProposalRow(BaseModel):
+    channel: str = Field(min_length=1, max_length=128)
+    current_spend: float = Field(ge=0)
+    proposed_spend: float = Field(ge=0)
+    rationale: str = Field(default="", max_length=1000)
@@ -0,0 +1,254 @@
+# tools/write_behind.py
+"""
+Write-behind queue for proposal rows.
+
+`put` appends the rows to a local journal (fsync'd) and returns – at that
+point the write is durable.  A background thread drains the queue,
+coalescing whatever many sessions queued into one `flush_fn(rows)` call
+(a single executemany).  Unflushed journal entries are replayed on start,
+and `close()` drains everything before the process exits.
+
+A failed batch is retried entry by entry, so one bad proposal doesn't hold
+back the others; an entry that fails `max_attempts` times is moved to
+`<journal>.dead` (counted in stats) instead of being retried forever.
+
+Each process locks the journal it uses: `journal_path`, or `.1`, `.2` … when
+another live process holds it.  A slot left by a crashed process is free
+again and is replayed by whoever claims it next.
+"""
+import fcntl, json, os, threading, time
+
+MAX_SLOTS = 64
+
+
+class WriteBehindQueue:
+    def __init__(self, flush_fn, journal_path: str, max_batch: int = 500,
+                 max_delay: float = 0.5, retry_delay: float = 2.0, max_attempts: int = 5):
+        self.flush_fn = flush_fn
+        self.base_path = journal_path
+        self.journal_path = journal_path          # the slot actually claimed, see _claim
+        self.max_attempts = max_attempts
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+
+        self._cond = threading.Condition()
+        self._pending: list[tuple[int, list[dict]]] = []    # (entry id, rows)
+        self._next_id = 1
+        self._thread: threading.Thread | None = None
+        self._closing = False
+        self._journal = None
+        self._lock_fh = None
+        self._attempts: dict[int, int] = {}                 # entry id → failed flushes
+
+        self.flushed_rows = self.flushed_batches = self.failures = 0
+        self.dead_entries = self.dead_rows = 0
+        self.last_flush_ms = 0.0
+
+    # ── lifecycle ────────────────────────────────────────────────────
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._claim()
+            self._pending = []                 # everything queued is in the journal
+            self._replay()
+            self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Flush everything still queued, then stop the worker."""
+        with self._cond:
+            if self._thread is None:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._lock_fh is not None:
+                self._lock_fh.close()                # releases the slot
+                self._lock_fh = None
+            self._closing = False
+
+    # ── producer side ────────────────────────────────────────────────
+    def put(self, rows: list[dict]) -> int:
+        """Durably queue `rows`; returns the number of rows queued."""
+        if not rows:
+            return 0
+        self.start()
+        with self._cond:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._append_journal({"id": entry_id, "rows": rows})
+            self._pending.append((entry_id, rows))
+            self._cond.notify()
+        return len(rows)
+
+    # ── journal ──────────────────────────────────────────────────────
+    def _claim(self) -> None:
+        """Lock the first journal slot no other live process holds."""
+        if os.path.dirname(self.base_path):
+            os.makedirs(os.path.dirname(self.base_path), exist_ok=True)
+        for i in range(MAX_SLOTS):
+            path = self.base_path if i == 0 else f"{self.base_path}.{i}"
+            fh = open(path + ".lock", "a")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                continue
+            self._lock_fh, self.journal_path = fh, path
+            return
+        raise RuntimeError(f"all {MAX_SLOTS} journal slots of {self.base_path} are in use")
+
+    def _open_journal(self):
+        if self._journal is None:
+            if os.path.dirname(self.journal_path):
+                os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self._journal
+
+    def _append_journal(self, record: dict) -> None:
+        fh = self._open_journal()
+        fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+        entries, done = {}, set()
+        with open(self.journal_path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue                         # torn last line
+                if "done" in rec:
+                    done.update(rec["done"])
+                else:
+                    entries[rec["id"]] = rec["rows"]
+        for entry_id in sorted(entries):
+            if entry_id not in done:
+                self._pending.append((entry_id, entries[entry_id]))
+        self._next_id = max(entries, default=0) + 1
+        if self._pending:
+            print(f"[write-behind] replaying {len(self._pending)} queued proposal(s)")
+
+    def _compact(self) -> None:
+        # nothing pending → the journal holds no information any more
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        open(self.journal_path, "w").close()
+
+    # ── consumer side ────────────────────────────────────────────────
+    def _take_batch(self) -> list[tuple[int, list[dict]]]:
+        batch, n = [], 0
+        while self._pending and (not batch or n + len(self._pending[0][1]) <= self.max_batch):
+            entry = self._pending.pop(0)
+            batch.append(entry)
+            n += len(entry[1])
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    return
+                # give concurrent sessions a moment to pile on
+                if not self._closing:
+                    deadline = time.monotonic() + self.max_delay
+                    while (sum(len(r) for _, r in self._pending) < self.max_batch
+                           and not self._closing
+                           and (left := deadline - time.monotonic()) > 0):
+                        self._cond.wait(left)
+                batch = self._take_batch()
+
+            rows = [row for _, entry_rows in batch for row in entry_rows]
+            t0 = time.perf_counter()
+            try:
+                self.flush_fn(rows)
+            except Exception as e:
+                self.failures += 1
+                print(f"[write-behind] flush of {len(rows)} rows failed: {e}")
+                # split: flush what is good, count a strike against the rest
+                if len(batch) > 1:
+                    done, retry = self._flush_each(batch)
+                else:
+                    done, retry = [], []
+                    self._strike(batch[0], e, retry)
+                with self._cond:
+                    if done:
+                        self._append_journal({"done": done})
+                    self._pending[:0] = retry          # retry, order preserved
+                    if self._closing and retry:
+                        return                         # journal keeps them for next start
+                if retry:
+                    time.sleep(self.retry_delay)
+                continue
+
+            self.last_flush_ms = (time.perf_counter() - t0) * 1000
+            self.flushed_rows += len(rows)
+            self.flushed_batches += 1
+            with self._cond:
+                for entry_id, _ in batch:
+                    self._attempts.pop(entry_id, None)
+                if self._pending:
+                    self._append_journal({"done": [entry_id for entry_id, _ in batch]})
+                else:
+                    self._compact()
+
+    def _flush_each(self, batch: list) -> tuple[list[int], list]:
+        """Flush a failed batch one entry at a time → (done ids, entries to retry)."""
+        done, retry = [], []
+        for entry in batch:
+            try:
+                self.flush_fn(entry[1])
+            except Exception as e:
+                self._strike(entry, e, retry)
+                continue
+            self._attempts.pop(entry[0], None)
+            self.flushed_rows += len(entry[1])
+            self.flushed_batches += 1
+            done.append(entry[0])
+        return done, retry
+
+    def _strike(self, entry: tuple[int, list[dict]], error: Exception, retry: list) -> None:
+        entry_id, rows = entry
+        self._attempts[entry_id] = self._attempts.get(entry_id, 0) + 1
+        if self._attempts[entry_id] < self.max_attempts:
+            retry.append(entry)
+            return
+        # give up: park it in the dead-letter file and mark it done in the journal
+        with open(self.journal_path + ".dead", "a", encoding="utf-8") as fh:
+            fh.write(json.dumps({"id": entry_id, "rows": rows, "error": str(error)},
+                                default=str) + "\n")
+        self._attempts.pop(entry_id, None)
+        self.dead_entries += 1
+        self.dead_rows += len(rows)
+        print(f"[write-behind] entry {entry_id} ({len(rows)} rows) failed "
+              f"{self.max_attempts}× – moved to {self.journal_path}.dead")
+        with self._cond:
+            self._append_journal({"done": [entry_id]})
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = sum(len(r) for _, r in self._pending)
+            entries = len(self._pending)
+        return {
+            "queue_rows": depth,
+            "queue_entries": entries,
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "failures": self.failures,
+            "dead_letter_entries": self.dead_entries,
+            "dead_letter_rows": self.dead_rows,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
@@ -1,47 +1,20 @@
 # utils.py
-import os, re
+import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from dateparser.search import search_dates
-from datetime import date, datetime
+import day_parser
 
 load_dotenv()
 
-def init_llm():
-    """Return a ChatOpenAI client using your personal key."""
-    return ChatOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model_name=os.getenv("OPENAI_MODEL_NAME", "gpt-4o"),
-        temperature=0.2,
-        streaming=True,   # nice UX; safe in LangGraph
-    )
-
-def correct_json(json_str: str) -> str:
-    """
-    Strip ```json fences, balance {} and [] so json.loads won't crash.
-    (Same logic as the lengthy version—condensed.)
-    """
-    # 1) fence-strip
-    cleaned = json_str.strip()
-    if cleaned.startswith("```"):
-        cleaned = cleaned.strip("`")
-    # 2) drop a leading 'json' if present
-    cleaned = re.sub(r'^json\s*', '', cleaned.strip(), flags=re.I)
-
-    # 3) balance braces/brackets
-    for open_c, close_c in (('{', '}'), ('[', ']')):
-        diff = cleaned.count(open_c) - cleaned.count(close_c)
-        if diff > 0:
-            cleaned += close_c * diff
-        # if too many closing, trim from end
-        while cleaned.count(close_c) > cleaned.count(open_c):
-            cleaned = cleaned[:-1]
-    return cleaned
+# LLM clients live in llm.py (shared pool, coalescing, response cache);
+# re-exported here because every agent imports them from utils
+from llm import init_llm, set_llm_factory, shared_llm  # noqa: E402,F401
 
 def extract_day(text: str) -> str:
     """Return first date found in text, else today in ISO‐8601."""
-    hits = search_dates(text, settings={"PREFER_DATES_FROM": "past"})
-    if hits:
-        return hits[0][1].date().isoformat()   # hits is [(matched_text, datetime)]
-    return date.today().isoformat()
+    day = day_parser.parse_day(text)          # regex fast path, dateparser fallback
+    return (day or day_parser.reference_day()).isoformat()
 
+def extract_range(text: str) -> tuple[str, str] | None:
+    """(start, end) ISO dates of the first date or range in text, else None."""
+    found = day_parser.parse_range(text)
+    return (found.start.isoformat(), found.end.isoformat()) if found else None